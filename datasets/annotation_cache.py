@@ -0,0 +1,79 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Persistent cache of parsed 2.5VRD annotations. The output of
+parse_one_gt_line() for every line of an .odgt file is saved as an
+AnnotationStore (one .npy file per column) and reloaded, optionally
+memory-mapped, instead of parsing the .odgt file again while its content and
+the parsing inputs are unchanged.
+"""
+import hashlib
+import os
+import shutil
+import warnings
+
+from datasets.annotation_store import AnnotationStore
+
+# Increase when parse_one_gt_line() or the layout of AnnotationStore changes,
+# so that stale cache files are not reused
+ANNOTATION_CACHE_VERSION = 2
+# Errors of loading a corrupted or partially written cache
+CACHE_READ_ERRORS = (OSError, ValueError, EOFError)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def annotation_cache_path(cache_dir, ann_file, parse_key=''):
+    """
+    :param parse_key: string describing everything else the parsed result
+        depends on (e.g. the class vocabulary and the box scale).
+    """
+    key = '{}-{}-{}'.format(file_digest(ann_file), parse_key, ANNOTATION_CACHE_VERSION)
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(ann_file))[0]
+    return os.path.join(cache_dir, '{}-{}'.format(name, digest))
+
+
+def load_annotations(ann_file, parse_line, cache_dir=None, parse_key='', mmap_mode=None):
+    """
+    Parse ann_file with parse_line(), or reload the cached result.
+
+    :param parse_line: function mapping one line of ann_file to
+        dict(image_id=..., annotations=...).
+    :param cache_dir: folder of the cache files. Nothing is cached if None.
+    :param mmap_mode: see AnnotationStore.load(). Only used if cache_dir is
+        not None.
+    :return: AnnotationStore
+    """
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = annotation_cache_path(cache_dir, ann_file, parse_key)
+        if os.path.isdir(cache_path):
+            try:
+                return AnnotationStore.load(cache_path, mmap_mode=mmap_mode)
+            except CACHE_READ_ERRORS as e:
+                warnings.warn('Ignoring the annotation cache {} ({!r}), parsing {}'.format(cache_path, e, ann_file))
+                shutil.rmtree(cache_path, ignore_errors=True)
+
+    with open(ann_file, 'r') as f:
+        store = AnnotationStore.from_annotations([parse_line(l.strip()) for l in f.readlines()])
+    if cache_path is None:
+        return store
+    try:
+        store.save(cache_path)
+    except OSError as e:
+        warnings.warn('Could not save the annotations of {} to {} ({!r})'.format(ann_file, cache_path, e))
+        return store
+    if mmap_mode is None:
+        return store
+    return AnnotationStore.load(cache_path, mmap_mode=mmap_mode)
@@ -0,0 +1,170 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Lazy access to the lines of .odgt annotation files. IndexedOdgtReader
+records the byte offset of every line in one pass and parses a line only
+when its item is read, keeping the last parsed items in an LRU cache, so
+that memory and startup no longer grow with the parsed size of the file.
+AnnotationSubset selects items of any annotation list by index.
+"""
+import collections
+import json
+import os
+
+import numpy as np
+import torch
+
+
+def line_offsets(path, parse_line=None, keep=None):
+    """
+    :param parse_line, keep: if keep is not None, only lines for which
+        keep(parse_line(line)) is true are indexed (every line is parsed
+        once, but nothing is kept in memory).
+    :return: int64 array of the byte offsets of the non-empty lines of path.
+    """
+    offsets = []
+    position = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip() and (keep is None or keep(parse_line(line.decode('utf-8').strip()))):
+                offsets.append(position)
+            position += len(line)
+    return np.array(offsets, dtype=np.int64)
+
+
+def load_index_list(path):
+    """
+    :param path: .npy file of indices, or text file with one index per line
+        (blank lines and lines starting with '#' are ignored).
+    :return: int64 array of the indices.
+    """
+    if path.endswith('.npy'):
+        return np.load(path).astype(np.int64).reshape(-1)
+    with open(path, 'r') as f:
+        return np.array([int(l) for l in f if l.strip() and not l.lstrip().startswith('#')], dtype=np.int64)
+
+
+class IndexedOdgtReader(object):
+    """
+    Read-only list of the items parse_line() gives for the lines of an .odgt
+    file, parsed on first access.
+    """
+
+    def __init__(self, path, parse_line, cache_size=1024, keep=None):
+        """
+        :param parse_line: function mapping one line of path to
+            dict(image_id=..., annotations=...). Must be picklable (a module
+            level function) for DataLoader workers started with 'spawn'.
+        :param cache_size: number of parsed items kept (least recently used
+            items are dropped first). Items are returned as new dicts of
+            copies of the cached tensors on every access, so callers may
+            modify them, in place too.
+        :param keep: only index the lines whose item keep(item) accepts,
+            see line_offsets().
+        """
+        self.path = path
+        self.parse_line = parse_line
+        self.cache_size = cache_size
+        self.offsets = line_offsets(path, parse_line, keep)
+        self._sizes = None
+        self._image_ids = None
+        self._reset()
+
+    def _reset(self):
+        self._file = None
+        self._pid = None
+        self._cache = collections.OrderedDict()
+
+    def _read_line(self, index):
+        # Forked workers must not share the position of the parent's file
+        if self._file is None or self._pid != os.getpid():
+            self._file = open(self.path, 'rb')
+            self._pid = os.getpid()
+        self._file.seek(self.offsets[index])
+        return self._file.readline().decode('utf-8').strip()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        item = self._cache.get(index)
+        if item is None:
+            item = self.parse_line(self._read_line(index))
+            self._cache[index] = item
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(index)
+        annotations = {name: value.clone() if isinstance(value, torch.Tensor) else value
+                       for name, value in item['annotations'].items()}
+        return dict(image_id=item['image_id'], annotations=annotations)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def image_sizes(self):
+        """
+        :return: (N, 2) array of the (height, width) of the images, read from
+            the lines without parsing their annotations.
+        """
+        if self._sizes is None:
+            sizes = []
+            for index in range(len(self)):
+                item = json.loads(self._read_line(index))
+                sizes.append((int(item['height']), int(item['width'])))
+            self._sizes = np.array(sizes, dtype=np.int64).reshape(-1, 2)
+        return self._sizes
+
+    def image_ids(self):
+        """
+        :return: (N,) string array of the image ids (file names), read from
+            the lines without parsing their annotations.
+        """
+        if self._image_ids is None:
+            self._image_ids = np.array([json.loads(self._read_line(index))['file_name']
+                                        for index in range(len(self))], dtype=str)
+        return self._image_ids
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.update(_file=None, _pid=None, _cache=collections.OrderedDict())
+        return state
+
+
+class AnnotationSubset(object):
+    """
+    Items indices[0], indices[1], ... of an annotation list (AnnotationStore,
+    IndexedOdgtReader or list), e.g. to train on a small part of a split.
+    """
+
+    def __init__(self, annotations, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        assert len(indices) == 0 or (0 <= indices.min() and indices.max() < len(annotations)), \
+            'subset indices out of range of {} items'.format(len(annotations))
+        self.annotations = annotations
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        return self.annotations[int(self.indices[index])]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def image_sizes(self):
+        return np.asarray(self.annotations.image_sizes())[self.indices]
+
+    def image_ids(self):
+        return np.asarray(self.annotations.image_ids())[self.indices]
@@ -0,0 +1,174 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Columnar storage of parsed 2.5VRD annotations: a few flat numpy arrays with
+one row per relation plus per-image offsets, instead of a list of dicts of
+small tensors.
+
+A list of Python objects is copied page by page into every forked DataLoader
+worker as soon as the worker touches the reference counts of its items. The
+arrays here are only a handful of objects, so the workers keep sharing their
+pages (or the page cache of the memory-mapped files) with the main process.
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import torch
+
+# Per-relation columns: name -> (dtype, shape of one row)
+RELATION_FIELDS = {
+    'human_boxes': (np.float32, (4,)),
+    'object_boxes': (np.float32, (4,)),
+    'action_boxes': (np.float32, (4,)),
+    'human_labels': (np.int64, ()),
+    'object_labels': (np.int64, ()),
+    'action_labels': (np.int64, ()),
+    'occlusion_labels': (np.int64, ()),
+    'raw_distance_labels': (np.float16, (5,)),
+    'raw_occlusion_labels': (np.float16, (5,)),
+}
+# Per-image columns
+IMAGE_FIELDS = ['offsets', 'image_id', 'org_size', 'num_bounding_boxes_in_ground_truth']
+
+
+def annotations_to_arrays(annotations):
+    """
+    :param annotations: list of dict(image_id=..., annotations=...) as
+        returned by parse_one_gt_line().
+    :return: dict of numpy arrays. Row i of a relation column belongs to
+        image j if offsets[j] <= i < offsets[j + 1].
+    """
+    counts = [len(ann['annotations']['action_labels']) for ann in annotations]
+    arrays = dict(
+        offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        image_id=np.array([ann['image_id'] for ann in annotations], dtype=str),
+        org_size=np.array([ann['annotations']['org_size'].tolist() for ann in annotations],
+                          dtype=np.int64).reshape(-1, 2),
+        num_bounding_boxes_in_ground_truth=np.array(
+            [ann['annotations']['num_bounding_boxes_in_ground_truth'] for ann in annotations], dtype=np.int64),
+    )
+    for name, (dtype, shape) in RELATION_FIELDS.items():
+        # Images without relations hold tensors of shape (0,)
+        columns = [ann['annotations'][name].numpy().astype(dtype).reshape((-1,) + shape)
+                   for ann in annotations]
+        arrays[name] = np.concatenate(columns) if columns else np.zeros((0,) + shape, dtype=dtype)
+    return arrays
+
+
+class AnnotationStore(object):
+    """
+    Read-only list of parsed annotations. Item i is the
+    dict(image_id=..., annotations=...) of parse_one_gt_line(), whose tensors
+    are views of rows offsets[i]:offsets[i + 1] of the columns.
+    """
+
+    def __init__(self, arrays, path=None, mmap_mode=None):
+        """
+        :param arrays: dict of numpy arrays, see annotations_to_arrays().
+        :param path: folder the arrays were memory-mapped from by load(),
+            if any. Such a store is pickled (e.g. for DataLoader workers
+            started with 'spawn') as its path only.
+        :param mmap_mode: mode of np.load() the arrays were memory-mapped with.
+        """
+        missing = [name for name in IMAGE_FIELDS + list(RELATION_FIELDS) if name not in arrays]
+        assert len(missing) == 0, missing
+        self.arrays = arrays
+        self.path = path
+        self.mmap_mode = mmap_mode
+
+    @classmethod
+    def from_annotations(cls, annotations):
+        return cls(annotations_to_arrays(annotations))
+
+    def __len__(self):
+        return len(self.arrays['image_id'])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        arrays = self.arrays
+        start, end = arrays['offsets'][index], arrays['offsets'][index + 1]
+        image_id = str(arrays['image_id'][index])
+        target = {name: torch.from_numpy(arrays[name][start:end]) for name in RELATION_FIELDS}
+        target['image_id'] = image_id
+        target['org_size'] = torch.from_numpy(arrays['org_size'][index])
+        target['num_bounding_boxes_in_ground_truth'] = int(arrays['num_bounding_boxes_in_ground_truth'][index])
+        return dict(image_id=image_id, annotations=target)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def save(self, path):
+        """
+        Write every column to path/<column>.npy, so that the columns can be
+        memory-mapped by load().
+        """
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        # Write to a temporary folder of a unique name first and move it into
+        # place at once, since several processes (e.g. the ranks of torchrun,
+        # on one or several hosts) may save the same store at the same time
+        temp_path = tempfile.mkdtemp(dir=parent, prefix=os.path.basename(path) + '.', suffix='.tmp')
+        try:
+            for name, array in self.arrays.items():
+                np.save(os.path.join(temp_path, name + '.npy'), np.ascontiguousarray(array), allow_pickle=False)
+            try:
+                os.replace(temp_path, path)
+            except OSError:
+                # Another process saved it first (a folder is only replaced
+                # if it is empty)
+                if not os.path.isdir(path):
+                    raise
+        finally:
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """
+        :param mmap_mode: None to read the columns into memory, or a mode of
+            np.load(), e.g. 'c' to memory-map them copy-on-write ('r' would
+            give non-writable tensors, which torch warns about).
+        """
+        arrays = dict()
+        for name in IMAGE_FIELDS + list(RELATION_FIELDS):
+            array = np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+            # Plain ndarray views of np.memmap are much faster to slice
+            arrays[name] = array.view(np.ndarray)
+        return cls(arrays, path=path if mmap_mode is not None else None, mmap_mode=mmap_mode)
+
+    def image_sizes(self):
+        """
+        :return: (N, 2) array of the (height, width) of the images.
+        """
+        return np.asarray(self.arrays['org_size'])
+
+    def image_ids(self):
+        """
+        :return: (N,) string array of the image ids (file names).
+        """
+        return np.asarray(self.arrays['image_id']).astype(str)
+
+    def num_relations(self):
+        return int(self.arrays['offsets'][-1])
+
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def __getstate__(self):
+        if self.path is None:
+            return self.__dict__
+        return dict(arrays=None, path=self.path, mmap_mode=self.mmap_mode)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.arrays is None:
+            self.arrays = self.load(self.path, self.mmap_mode).arrays
@@ -16,6 +16,7 @@ import PIL
 import torchvision.transforms as T
 import torchvision.transforms.functional as F
 from util.box_ops import box_xyxy_to_cxcywh
+from datasets.annotation_reader import IndexedOdgtReader
 from PIL import Image
 
 
@@ -555,11 +556,12 @@ class HoiDetection(VisionDataset):
         assert image_set in ['train', 'test'], image_set
         self.image_set = image_set
         super(HoiDetection, self).__init__(root, transforms, transform, target_transform)
-        annotations = [parse_one_gt_line(l.strip()) for l in open(annFile, 'r').readlines()]
+        # Lines are indexed once and parsed when read. For training, only
+        # images with interactions are indexed
+        keep = None
         if self.image_set in ['train']:
-            self.annotations = [a for a in annotations if len(a['annotations']['action_labels']) > 0]
-        else:
-            self.annotations = annotations
+            keep = lambda a: len(a['annotations']['action_labels']) > 0
+        self.annotations = IndexedOdgtReader(annFile, parse_one_gt_line, keep=keep)
         self.transforms = transforms
 
     def __getitem__(self, index):
@@ -0,0 +1,246 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Images (and optionally depth maps) of a split stored at capped resolution in
+a few large shard files, plus an index of byte offsets:
+    <split>-00000.shard, <split>-00001.shard, ...
+    <split>-index.npz
+
+Records are written back to back in the order of the annotation file, so a
+pass in dataset order reads every shard sequentially. Shards are built once
+with tools/build_image_shards.py and read by two_point_five_VRD if
+IMAGE_SHARD_DIR is set.
+"""
+import mmap
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Increase when the layout below changes
+IMAGE_SHARD_VERSION = 1
+
+
+def capped_size(width, height, min_size=800, max_size=1333):
+    """
+    Size of an image whose shorter side is at most min_size and whose longer
+    side is at most max_size, i.e. the largest size make_hico_transforms()
+    resizes to. Images are never enlarged.
+    """
+    scale = min(1.0, min_size / min(width, height), max_size / max(width, height))
+    if scale == 1.0:
+        return width, height
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+
+# cv2.imread() / cv2.imdecode() flags decoding an image at 1/factor of its
+# resolution (JPEG images are decoded at that resolution directly, by
+# libjpeg's DCT scaling)
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def reduced_decode_factor(width, height, min_size=800, max_size=1333):
+    """
+    :return: the largest factor of REDUCED_DECODE_FLAGS for which the image
+        decoded at 1/factor of its resolution is still at least
+        capped_size(width, height, min_size, max_size), i.e. at least as
+        large as the transforms resize it to. 1 if the image is not at least
+        twice as large.
+    """
+    target_width, target_height = capped_size(width, height, min_size, max_size)
+    for factor in (8, 4, 2):
+        if width // factor >= target_width and height // factor >= target_height:
+            return factor
+    return 1
+
+
+def shard_path(shard_dir, split, shard):
+    return os.path.join(shard_dir, '{}-{:05d}.shard'.format(split, shard))
+
+
+def index_path(shard_dir, split):
+    return os.path.join(shard_dir, '{}-index.npz'.format(split))
+
+
+class ImageShardWriter(object):
+    def __init__(self, shard_dir, split, shard_size=1 << 30):
+        """
+        :param shard_size: a new shard is started once a shard exceeds
+            shard_size bytes.
+        """
+        os.makedirs(shard_dir, exist_ok=True)
+        self.shard_dir = shard_dir
+        self.split = split
+        self.shard_size = shard_size
+        self.shard = -1
+        self.file = None
+        self.index = dict(image_id=[], shard=[], offset=[], length=[], depth_offset=[], depth_length=[],
+                          width=[], height=[])
+
+    def _write(self, data):
+        if self.file is None or self.file.tell() >= self.shard_size:
+            if self.file is not None:
+                self.file.close()
+            self.shard += 1
+            self.file = open(shard_path(self.shard_dir, self.split, self.shard), 'wb')
+        offset = self.file.tell()
+        self.file.write(data)
+        return offset
+
+    def add(self, image_id, image_bytes, width, height, depth_bytes=None):
+        """
+        :param image_bytes: encoded image (e.g. JPEG) of size width x height.
+        :param depth_bytes: encoded single-channel depth map of the same size.
+        """
+        offset = self._write(image_bytes)
+        depth_offset = self.file.tell() if depth_bytes is not None else -1
+        if depth_bytes is not None:
+            self.file.write(depth_bytes)
+        self.index['image_id'].append(image_id)
+        self.index['shard'].append(self.shard)
+        self.index['offset'].append(offset)
+        self.index['length'].append(len(image_bytes))
+        self.index['depth_offset'].append(depth_offset)
+        self.index['depth_length'].append(len(depth_bytes) if depth_bytes is not None else 0)
+        self.index['width'].append(width)
+        self.index['height'].append(height)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        np.savez(index_path(self.shard_dir, self.split),
+                 version=np.array(IMAGE_SHARD_VERSION),
+                 num_shards=np.array(self.shard + 1),
+                 image_id=np.array(self.index['image_id'], dtype=str),
+                 shard=np.array(self.index['shard'], dtype=np.int32),
+                 offset=np.array(self.index['offset'], dtype=np.int64),
+                 length=np.array(self.index['length'], dtype=np.int64),
+                 depth_offset=np.array(self.index['depth_offset'], dtype=np.int64),
+                 depth_length=np.array(self.index['depth_length'], dtype=np.int64),
+                 width=np.array(self.index['width'], dtype=np.int32),
+                 height=np.array(self.index['height'], dtype=np.int32))
+
+
+def encode_capped_image(image_path, min_size=800, max_size=1333, quality=95):
+    """
+    :return: (encoded bytes, width, height). The file is stored as is if it
+        does not need to be downsized, otherwise it is downsized and encoded
+        as JPEG.
+    """
+    with open(image_path, 'rb') as f:
+        data = f.read()
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    height, width = img.shape[:2]
+    new_width, new_height = capped_size(width, height, min_size, max_size)
+    if (new_width, new_height) == (width, height):
+        return data, width, height
+    img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes(), new_width, new_height
+
+
+def encode_depth(depth_path, width, height):
+    """
+    :return: the depth map resized to width x height as a single-channel PNG
+        (the engine only uses one channel of the depth maps).
+    """
+    depth = cv2.imread(depth_path, cv2.IMREAD_COLOR)
+    if depth is None:
+        raise FileNotFoundError(depth_path)
+    # channel 0 of the RGB depth map read by __getitem__
+    depth = depth[:, :, 2]
+    if depth.shape[:2] != (height, width):
+        depth = cv2.resize(depth, (width, height), interpolation=cv2.INTER_AREA)
+    return cv2.imencode('.png', depth)[1].tobytes()
+
+
+class ImageShardReader(object):
+    """
+    Reads images and depth maps of one split from its shards, either through
+    memory maps of the shards (use_mmap=True) or with os.pread(). Files are
+    opened lazily in every process, so a reader can be shared with forked or
+    spawned DataLoader workers.
+    """
+
+    def __init__(self, shard_dir, split, use_mmap=True):
+        self.shard_dir = shard_dir
+        self.split = split
+        self.use_mmap = use_mmap
+        with np.load(index_path(shard_dir, split), allow_pickle=False) as index:
+            assert int(index['version']) == IMAGE_SHARD_VERSION, \
+                'image shards of {} are outdated, run tools/build_image_shards.py again'.format(split)
+            self.index = {name: index[name] for name in index.files}
+        self.position = {image_id: i for i, image_id in enumerate(self.index['image_id'].tolist())}
+        self._pid = None
+        self._files = None
+        self._maps = None
+
+    def __len__(self):
+        return len(self.position)
+
+    def __contains__(self, image_id):
+        return image_id in self.position
+
+    def has_depth(self, image_id):
+        return self.index['depth_length'][self.position[image_id]] > 0
+
+    def size(self, image_id):
+        """
+        :return: (width, height) of the stored image.
+        """
+        i = self.position[image_id]
+        return int(self.index['width'][i]), int(self.index['height'][i])
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._files = [open(shard_path(self.shard_dir, self.split, shard), 'rb')
+                       for shard in range(int(self.index['num_shards']))]
+        if self.use_mmap:
+            self._maps = [mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) for f in self._files]
+
+    def _read(self, shard, offset, length):
+        self._open()
+        if self.use_mmap:
+            return np.frombuffer(self._maps[shard], dtype=np.uint8, count=length, offset=offset)
+        return np.frombuffer(os.pread(self._files[shard].fileno(), length, offset), dtype=np.uint8)
+
+    def read_image(self, image_id, factor=1):
+        """
+        :param factor: decode the image at 1/factor of its stored resolution,
+            see reduced_decode_factor().
+        :return: PIL RGB image.
+        """
+        i = self.position[image_id]
+        data = self._read(self.index['shard'][i], int(self.index['offset'][i]), int(self.index['length'][i]))
+        img = cv2.imdecode(data, REDUCED_DECODE_FLAGS[factor])
+        return Image.fromarray(img[:, :, ::-1]).convert('RGB')
+
+    def read_depth(self, image_id):
+        """
+        :return: single-channel PIL image of the depth map, or None if the
+            shards hold no depth map of the image.
+        """
+        i = self.position[image_id]
+        if self.index['depth_length'][i] == 0:
+            return None
+        data = self._read(self.index['shard'][i], int(self.index['depth_offset'][i]),
+                          int(self.index['depth_length'][i]))
+        depth = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+        return Image.fromarray(depth)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_pid=None, _files=None, _maps=None)
+        return state
@@ -0,0 +1,130 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Compiled lookup tables between class indices, class names and entity ids
+(e.g. '/m/01g317') of class-descriptions-boxable.csv.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+import torch
+
+
+class LabelVocabulary(object):
+    """
+    Array-backed forward maps (index -> name, index -> entity) and hash-backed
+    reverse maps (name -> index, entity -> index), built once.
+
+    Index 0 is the empty class ('', '') inserted at the top of
+    class_descriptions_boxable, so indices match the class ids used by the
+    model. Names or entities that occur more than once in the table cannot be
+    looked up, which is the same behaviour as the DataFrame filters this
+    replaces.
+    """
+
+    def __init__(self, entities, names):
+        assert len(entities) == len(names)
+        self.entities = np.array(list(entities), dtype=object)
+        self.names = np.array(list(names), dtype=object)
+        self.entity_to_index_map = self._build_reverse_map(self.entities)
+        self.name_to_index_map = self._build_reverse_map(self.names)
+
+    @staticmethod
+    def _build_reverse_map(keys):
+        reverse_map = dict()
+        for index, key in enumerate(keys):
+            # -1 marks a key that is missing or not unique
+            reverse_map[key] = -1 if key in reverse_map else index
+        return reverse_map
+
+    @classmethod
+    def from_dataframe(cls, class_descriptions):
+        """
+        :param class_descriptions: DataFrame whose column 0 holds entity ids
+            and column 1 holds names, with the empty class already inserted.
+        """
+        return cls(class_descriptions[0].values, class_descriptions[1].values)
+
+    @classmethod
+    def from_csv(cls, path):
+        class_descriptions = pd.read_csv(path, header=None)
+        return cls([''] + list(class_descriptions[0].values),
+                   [''] + list(class_descriptions[1].values))
+
+    def __len__(self):
+        return len(self.names)
+
+    def digest(self):
+        """
+        Hash of the entities and names, e.g. to key caches of data whose
+        class indices depend on the vocabulary.
+        """
+        sha1 = hashlib.sha1()
+        for entity, name in zip(self.entities, self.names):
+            sha1.update('{}\t{}\n'.format(entity, name).encode('utf-8'))
+        return sha1.hexdigest()
+
+    # Scalar lookups
+    def entity_to_index(self, entity):
+        return self.entity_to_index_map.get(entity, -1)
+
+    def name_to_index(self, name):
+        return self.name_to_index_map.get(name, -1)
+
+    def index_to_name(self, index):
+        return self.names[int(index)]
+
+    def index_to_entity(self, index):
+        return self.entities[int(index)]
+
+    def entity_to_name(self, entity):
+        index = self.entity_to_index(entity)
+        if index == -1:
+            raise ValueError(f'{entity} is not a unique entity of the vocabulary')
+        return self.names[index]
+
+    def name_to_entity(self, name):
+        index = self.name_to_index(name)
+        if index == -1:
+            raise ValueError(f'{name} is not a unique name of the vocabulary')
+        return self.entities[index]
+
+    # Batch lookups
+    @staticmethod
+    def _as_index_array(indices):
+        if isinstance(indices, torch.Tensor):
+            indices = indices.detach().cpu().numpy()
+        return np.asarray(indices, dtype=np.int64)
+
+    def index_to_names(self, indices):
+        """
+        :param indices: tensor, array or list of class indices of any shape.
+        :return: object array of names with the same shape as indices.
+        """
+        return self.names[self._as_index_array(indices)]
+
+    def index_to_entities(self, indices):
+        return self.entities[self._as_index_array(indices)]
+
+    def names_to_indices(self, names):
+        """
+        :return: int64 array of class indices, -1 for unknown names.
+        """
+        return np.fromiter((self.name_to_index_map.get(name, -1) for name in names),
+                           dtype=np.int64, count=len(names))
+
+    def entities_to_indices(self, entities):
+        return np.fromiter((self.entity_to_index_map.get(entity, -1) for entity in entities),
+                           dtype=np.int64, count=len(entities))
+
+    def names_to_entities(self, names):
+        indices = self.names_to_indices(names)
+        if (indices == -1).any():
+            unknown = [name for name, index in zip(names, indices) if index == -1]
+            raise ValueError(f'{unknown} are not unique names of the vocabulary')
+        return self.entities[indices]
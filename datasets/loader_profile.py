@@ -0,0 +1,52 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+DataLoader profiles: the number of workers, prefetch factor and memory
+pinning that give the most batches per second on a machine, per split, as
+measured by tools/tune_data_loader.py. A profile is a JSON file like
+    {"sharing_strategy": "file_descriptor",
+     "train": {"num_workers": 4, "prefetch_factor": 2, "pin_memory": true},
+     "valid": {...}, "test": {...},
+     "machine": {...}, "results": [...]}
+"machine" and "results" describe the measurement and are not used here.
+"""
+import json
+
+# Options of DataLoader() a profile sets
+PROFILE_OPTIONS = ['num_workers', 'prefetch_factor', 'pin_memory']
+
+
+def load_data_loader_profile(path):
+    """
+    :return: the profile in path, or an empty profile if path is None.
+    """
+    if path is None:
+        return dict()
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def data_loader_options(profile, split, num_workers):
+    """
+    :param split: 'train', 'valid' or 'test'. A profile without 'test' uses
+        the options of 'valid' for it.
+    :param num_workers: number of workers if the profile sets none for
+        split.
+    :return: keyword arguments of DataLoader() (num_workers, and
+        prefetch_factor and pin_memory if the profile sets them).
+    """
+    options = profile.get(split)
+    if options is None and split == 'test':
+        options = profile.get('valid')
+    if options is None:
+        return dict(num_workers=num_workers)
+    options = {name: options[name] for name in PROFILE_OPTIONS if name in options}
+    options.setdefault('num_workers', num_workers)
+    if options['num_workers'] == 0:
+        # DataLoader() only accepts a prefetch factor with workers
+        options.pop('prefetch_factor', None)
+    return options
@@ -0,0 +1,312 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Batch samplers that put images of similar shape into the same batch, so that
+collate_fn() pads less. The transforms resize every image of a batch by the
+same rule (shorter side to a scale, longer side capped), so images of the
+same orientation and similar aspect ratio end up with similar resized shapes,
+if they are also resized to the same scale (ScaleBatchSampler).
+
+HardExampleSampler draws a part of the images per epoch, favouring the
+images with high training loss.
+"""
+import math
+
+import numpy as np
+import torch
+import torch.distributed as dist
+
+
+def aspect_ratio_groups(image_sizes, num_bins=3):
+    """
+    Group images by orientation and aspect ratio.
+    :param image_sizes: (N, 2) array of (height, width) of the images.
+    :param num_bins: number of aspect ratio bins per orientation. Bins are
+        spaced logarithmically between 1:2 and 2:1 and split at 1:1, plus
+        one bin for anything more elongated on either side.
+    :return: (N,) array of group ids, ordered by aspect ratio.
+    """
+    image_sizes = np.asarray(image_sizes, dtype=np.float64)
+    aspect_ratios = image_sizes[:, 1] / image_sizes[:, 0]
+    bins = 2 ** np.linspace(-1, 1, 2 * num_bins + 1)
+    return np.digitize(aspect_ratios, bins)
+
+
+class AspectRatioBatchSampler(torch.utils.data.Sampler):
+    """
+    Yields batches of indices of images from the same aspect_ratio_groups().
+    Each group is chunked into full batches, the remainders of all groups
+    are chunked together (neighbouring groups first), then the batches are
+    shuffled.
+
+    Like DistributedSampler, the batches of an epoch are a function of seed
+    and epoch only (call set_epoch() before each epoch), every process
+    builds the same list and takes every num_replicas-th batch starting at
+    rank, and the list is padded with repeated batches (or truncated with
+    drop_last) so that all processes get the same number of batches.
+    """
+
+    def __init__(self, image_sizes, batch_size, shuffle=True, drop_last=False, num_replicas=None, rank=None,
+                 seed=0, num_bins=3):
+        """
+        :param image_sizes: (N, 2) array of (height, width) of the images of
+            the dataset, e.g. two_point_five_VRD.image_sizes().
+        :param drop_last: drop the last batch of mixed groups if it is
+            incomplete, and the batches that do not divide evenly among the
+            processes.
+        :param num_replicas: number of processes, the world size by default.
+        :param rank: rank of this process, the global rank by default.
+        """
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+        assert 0 <= rank < num_replicas, (rank, num_replicas)
+        self.groups = aspect_ratio_groups(image_sizes, num_bins)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def batches(self):
+        """
+        :return: the batches of all processes in this epoch.
+        """
+        if self.shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + self.epoch)
+            order = torch.randperm(len(self.groups), generator=generator).numpy()
+        else:
+            order = np.arange(len(self.groups))
+        # Stable sort by group keeps the (shuffled) order within each group
+        order = order[np.argsort(self.groups[order], kind='stable')]
+        group_ends = np.cumsum(np.bincount(self.groups[order]))
+
+        batches, remainders, start = [], [], 0
+        for end in group_ends:
+            num_full = (end - start) // self.batch_size * self.batch_size
+            batches += np.split(order[start:start + num_full], num_full // self.batch_size) if num_full > 0 else []
+            remainders.append(order[start + num_full:end])
+            start = end
+        remainders = np.concatenate(remainders)
+        for start in range(0, len(remainders), self.batch_size):
+            batch = remainders[start:start + self.batch_size]
+            if len(batch) == self.batch_size or not self.drop_last:
+                batches.append(batch)
+
+        if self.shuffle:
+            batches = [batches[i] for i in torch.randperm(len(batches), generator=generator).tolist()]
+        if self.num_replicas > 1:
+            if self.drop_last:
+                batches = batches[:len(batches) - len(batches) % self.num_replicas]
+            elif len(batches) > 0:
+                padding = -len(batches) % self.num_replicas
+                batches += (batches * math.ceil(padding / len(batches)))[:padding]
+        return [batch.tolist() for batch in batches]
+
+    def __iter__(self):
+        return iter(self.batches()[self.rank::self.num_replicas])
+
+    def __len__(self):
+        counts = np.bincount(self.groups)
+        num_batches = int(np.sum(counts // self.batch_size))
+        remainder = int(np.sum(counts % self.batch_size))
+        if self.drop_last:
+            num_batches += remainder // self.batch_size
+            return num_batches // self.num_replicas
+        num_batches += math.ceil(remainder / self.batch_size)
+        return math.ceil(num_batches / self.num_replicas)
+
+
+class ScaleBatchSampler(torch.utils.data.Sampler):
+    """
+    Draws one scale per batch of batch_sampler and yields the batch as
+    [(index, scale), ...], for datasets that resize every image of the batch
+    to that scale (see two_point_five_VRD.batch_scale) rather than to a
+    scale of its own.
+
+    The scales of an epoch are a function of seed and epoch only (call
+    set_epoch() before each epoch, it is passed on to batch_sampler and its
+    sampler), so every process draws the same sequence.
+    """
+
+    def __init__(self, batch_sampler, scales, seed=0):
+        """
+        :param batch_sampler: yields lists of indices, e.g. BatchSampler or
+            AspectRatioBatchSampler.
+        :param scales: shorter sides drawn from, uniformly.
+        """
+        self.batch_sampler = batch_sampler
+        self.scales = list(scales)
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+        for sampler in [self.batch_sampler, getattr(self.batch_sampler, 'sampler', None)]:
+            if hasattr(sampler, 'set_epoch'):
+                sampler.set_epoch(epoch)
+                break
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        for batch in self.batch_sampler:
+            scale = self.scales[torch.randint(len(self.scales), (1,), generator=generator).item()]
+            yield [(index, scale) for index in batch]
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+
+class HardExampleSampler(torch.utils.data.Sampler):
+    """
+    Draws budget * N of the N images of the dataset per epoch, without
+    replacement, with probabilities proportional to their training loss
+    mixed with uniform probabilities (uniform_mix), so that easy images are
+    still drawn now and then. Images without a loss yet count with the mean
+    loss, so the first epoch draws uniformly.
+
+    train_one_epoch() records the loss of every image it trains on by image
+    id (record()) and calls update() at the end of the epoch, which sums the
+    losses recorded by all processes with all_reduce and folds them into a
+    moving average per image. Like DistributedSampler, the indices of an
+    epoch are a function of seed, epoch and the averaged losses (the same on
+    every process, call set_epoch() before each epoch), every process takes
+    every num_replicas-th index starting at rank, and the indices are padded
+    so that all processes get the same number.
+    """
+
+    def __init__(self, image_ids, budget=0.5, uniform_mix=0.2, momentum=0.5, num_replicas=None, rank=None,
+                 seed=0):
+        """
+        :param image_ids: (N,) image ids of the images of the dataset, e.g.
+            two_point_five_VRD.image_ids().
+        :param budget: fraction of the images drawn per epoch. With 1, every
+            image is drawn once per epoch, hard images first.
+        :param uniform_mix: weight of the uniform probabilities. With 0,
+            images with a zero loss are only drawn once all the others are.
+        :param momentum: weight of the previous average loss of an image
+            when a new loss is recorded for it.
+        :param num_replicas: number of processes, the world size by default.
+        :param rank: rank of this process, the global rank by default.
+        """
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+        assert 0 <= rank < num_replicas, (rank, num_replicas)
+        assert 0 < budget <= 1, budget
+        assert 0 <= uniform_mix <= 1, uniform_mix
+        self.index = {str(image_id): i for i, image_id in enumerate(image_ids)}
+        num_images = len(image_ids)
+        self.num_samples = max(1, math.ceil(budget * num_images))
+        self.budget = budget
+        self.uniform_mix = uniform_mix
+        self.momentum = momentum
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+        # Average loss per image, and whether it has one
+        self.losses = np.zeros(num_images, dtype=np.float32)
+        self.seen = np.zeros(num_images, dtype=bool)
+        # Sum and number of the losses recorded in this epoch
+        self._sums = np.zeros(num_images, dtype=np.float64)
+        self._counts = np.zeros(num_images, dtype=np.float64)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def record(self, image_ids, losses):
+        """
+        :param image_ids: image ids of a batch.
+        :param losses: (B,) tensor or array of the losses of the images of
+            the batch, e.g. SetCriterion.per_image_losses().
+        """
+        if isinstance(losses, torch.Tensor):
+            losses = losses.detach().cpu().numpy()
+        indices = np.array([self.index[str(image_id)] for image_id in image_ids], dtype=np.int64)
+        np.add.at(self._sums, indices, losses)
+        np.add.at(self._counts, indices, 1)
+
+    def update(self, device=None):
+        """
+        Fold the losses recorded since the last update into the averages.
+        Must be called by all processes.
+        :param device: device of the all_reduce tensor (CUDA for NCCL).
+        """
+        stats = torch.from_numpy(np.stack([self._sums, self._counts]))
+        if self.num_replicas > 1 and dist.is_available() and dist.is_initialized():
+            stats = stats.to(device)
+            dist.all_reduce(stats)
+        sums, counts = stats.cpu().numpy()
+        recorded = counts > 0
+        losses = (sums[recorded] / counts[recorded]).astype(np.float32)
+        previous = self.seen[recorded]
+        self.losses[recorded] = np.where(previous, self.momentum * self.losses[recorded] + (1 - self.momentum) * losses,
+                                         losses)
+        self.seen |= recorded
+        self._sums[:] = 0
+        self._counts[:] = 0
+
+    def probabilities(self):
+        """
+        :return: (N,) probabilities of the images in the next draw.
+        """
+        num_images = len(self.losses)
+        uniform = np.full(num_images, 1 / num_images)
+        if not self.seen.any():
+            return uniform
+        losses = np.where(self.seen, self.losses, self.losses[self.seen].mean()).astype(np.float64)
+        losses = np.maximum(losses, 0)
+        if losses.sum() <= 0:
+            return uniform
+        return (1 - self.uniform_mix) * losses / losses.sum() + self.uniform_mix * uniform
+
+    def indices(self):
+        """
+        :return: the indices of all processes in this epoch.
+        """
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        probabilities = torch.from_numpy(self.probabilities())
+        # multinomial() without replacement cannot draw more images than have
+        # a non-zero probability (with uniform_mix 0), the rest is drawn
+        # uniformly from the images that were not drawn
+        num_drawn = min(self.num_samples, int((probabilities > 0).sum()))
+        indices = torch.multinomial(probabilities, num_drawn, replacement=False, generator=generator)
+        if num_drawn < self.num_samples:
+            rest = torch.ones(len(probabilities), dtype=torch.bool)
+            rest[indices] = False
+            rest = rest.nonzero()[:, 0]
+            rest = rest[torch.randperm(len(rest), generator=generator)[:self.num_samples - num_drawn]]
+            indices = torch.cat([indices, rest])
+        indices = indices.tolist()
+        padding = -len(indices) % self.num_replicas
+        indices += (indices * math.ceil(padding / len(indices)))[:padding]
+        return indices
+
+    def __iter__(self):
+        return iter(self.indices()[self.rank::self.num_replicas])
+
+    def __len__(self):
+        return math.ceil(self.num_samples / self.num_replicas)
+
+    def state_dict(self):
+        return dict(losses=self.losses.copy(), seen=self.seen.copy())
+
+    def load_state_dict(self, state_dict):
+        assert len(state_dict['losses']) == len(self.losses), 'the checkpoint is of another training set'
+        self.losses[:] = state_dict['losses']
+        self.seen[:] = state_dict['seen']
@@ -0,0 +1,186 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Immutable numpy arrays published once into a named shared memory segment
+(a file in /dev/shm, i.e. POSIX shared memory) that every process maps
+instead of holding a copy.
+
+A SharedArrays is pickled as the name of its segment and the layout of the
+arrays in it, so DataLoader workers started with 'spawn' or 'forkserver'
+attach to the segment rather than unpickling the arrays, and forked workers
+read the same pages as the main process. Workers map the segment
+copy-on-write: they never write to it (tensors from torch.from_numpy() need
+writable arrays, which read-only mappings would not give).
+
+Segments are removed by the process that published them when it exits.
+Segments of processes that could not (killed, e.g. by the OOM killer) are
+named after their pid and removed by the next publish() (see
+remove_stale_segments()).
+"""
+import os
+import tempfile
+import uuid
+import weakref
+
+import numpy as np
+
+SHM_DIR = '/dev/shm'
+# Arrays start at multiples of ALIGNMENT bytes in the segment
+ALIGNMENT = 64
+# Segments are named SEGMENT_PREFIX + '<pid of the publishing process>-<id>'
+SEGMENT_PREFIX = 'shared-arrays-'
+
+
+def _unlink(path, pid):
+    # Forked workers inherit the publishing SharedArrays, only the process
+    # that published the segment removes it
+    if os.getpid() == pid and os.path.exists(path):
+        os.remove(path)
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # A process of another user
+        return True
+    return True
+
+
+def remove_stale_segments(directory):
+    """
+    Remove the segments (and partially written segments) in directory whose
+    publishing process no longer exists, i.e. that it could not remove
+    because it was killed.
+    :return: names of the removed segments.
+    """
+    removed = []
+    for name in os.listdir(directory):
+        if not name.startswith(SEGMENT_PREFIX):
+            continue
+        pid = name[len(SEGMENT_PREFIX):].split('-', 1)[0]
+        if not pid.isdigit() or _process_exists(int(pid)):
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+            removed.append(name)
+        except OSError:
+            # Removed by another process meanwhile, or not ours to remove
+            pass
+    return removed
+
+
+class SharedArrays(object):
+    """
+    Read-only dict of numpy arrays stored in one shared memory segment.
+    """
+
+    def __init__(self, path, layout):
+        """
+        Attach to the segment at path, see publish().
+        :param layout: dict name -> (dtype string, shape, offset in bytes).
+        """
+        self.path = path
+        self.layout = layout
+        self._arrays = None
+        self._finalizer = None
+
+    @classmethod
+    def publish(cls, arrays, name=None, directory=None):
+        """
+        Copy arrays into a new segment. The segment is removed when the
+        returned SharedArrays is garbage collected or the process exits, so
+        the publishing process must keep it as long as other processes
+        attach to the segment (processes that have attached keep their
+        mapping after that). Segments left in directory by killed processes
+        are removed first.
+        :param arrays: dict of numpy arrays, not of dtype object (use
+            fixed-width string dtypes for strings).
+        :param name: name of the segment, SEGMENT_PREFIX + '<pid>-<id>' by
+            default. Other names are not removed if the process is killed.
+        :param directory: folder of the segment, SHM_DIR by default (or the
+            temporary folder if there is no SHM_DIR).
+        """
+        if directory is None:
+            directory = SHM_DIR if os.path.isdir(SHM_DIR) else tempfile.gettempdir()
+        remove_stale_segments(directory)
+        if name is None:
+            name = '{}{}-{}'.format(SEGMENT_PREFIX, os.getpid(), uuid.uuid4().hex[:12])
+        arrays = {key: np.ascontiguousarray(array) for key, array in arrays.items()}
+        layout, size = dict(), 0
+        for key, array in arrays.items():
+            assert array.dtype != object, '{} has dtype object'.format(key)
+            offset = (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+            layout[key] = (array.dtype.str, array.shape, offset)
+            size = offset + array.nbytes
+
+        path = os.path.join(directory, name)
+        # Other processes only ever see the complete segment
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            for key, array in arrays.items():
+                f.seek(layout[key][2])
+                f.write(array.tobytes())
+            f.truncate(max(size, 1))
+        os.rename(temp_path, path)
+
+        shared = cls(path, layout)
+        shared._finalizer = weakref.finalize(shared, _unlink, path, os.getpid())
+        return shared
+
+    def _attach(self):
+        if self._arrays is None:
+            buffer = np.memmap(self.path, dtype=np.uint8, mode='c')
+            arrays = dict()
+            for key, (dtype, shape, offset) in self.layout.items():
+                dtype = np.dtype(dtype)
+                num_bytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+                # Plain ndarray views of np.memmap are much faster to slice
+                arrays[key] = buffer[offset:offset + num_bytes].view(np.ndarray).view(dtype).reshape(shape)
+            self._arrays = arrays
+        return self._arrays
+
+    def view(self, prefix):
+        """
+        :return: SharedArrays of the arrays whose names start with prefix,
+            without the prefix, in the same segment.
+        """
+        return SharedArrays(self.path, {key[len(prefix):]: value for key, value in self.layout.items()
+                                        if key.startswith(prefix)})
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def nbytes(self):
+        return sum(array.nbytes for array in self.values())
+
+    def __getitem__(self, key):
+        return self._attach()[key]
+
+    def __contains__(self, key):
+        return key in self.layout
+
+    def __len__(self):
+        return len(self.layout)
+
+    def __iter__(self):
+        return iter(self.layout)
+
+    def keys(self):
+        return self.layout.keys()
+
+    def values(self):
+        return self._attach().values()
+
+    def items(self):
+        return self._attach().items()
+
+    def __getstate__(self):
+        return dict(path=self.path, layout=self.layout, _arrays=None, _finalizer=None)
@@ -0,0 +1,182 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Lazy registry of CSV tables. A table is read on first access, converted to
+compact dtypes, kept in memory, and optionally persisted as a feather/parquet/
+pickle copy that is reloaded instead of the CSV file while the CSV file is
+unchanged.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Increase when the compaction changes, so that stale copies are not reused
+TABLE_CACHE_VERSION = 1
+# Errors of reading a corrupted, partially written or incompatible (e.g.
+# written by another pyarrow or pandas version) copy
+CACHE_READ_ERRORS = (OSError, ValueError, EOFError, pickle.UnpicklingError, ImportError, AttributeError)
+
+
+def compact_table(table, max_category_ratio=0.5):
+    """
+    Convert the columns of a table to compact dtypes:
+    strings with few unique values -> category, float64 -> float32,
+    int64 -> the smallest integer type that holds the values.
+    """
+    table = table.copy()
+    for column in table.columns:
+        values = table[column]
+        if values.dtype == object:
+            if len(values) > 0 and values.nunique() / len(values) <= max_category_ratio:
+                table[column] = values.astype('category')
+        elif values.dtype == np.float64:
+            table[column] = values.astype(np.float32)
+        elif values.dtype == np.int64:
+            table[column] = pd.to_numeric(values, downcast='integer')
+    return table
+
+
+class TableRegistry(object):
+    def __init__(self, root, cache_dir=None, cache_format='feather'):
+        """
+        :param root: folder containing the CSV files.
+        :param cache_dir: folder to persist compact copies in.
+            No copies are written if it is None.
+        :param cache_format: 'feather', 'parquet' (both need pyarrow) or
+            'pickle'. Falls back to 'pickle' if pyarrow is not installed.
+        """
+        assert cache_format in ['feather', 'parquet', 'pickle'], cache_format
+        self.root = root
+        self.cache_dir = cache_dir
+        self.cache_format = cache_format
+        self.readers = dict()
+        self.tables = dict()
+
+    def register(self, name, file_name, postprocess=None, compact=True, **read_csv_kwargs):
+        """
+        :param name: name used to access the table.
+        :param file_name: CSV file under root.
+        :param postprocess: optional function applied to the DataFrame
+            right after pd.read_csv().
+        :param compact: convert columns to compact dtypes or not.
+        :param read_csv_kwargs: passed to pd.read_csv().
+        """
+        self.readers[name] = dict(file_name=file_name, postprocess=postprocess,
+                                  compact=compact, read_csv_kwargs=read_csv_kwargs)
+
+    def __contains__(self, name):
+        return name in self.readers
+
+    def __getitem__(self, name):
+        if name not in self.tables:
+            self.tables[name] = self.load(name)
+        return self.tables[name]
+
+    def names(self):
+        return list(self.readers.keys())
+
+    def loaded_names(self):
+        return list(self.tables.keys())
+
+    def unload(self, name=None):
+        """
+        Drop one (or all, if name is None) tables from memory.
+        """
+        if name is None:
+            self.tables.clear()
+        else:
+            self.tables.pop(name, None)
+
+    def csv_path(self, name):
+        return os.path.join(self.root, self.readers[name]['file_name'])
+
+    def cache_path(self, name):
+        """
+        Path of the persisted copy. It depends on the size and modification
+        time of the CSV file, so a modified CSV file is read again.
+        """
+        if self.cache_dir is None:
+            return None
+        stat = os.stat(self.csv_path(name))
+        key = '{}-{}-{}-{}'.format(os.path.abspath(self.csv_path(name)), stat.st_size,
+                                   stat.st_mtime_ns, TABLE_CACHE_VERSION)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.cache_dir, '{}-{}.{}'.format(name, digest, self._format()))
+
+    def _format(self):
+        if self.cache_format == 'pickle':
+            return 'pickle'
+        try:
+            import pyarrow
+        except ImportError:
+            return 'pickle'
+        return self.cache_format
+
+    def load(self, name):
+        reader = self.readers[name]
+        cache_path = self.cache_path(name)
+        if cache_path is not None and os.path.exists(cache_path):
+            try:
+                return self._read_cache(name, cache_path)
+            except CACHE_READ_ERRORS as e:
+                warnings.warn('Ignoring the cached copy {} of table {} ({!r}), reading {}'.format(
+                    cache_path, name, e, self.csv_path(name)))
+
+        table = pd.read_csv(self.csv_path(name), **reader['read_csv_kwargs'])
+        if reader['postprocess'] is not None:
+            table = reader['postprocess'](table)
+        if reader['compact']:
+            table = compact_table(table)
+
+        if cache_path is not None:
+            try:
+                self._write_cache(table, cache_path)
+            except OSError as e:
+                warnings.warn('Could not save table {} to {} ({!r})'.format(name, cache_path, e))
+        return table
+
+    def _write_cache(self, table, cache_path):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Write to a temporary file first, since several processes
+        # (e.g. torchrun) may build the same copy at the same time
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path),
+                                             prefix=os.path.basename(cache_path) + '.', suffix='.tmp')
+        os.close(handle)
+        try:
+            cache_format = cache_path.rsplit('.', 1)[-1]
+            if cache_format == 'pickle':
+                table.to_pickle(temp_path)
+            else:
+                # feather and parquet need string column names and a default index
+                table = table.reset_index(drop=True)
+                table.columns = [str(c) for c in table.columns]
+                if cache_format == 'feather':
+                    table.to_feather(temp_path)
+                else:
+                    table.to_parquet(temp_path)
+            os.replace(temp_path, cache_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _read_cache(self, name, cache_path):
+        cache_format = cache_path.rsplit('.', 1)[-1]
+        if cache_format == 'pickle':
+            return pd.read_pickle(cache_path)
+        if cache_format == 'feather':
+            table = pd.read_feather(cache_path)
+        else:
+            table = pd.read_parquet(cache_path)
+        # Restore integer column names of tables read with header=None
+        if self.readers[name]['read_csv_kwargs'].get('header', 'infer') is None:
+            table.columns = [int(c) for c in table.columns]
+        return table
@@ -14,74 +14,100 @@ import random
 import PIL
 import torchvision.transforms as T
 import torchvision.transforms.functional as F
-from util.box_ops import box_xyxy_to_cxcywh
+from util.box_ops import box_cxcywh_to_xyxy, box_xyxy_to_cxcywh
+from util.misc import NestedTensor, TargetBatch, PaddingBuckets, new_batch_tensor, pool_depth
+from util.raw_labels import raw_votes_to_frequencies
+from datasets.label_vocabulary import LabelVocabulary
+from datasets.table_registry import TableRegistry
+from datasets.annotation_cache import load_annotations
+from datasets.annotation_store import AnnotationStore
+from datasets.annotation_reader import IndexedOdgtReader, AnnotationSubset, load_index_list
+from datasets.image_shards import ImageShardReader, REDUCED_DECODE_FLAGS, reduced_decode_factor
+from datasets.shared_state import SharedArrays
 from PIL import Image
 from magic_numbers import *
 
 import pandas as pd
-import gc
 
 # This partially addresses the EOF Error
 import torch.multiprocessing
 torch.multiprocessing.set_sharing_strategy(sharing_strategy)
 
+def insert_empty_class(class_descriptions_boxable):
+    # Insert a row at the top
+    class_descriptions_boxable.loc[-1] = ['','']
+    class_descriptions_boxable.index = class_descriptions_boxable.index + 1
+    class_descriptions_boxable.sort_index(inplace=True)
+    return class_descriptions_boxable
+
+
+# Tables of 2.5VRD are loaded on first access instead of at import time,
+# e.g. vrd_tables['within_image_vrd_test']
+vrd_tables = TableRegistry('data/2.5vrd', cache_dir=TABLE_CACHE_DIR, cache_format=TABLE_CACHE_FORMAT)
 # Load class_descriptions_boxable
-class_descriptions_boxable = pd.read_csv('data/2.5vrd/class-descriptions-boxable.csv', header=None)
-# Insert a row at the top
-class_descriptions_boxable.loc[-1] = ['','']
-class_descriptions_boxable.index = class_descriptions_boxable.index + 1
-class_descriptions_boxable.sort_index(inplace=True)
-
-# Load Object Annotations
-within_image_objects_train = pd.read_csv('data/2.5vrd/within_image_objects_train.csv')
-within_image_objects_validation = pd.read_csv('data/2.5vrd/within_image_objects_validation.csv')
-within_image_objects_test = pd.read_csv('data/2.5vrd/within_image_objects_test.csv')
-across_images_objects_train = pd.read_csv('data/2.5vrd/across_images_objects_train.csv')
-across_images_objects_validation = pd.read_csv('data/2.5vrd/across_images_objects_validation.csv')
-across_images_objects_test = pd.read_csv('data/2.5vrd/across_images_objects_test.csv')
-
-# Load VRD Annotations
-within_image_vrd_test = pd.read_csv('data/2.5vrd/within_image_vrd_test.csv')
-within_image_vrd_train = pd.read_csv('data/2.5vrd/within_image_vrd_train.csv')
-within_image_vrd_validation = pd.read_csv('data/2.5vrd/within_image_vrd_validation.csv')
-across_images_vrd_test = pd.read_csv('data/2.5vrd/across_images_vrd_test.csv')
-across_images_vrd_train = pd.read_csv('data/2.5vrd/across_images_vrd_train.csv')
-across_images_vrd_validation = pd.read_csv('data/2.5vrd/across_images_vrd_validation.csv')
+vrd_tables.register('class_descriptions_boxable', 'class-descriptions-boxable.csv',
+                    postprocess=insert_empty_class, compact=False, header=None)
+for _split in ['train', 'validation', 'test']:
+    # Load Object Annotations
+    vrd_tables.register('within_image_objects_' + _split, 'within_image_objects_' + _split + '.csv')
+    vrd_tables.register('across_images_objects_' + _split, 'across_images_objects_' + _split + '.csv')
+    # Load VRD Annotations
+    vrd_tables.register('within_image_vrd_' + _split, 'within_image_vrd_' + _split + '.csv')
+    vrd_tables.register('across_images_vrd_' + _split, 'across_images_vrd_' + _split + '.csv')
+
+
+def __getattr__(name):
+    # Keep module level access to the tables working, e.g.
+    # two_point_five_vrd.class_descriptions_boxable
+    if name in vrd_tables:
+        return vrd_tables[name]
+    raise AttributeError(f"module {__name__} has no attribute {name}")
+
+
+# Compile class_descriptions_boxable into lookup tables once, instead of
+# filtering the whole DataFrame for every box and every prediction
+_label_vocabulary = None
+
+
+def get_label_vocabulary():
+    global _label_vocabulary
+    if _label_vocabulary is None:
+        _label_vocabulary = LabelVocabulary.from_dataframe(vrd_tables['class_descriptions_boxable'])
+    return _label_vocabulary
+
+
+def set_label_vocabulary(vocabulary):
+    """
+    Use vocabulary (e.g. from shared memory) instead of compiling
+    class_descriptions_boxable in this process.
+    """
+    global _label_vocabulary
+    _label_vocabulary = vocabulary
 
 
 def entity_to_name(entity):
-    return class_descriptions_boxable[class_descriptions_boxable[0] == entity][1].item()
+    return get_label_vocabulary().entity_to_name(entity)
 
 
 def name_to_entity(name):
-    return class_descriptions_boxable[class_descriptions_boxable[1] == name][0].item()
+    return get_label_vocabulary().name_to_entity(name)
 
 def entity_to_index(entity):
     """
     find the index of the entity in the the DataFrame class_descriptions_boxable.
     If the entity is not in the DataFrame, return -1
     """
-    index = -1
-    try:
-        index = class_descriptions_boxable[class_descriptions_boxable[0] == entity].index.item()
-    except:
-        pass
-    return index
+    return get_label_vocabulary().entity_to_index(entity)
 
 def name_to_index(name):
     """
     find the index of the name in the the DataFrame class_descriptions_boxable.
     If the name is not in the DataFrame, return -1
     """
-    index = -1
-    try:
-        index = class_descriptions_boxable[class_descriptions_boxable[1] == name].index.item()
-    except:
-        pass
-    return index
+    return get_label_vocabulary().name_to_index(name)
 
 def index_to_name(index):
-    return class_descriptions_boxable.iloc[index][1]
+    return get_label_vocabulary().index_to_name(index)
 
 # TODO: process no majority
 distance_id_to_name = {
@@ -137,10 +163,10 @@ def convert_xywh2x1y1x2y2(box, shape, flip):
 
 def get_det_annotation_from_odgt(item, shape, flip, gt_size_min=1):
     total_boxes, gt_boxes, ignored_boxes = [], [], []
-    for annot in item['gtboxes']:
+    cls_ids = get_label_vocabulary().names_to_indices([annot['tag'] for annot in item['gtboxes']])
+    for annot, cls_id in zip(item['gtboxes'], cls_ids.tolist()):
         box = convert_xywh2x1y1x2y2(annot['box'], shape, flip)
         x1, y1, x2, y2 = box
-        cls_id = name_to_index(annot['tag'])
         total_boxes.append([x1, y1, x2, y2, cls_id, ])
         # if name of object is not in the DataFrame, skip it
         if cls_id == -1:
@@ -178,6 +204,7 @@ def xyxy_to_cxcywh(box):
 def get_hoi_annotation_from_odgt(item, total_boxes, scale):
     human_boxes, object_boxes, action_boxes = [], [], []
     human_labels, object_labels, action_labels, occlusion_labels, raw_distance_labels, raw_occlusion_labels = [], [], [], [], [], []
+    raw_distances, raw_occlusions = [], []
     img_hh, img_ww = item['height'], item['width']
     for hoi in item.get('hoi', []):
         x1, y1, x2, y2, cls_id = list(map(int, total_boxes[int(hoi['subject_id'])]))
@@ -199,28 +226,13 @@ def get_hoi_annotation_from_odgt(item, total_boxes, scale):
         object_labels.append(object_box[4])
         action_labels.append(hoi_box[4])
         occlusion_labels.append(hoi_box[5])
-        unprocessed_raw_distance_labels = np.array([int(x) for x in hoi['raw_distance'].split(',')])
-        unprocessed_raw_occlusion_labels = np.array([int(x) for x in hoi['raw_occlusion'].split(',')])
-
-        # Convert raw distance to probability
-        values, counts = np.unique(unprocessed_raw_distance_labels, return_counts=True)
-        frequencies = counts / counts.sum()
-        expanded_frequency = np.zeros(5, dtype=np.float16)
-        for j in range(len(values)):
-            current_value = values[j]
-            current_frequency = frequencies[j]
-            expanded_frequency[current_value] = current_frequency
-        raw_distance_labels.append(expanded_frequency)
-
-        # Convert raw occlusion to probability
-        values, counts = np.unique(unprocessed_raw_occlusion_labels, return_counts=True)
-        frequencies = counts / counts.sum()
-        expanded_frequency = np.zeros(5, dtype=np.float16)
-        for j in range(len(values)):
-            current_value = values[j]
-            current_frequency = frequencies[j]
-            expanded_frequency[current_value] = current_frequency
-        raw_occlusion_labels.append(expanded_frequency)
+        raw_distances.append(hoi['raw_distance'])
+        raw_occlusions.append(hoi['raw_occlusion'])
+
+    # Convert raw distances and raw occlusions of all relations to probabilities at once
+    if len(raw_distances) > 0:
+        raw_distance_labels = raw_votes_to_frequencies(raw_distances)
+        raw_occlusion_labels = raw_votes_to_frequencies(raw_occlusions)
 
     return dict(
         human_boxes=torch.from_numpy(np.array(human_boxes).astype(np.float32)),
@@ -250,9 +262,20 @@ def parse_one_gt_line(gt_line, scale=1):
     return dict(image_id=img_name, annotations=interaction_boxes)
 
 
+def parse_one_gt_line_as_stored(gt_line):
+    """
+    parse_one_gt_line() with the dtypes and shapes of the items of
+    AnnotationStore, so that items parsed lazily and items of the store are
+    alike.
+    """
+    return AnnotationStore.from_annotations([parse_one_gt_line(gt_line)])[0]
+
+
+# depth is None if it is not used (see two_point_five_VRD.load_depth),
+# the transforms below then pass None along without touching it
 def hflip(image, depth, target):
     flipped_image = F.hflip(image)
-    flipped_depth = F.hflip(depth)
+    flipped_depth = F.hflip(depth) if depth is not None else None
     w, h = image.size
     target = target.copy()
     if "human_boxes" in target:
@@ -310,27 +333,28 @@ class RandomSelect(object):
         return self.transforms2(img, depth, target)
 
 
-def resize(image, depth, target, size, max_size=None):
-    def get_size_with_aspect_ratio(image_size, size, max_size=None):
-        w, h = image_size
-        if max_size is not None:
-            min_original_size = float(min((w, h)))
-            max_original_size = float(max((w, h)))
-            if max_original_size / min_original_size * size > max_size:
-                size = int(round(max_size * min_original_size / max_original_size))
-        if (w <= h and w == size) or (h <= w and h == size):
-            return h, w
-        if w < h:
-            ow = size
-            oh = int(size * h / w)
-        else:
-            oh = size
-            ow = int(size * w / h)
-        return oh, ow
+def get_size_with_aspect_ratio(image_size, size, max_size=None):
+    w, h = image_size
+    if max_size is not None:
+        min_original_size = float(min((w, h)))
+        max_original_size = float(max((w, h)))
+        if max_original_size / min_original_size * size > max_size:
+            size = int(round(max_size * min_original_size / max_original_size))
+    if (w <= h and w == size) or (h <= w and h == size):
+        return h, w
+    if w < h:
+        ow = size
+        oh = int(size * h / w)
+    else:
+        oh = size
+        ow = int(size * w / h)
+    return oh, ow
+
 
+def resize(image, depth, target, size, max_size=None):
     rescale_size = get_size_with_aspect_ratio(image_size=image.size, size=size, max_size=max_size)
     rescaled_image = F.resize(image, rescale_size)
-    rescaled_depth = F.resize(depth, rescale_size)
+    rescaled_depth = F.resize(depth, rescale_size) if depth is not None else None
 
     if target is None:
         return rescaled_image, rescaled_depth, None
@@ -338,6 +362,10 @@ def resize(image, depth, target, size, max_size=None):
     ratios = tuple(float(s) / float(s_orig) for s, s_orig in zip(rescaled_image.size, image.size))
     ratio_width, ratio_height = ratios
 
+    return rescaled_image, rescaled_depth, scale_boxes(target, ratio_width, ratio_height)
+
+
+def scale_boxes(target, ratio_width, ratio_height):
     target = target.copy()
     if "human_boxes" in target:
         boxes = target["human_boxes"]
@@ -351,18 +379,37 @@ def resize(image, depth, target, size, max_size=None):
         boxes = target["action_boxes"]
         scaled_boxes = boxes * torch.as_tensor([ratio_width, ratio_height, ratio_width, ratio_height])
         target["action_boxes"] = scaled_boxes
+    return target
 
-    return rescaled_image, rescaled_depth, target
+
+class BatchScale(object):
+    """
+    Scale shared by the dataset and the RandomResize transforms of a batch
+    scale: the dataset sets it to the scale ScaleBatchSampler drew for the
+    batch of the image before transforming the image (None draws a scale per
+    image).
+    """
+    def __init__(self, scales):
+        self.scales = scales
+        self.scale = None
 
 
 class RandomResize(object):
-    def __init__(self, sizes, max_size=None):
+    def __init__(self, sizes, max_size=None, batch_scale=None):
+        """
+        :param batch_scale: BatchScale of sizes, whose scale is used instead
+            of a random one when it is set.
+        """
         assert isinstance(sizes, (list, tuple))
         self.sizes = sizes
         self.max_size = max_size
+        self.batch_scale = batch_scale
 
     def __call__(self, img, depth, target=None):
-        size = random.choice(self.sizes)
+        if self.batch_scale is not None and self.batch_scale.scale is not None:
+            size = self.batch_scale.scale
+        else:
+            size = random.choice(self.sizes)
         return resize(img, depth, target, size, self.max_size)
 
 # TODO: it does not work for depth
@@ -428,7 +475,9 @@ class RandomSizeCrop(object):
 
 class ToTensor(object):
     def __call__(self, img, depth, target):
-        return torchvision.transforms.functional.to_tensor(img), torchvision.transforms.functional.to_tensor(depth), target
+        if depth is not None:
+            depth = torchvision.transforms.functional.to_tensor(depth)
+        return torchvision.transforms.functional.to_tensor(img), depth, target
 
 
 class Normalize(object):
@@ -441,7 +490,10 @@ class Normalize(object):
 
     def __call__(self, image, depth, target):
         image = torchvision.transforms.functional.normalize(image, mean=self.mean, std=self.std)
-        depth = torchvision.transforms.functional.normalize(depth, mean=self.depth_mean, std=self.depth_std)
+        if depth is not None:
+            # Depth maps have a single channel
+            depth = torchvision.transforms.functional.normalize(depth, mean=self.depth_mean[:depth.shape[0]],
+                                                                std=self.depth_std[:depth.shape[0]])
         if target is None:
             return image, depth, None
         target = target.copy()
@@ -473,16 +525,196 @@ class Compose(object):
             image, depth, target = t(image, depth, target)
         return image, depth, target
 
-def make_hico_transforms(image_set, test_scale=-1):
+# mean and std for OIDv4 training set
+hico_mean = [0.38582161319756497, 0.417059363143913, 0.44746641122649666]
+hico_std = [0.2928927708221023, 0.28587472243230755, 0.2924566717392719]
+# mean and std for depth of training set
+hico_depth_mean = [0.42352728300018017, 0.42352728300018017, 0.42352728300018017]
+hico_depth_std = [0.29530982498913205, 0.29530982498913205, 0.29530982498913205]
+# Stride of the backbone features. Depth maps only enter the model as the
+# positional encoding of their max-pooled mask at that stride, so they are
+# pooled in the DataLoader (see util.misc.pool_depth_list)
+depth_stride = 32
+
+
+# F.interpolate() resizes uint8 images (in channels last) since torch 2.1,
+# several times faster than float images and than PIL
+UINT8_INTERPOLATE = tuple(int(v) for v in torch.__version__.split('.')[:2]) >= (2, 1)
+
+
+class ToUint8Tensor(object):
+    """
+    PIL image and depth map to uint8 tensors (CHW) for the splits augmented
+    by BatchTransforms. Boxes are left in the xyxy format in pixels.
+    """
+    def __call__(self, img, depth, target):
+        if depth is not None:
+            depth = F.pil_to_tensor(depth)
+        return F.pil_to_tensor(img), depth, target
+
+
+class BatchTransforms(object):
+    """
+    The augmentation of make_hico_transforms() applied after collate_fn to a
+    whole padded batch of uint8 images (see ToUint8Tensor), with torch ops
+    instead of PIL ops:
+        flip and resize: every image is resized to its own size by
+            F.interpolate() into a new padded float batch,
+        brightness and contrast: vectorized over the batch with per-image
+            factors (the mean gray value of the contrast is taken over the
+            valid region only),
+        normalize: mean/std of the batch, and boxes of all images to
+            normalized cxcywh at once.
+    Intersection boxes are computed from the normalized boxes afterwards.
+
+    Brightness and contrast are applied after resizing, which only changes
+    the result by rounding.
+    """
+    def __init__(self, mean, std, depth_mean, depth_std, scales=None, max_size=None, flip_p=0.0, adjust_p=0.0,
+                 adjust_factors=(0.8, 0.9, 1.0, 1.1, 1.2), depth_stride=None, scale_per_batch=False,
+                 padding_buckets=None):
+        """
+        :param scales: images are resized to a random size of scales (as
+            RandomResize), or not resized if None.
+        :param scale_per_batch: draw one scale for all images of the batch
+            (as ScaleBatchSampler) rather than one per image.
+        :param flip_p, adjust_p: probabilities of RandomHorizontalFlip and of
+            each adjustment of RandomAdjustImage.
+        :param depth_stride: max-pool the depth maps to this stride after
+            resizing them (see util.misc.pool_depth), if not None.
+        :param padding_buckets: util.misc.PaddingBuckets the resized batch
+            is padded to, if not None.
+        """
+        self.mean = torch.as_tensor(mean).view(1, -1, 1, 1)
+        self.std = torch.as_tensor(std).view(1, -1, 1, 1)
+        self.depth_mean = torch.as_tensor(depth_mean).view(1, -1, 1, 1)
+        self.depth_std = torch.as_tensor(depth_std).view(1, -1, 1, 1)
+        self.scales = scales
+        self.max_size = max_size
+        self.flip_p = flip_p
+        self.adjust_p = adjust_p
+        self.adjust_factors = torch.as_tensor(adjust_factors)
+        self.depth_stride = depth_stride
+        self.scale_per_batch = scale_per_batch
+        self.padding_buckets = padding_buckets
+
+    def _random_factors(self, batch_size):
+        factors = self.adjust_factors[torch.randint(len(self.adjust_factors), (batch_size,))]
+        return torch.where(torch.rand(batch_size) < self.adjust_p, factors, torch.ones(batch_size))
+
+    def _flip_and_resize(self, images, sizes, out_sizes, flip):
+        """
+        :return: float batch of the images resized to out_sizes (antialiased
+            bilinear, as PIL) and flipped if flip, padded with zeros.
+        """
+        batch_size, channels = images.shape[:2]
+        batch_height, batch_width = max(size[0] for size in out_sizes), max(size[1] for size in out_sizes)
+        if self.padding_buckets is not None:
+            batch_height, batch_width = self.padding_buckets.shape(batch_height, batch_width)
+        out = new_batch_tensor((batch_size, channels, batch_height, batch_width), torch.float32)
+        for i, ((height, width), (out_height, out_width)) in enumerate(zip(sizes, out_sizes)):
+            out[i, :, out_height:].zero_()
+            out[i, :, :out_height, out_width:].zero_()
+            image = images[i:i + 1, :, :height, :width]
+            if (out_height, out_width) != (height, width):
+                if UINT8_INTERPOLATE:
+                    image = image.contiguous(memory_format=torch.channels_last)
+                else:
+                    image = image.float()
+                image = torch.nn.functional.interpolate(image, size=(out_height, out_width), mode='bilinear',
+                                                        align_corners=False, antialias=True)
+            if flip[i]:
+                image = image.flip(-1)
+            out[i:i + 1, :, :out_height, :out_width].copy_(image)
+        return out
+
+    def _normalize(self, images, mask, mean, std):
+        # (images / 255 - mean) / std, and zero padding as collate_fn
+        images.mul_((1 / (255 * std)).to(images.device)).sub_((mean / std).to(images.device))
+        return images.masked_fill_(mask.unsqueeze(1), 0)
+
+    def __call__(self, samples, depth, targets):
+        images, mask = samples.decompose()
+        batch_size = images.shape[0]
+        valid = ~mask
+        sizes = list(zip(valid[:, :, 0].sum(1).tolist(), valid[:, 0, :].sum(1).tolist()))
+
+        flip = (torch.rand(batch_size) < self.flip_p).tolist()
+        out_sizes = sizes
+        if self.scales is not None:
+            if self.scale_per_batch:
+                scales = [random.choice(self.scales)] * batch_size
+            else:
+                scales = [random.choice(self.scales) for _ in range(batch_size)]
+            out_sizes = [get_size_with_aspect_ratio((w, h), scale, self.max_size)
+                         for (h, w), scale in zip(sizes, scales)]
+
+        if any(flip) or out_sizes != sizes:
+            images = self._flip_and_resize(images, sizes, out_sizes, flip)
+            if depth is not None:
+                depth = NestedTensor(self._flip_and_resize(depth.tensors, sizes, out_sizes, flip), None)
+            out_heights, out_widths = torch.as_tensor(out_sizes).T.view(2, -1, 1, 1)
+            rows = torch.arange(images.shape[2]).view(1, -1, 1) >= out_heights
+            columns = torch.arange(images.shape[3]).view(1, 1, -1) >= out_widths
+            mask = (rows | columns).to(images.device)
+        else:
+            images = images.float()
+            if depth is not None:
+                depth = NestedTensor(depth.tensors.float(), None)
+
+        if self.adjust_p > 0:
+            brightness = self._random_factors(batch_size)
+            if (brightness != 1).any():
+                images.mul_(brightness.to(images.device).view(-1, 1, 1, 1)).clamp_(0, 255)
+            contrast = self._random_factors(batch_size)
+            if (contrast != 1).any():
+                # Mean gray value of every image, its padding is zero
+                num_pixels = (~mask).sum((1, 2))
+                gray_weights = torch.as_tensor([0.299, 0.587, 0.114], device=images.device)
+                mean = (images.sum((2, 3)) @ gray_weights) / num_pixels
+                contrast = contrast.to(images.device)
+                images.mul_(contrast.view(-1, 1, 1, 1)).add_((mean * (1 - contrast)).view(-1, 1, 1, 1)).clamp_(0, 255)
+
+        samples = NestedTensor(self._normalize(images, mask, self.mean, self.std), mask)
+        if depth is not None:
+            # Depth maps have a single channel
+            channels = depth.tensors.shape[1]
+            depth = NestedTensor(self._normalize(depth.tensors, mask, self.depth_mean[:, :channels],
+                                                 self.depth_std[:, :channels]), mask)
+            if self.depth_stride is not None:
+                depth = pool_depth(depth, self.depth_stride)
+
+        # Boxes of all relations of the batch at once: flipped within their
+        # image and normalized by its size (which resizing does not change)
+        relations = dict(targets.relations)
+        image_index = torch.repeat_interleave(torch.arange(batch_size), torch.as_tensor(targets.sizes))
+        boxes = torch.stack([relations['human_boxes'], relations['object_boxes'], relations['action_boxes']],
+                            dim=1).float()
+        h, w = torch.as_tensor(sizes, dtype=torch.float32)[image_index].T.view(2, -1, 1)
+        flipped = torch.as_tensor(flip)[image_index].view(-1, 1)
+        x0 = torch.where(flipped, w - boxes[..., 2], boxes[..., 0])
+        x1 = torch.where(flipped, w - boxes[..., 0], boxes[..., 2])
+        boxes = box_xyxy_to_cxcywh(torch.stack([x0, boxes[..., 1], x1, boxes[..., 3]], dim=-1))
+        boxes = boxes / torch.stack([w, h, w, h], dim=-1)
+        relations['human_boxes'] = boxes[:, 0].contiguous()
+        relations['object_boxes'] = boxes[:, 1].contiguous()
+        relations['action_boxes'] = boxes[:, 2].contiguous()
+        relations['intersection_boxes'] = compute_intersection_boxes(relations['human_boxes'],
+                                                                     relations['object_boxes'], targets.sizes)
+        return [samples, depth, TargetBatch(relations, targets.sizes, targets.images)]
+
+
+def make_hico_transforms(image_set, test_scale=-1, batch_scale=None):
+    """
+    :param batch_scale: BatchScale of the training scales. The last resize of
+        both branches of RandomSelect then resizes to the scale of the batch
+        (the resize to 400-600 of the second branch stays random per image).
+    """
     scales = [480, 512, 544, 576, 608, 640, 672, 704, 736, 768, 800]
     if GPU_MEMORY_PRESSURE_TEST:
         scales = [800]
-    # mean and std for OIDv4 training set
-    mean = [0.38582161319756497, 0.417059363143913, 0.44746641122649666]
-    std = [0.2928927708221023, 0.28587472243230755, 0.2924566717392719]
-    # mean and std for depth of training set
-    depth_mean = [0.42352728300018017, 0.42352728300018017, 0.42352728300018017]
-    depth_std = [0.29530982498913205, 0.29530982498913205, 0.29530982498913205]
+    assert batch_scale is None or batch_scale.scales == scales, batch_scale.scales
+    mean, std, depth_mean, depth_std = hico_mean, hico_std, hico_depth_mean, hico_depth_std
     normalize = Compose([
         ToTensor(),
         Normalize(mean, std, depth_mean, depth_std),
@@ -493,10 +725,10 @@ def make_hico_transforms(image_set, test_scale=-1):
                 RandomHorizontalFlip(),
                 RandomAdjustImage(),
                 RandomSelect(
-                    RandomResize(scales, max_size=1333),
+                    RandomResize(scales, max_size=1333, batch_scale=batch_scale),
                     Compose([
                         RandomResize([400, 500, 600]),
-                        RandomResize(scales, max_size=1333),
+                        RandomResize(scales, max_size=1333, batch_scale=batch_scale),
                     ])
                 ),
                 normalize,
@@ -506,8 +738,8 @@ def make_hico_transforms(image_set, test_scale=-1):
                 RandomHorizontalFlip(),
                 RandomAdjustImage(),
                 RandomSelect(
-                    RandomResize(scales, max_size=1333),
-                    RandomResize(scales, max_size=1333)
+                    RandomResize(scales, max_size=1333, batch_scale=batch_scale),
+                    RandomResize(scales, max_size=1333, batch_scale=batch_scale)
                 ),
                 normalize,
             ])
@@ -524,61 +756,277 @@ def make_hico_transforms(image_set, test_scale=-1):
     raise ValueError(f'unknown {image_set}')
 
 
+def largest_resize(image_set, test_scale=-1):
+    """
+    :return: (min_size, max_size) of the largest size make_hico_transforms()
+        resizes the images of image_set to, or None if it does not resize
+        them.
+    """
+    if image_set == 'train' and not DEACTIVATE_EXTRA_TRANSFORMS:
+        return 800, 1333
+    if test_scale == -1:
+        return None
+    return test_scale, 1333
+
+
+def resized_sizes(image_sizes, image_set, test_scale=-1, max_images=10000):
+    """
+    :param image_sizes: (N, 2) array of the (height, width) of images, of
+        which max_images random ones are used if there are more.
+    :return: (M, 2) array of the (height, width) make_hico_transforms()
+        resizes them to, at every scale it may draw (the first branch of
+        RandomSelect).
+    """
+    image_sizes = np.asarray(image_sizes).reshape(-1, 2)
+    if len(image_sizes) > max_images:
+        image_sizes = image_sizes[np.random.RandomState(0).choice(len(image_sizes), max_images, replace=False)]
+    largest = largest_resize(image_set, test_scale)
+    if largest is None:
+        return image_sizes
+    if image_set == 'train' and not DEACTIVATE_EXTRA_TRANSFORMS:
+        scales = [800] if GPU_MEMORY_PRESSURE_TEST else [480, 512, 544, 576, 608, 640, 672, 704, 736, 768, 800]
+    else:
+        scales = [test_scale]
+    return np.array([get_size_with_aspect_ratio((w, h), scale, largest[1])
+                     for h, w in image_sizes.tolist() for scale in scales], dtype=np.int64).reshape(-1, 2)
+
+
+def make_hico_batch_transforms(image_set, test_scale=-1):
+    """
+    BatchTransforms doing the augmentation of make_hico_transforms() on
+    whole batches. The second branch of RandomSelect (resizing to 400-600
+    before resizing to scales) is not repeated, it results in the same sizes
+    up to rounding.
+    """
+    scales = [480, 512, 544, 576, 608, 640, 672, 704, 736, 768, 800]
+    if GPU_MEMORY_PRESSURE_TEST:
+        scales = [800]
+    normalization = dict(mean=hico_mean, std=hico_std, depth_mean=hico_depth_mean, depth_std=hico_depth_std,
+                         depth_stride=depth_stride)
+    if image_set == 'train' and not DEACTIVATE_EXTRA_TRANSFORMS:
+        return BatchTransforms(scales=scales, max_size=1333, flip_p=0.5, adjust_p=0.5,
+                               scale_per_batch=BATCH_SCALE_SAMPLING, **normalization)
+    if image_set == 'test' or image_set == 'valid' or DEACTIVATE_EXTRA_TRANSFORMS:
+        if test_scale == -1:
+            return BatchTransforms(**normalization)
+        assert 400 <= test_scale <= 800, test_scale
+        return BatchTransforms(scales=[test_scale], max_size=1333, **normalization)
+    raise ValueError(f'unknown {image_set}')
+
+
+def compute_intersection_boxes(human_boxes, object_boxes, sizes=None):
+    """
+    :param human_boxes, object_boxes: normalized boxes of the relations of a
+        batch of images, concatenated, in the cxcywh format.
+    :param sizes: number of relations of every image of the batch, or None
+        if all relations belong to one image.
+    :return: intersection boxes of the relations, also in the cxcywh format.
+        The random shift and size of the ground truth intersection boxes are
+        drawn once per image, and DO_NOT_PREDICT_INTERSECTION_BOX_IF_NO_INTERSECTION
+        applies to all relations of an image, as when they were computed
+        image by image.
+    """
+    if sizes is None:
+        sizes = [len(human_boxes)]
+    num_images = len(sizes)
+    image_index = torch.repeat_interleave(torch.arange(num_images, device=human_boxes.device),
+                                          torch.as_tensor(sizes, device=human_boxes.device))
+    human_boxes = box_cxcywh_to_xyxy(human_boxes)
+    object_boxes = box_cxcywh_to_xyxy(object_boxes)
+    top_left = torch.max(human_boxes[:, :2], object_boxes[:, :2])
+    bottom_right = torch.min(human_boxes[:, 2:], object_boxes[:, 2:])
+    # address negative width and height by swapping min and max
+    no_intersection = (top_left > bottom_right).any(1)
+    low = torch.min(top_left, bottom_right)
+    high = torch.max(top_left, bottom_right)
+    center = (low + high) / 2
+    size = high - low
+    # Randomly shift the location (center) of the ground truth intersection box
+    if RANDOMLY_SHIFT_GT_INTERSECTION_BOXES:
+        noise = np.random.normal(loc=RAND_INTER_LOC, scale=RAND_INTER_SCALE, size=(num_images, 2))
+        center = center + size * torch.from_numpy(noise).to(size)[image_index]
+    # Randomly adjust the size of the ground truth intersection box
+    if RANDOMLY_ADJUST_SIZES_OF_GT_INTERSECTION_BOXES:
+        noise = np.random.normal(loc=RAND_INTER_SIZE_LOC, scale=RAND_INTER_SIZE_SCALE, size=(num_images, 2))
+        # make sure the adjusted width and height are greater than zero
+        size = (size + size * torch.from_numpy(noise).to(size)[image_index]).clamp(min=0.00001)
+    # If no intersection exists, set w and h to -1.
+    # Losses for intersection box will not be back-proped if
+    # w or h is -1 (<0).
+    if DO_NOT_PREDICT_INTERSECTION_BOX_IF_NO_INTERSECTION:
+        image_without_intersection = torch.zeros(num_images, device=size.device).index_add_(
+            0, image_index, no_intersection.to(size.dtype)) > 0
+        size = size.masked_fill(image_without_intersection[image_index].unsqueeze(1), -1)
+    # this intersection box should also be in the cxcywh format
+    return torch.cat([center, size], dim=1)
+
+
+class IntersectionBoxes(object):
+    """
+    Batch stage adding the intersection boxes of all relations of a batch,
+    computed at once by compute_intersection_boxes(), to its TargetBatch.
+    """
+
+    def __call__(self, samples, depth, targets):
+        relations = dict(targets.relations)
+        relations['intersection_boxes'] = compute_intersection_boxes(relations['human_boxes'],
+                                                                     relations['object_boxes'], targets.sizes)
+        return [samples, depth, TargetBatch(relations, targets.sizes, targets.images)]
+
+
 class two_point_five_VRD(VisionDataset):
-    def __init__(self, root, annFile, image_set, transform=None, target_transform=None, transforms=None):
+    def __init__(self, root, annFile, image_set, transform=None, target_transform=None, transforms=None,
+                 load_depth=None, image_shard_dir=None, batch_transforms=None, subset_indices=None,
+                 decode_size=None, batch_scale=None, shared_state=False):
+        """
+        :param load_depth: read depth maps or not. If None, depth maps are only
+            read if the engine uses them for this image_set
+            (USE_DEPTH_DURING_TRAINING for 'train', USE_DEPTH_DURING_INFERENCE
+            otherwise). Without depth maps, None is returned in place of depth.
+        :param image_shard_dir: read images and depth maps from the image
+            shards in this folder (see tools/build_image_shards.py) instead
+            of the image folders.
+        :param batch_transforms: BatchTransforms applied after collate_fn
+            (see util.misc.build_collate_fn). transforms then only convert
+            images to uint8 tensors. If None, IntersectionBoxes() is applied
+            instead: intersection boxes are always computed for whole
+            batches, never in __getitem__.
+        :param subset_indices: indices of the lines of annFile to use, all
+            lines if None.
+        :param decode_size: (min_size, max_size) of the largest images the
+            transforms resize to (see largest_resize()). Images at least
+            twice as large are then decoded at a reduced resolution that is
+            still at least that large, see reduced_decode_factor(). Boxes are
+            scaled to the decoded size.
+        :param batch_scale: BatchScale of the RandomResize of transforms.
+            Indices may then be (index, scale) pairs (see ScaleBatchSampler),
+            the image is resized to scale.
+        :param shared_state: publish the immutable state of the dataset into
+            shared memory, see publish_shared_state().
+        """
         super(two_point_five_VRD, self).__init__(root, transforms, transform, target_transform)
-        with open(annFile, 'r') as f:
-            self.annotations = [parse_one_gt_line(l.strip()) for l in f.readlines()]
+        # Parsed annotations are cached in ANNOTATION_CACHE_DIR (if not None),
+        # keyed by the content of annFile and the class vocabulary used to
+        # parse it.
+        # self.annotations is a columnar AnnotationStore (a few flat arrays)
+        # rather than a list of dicts, so that forked DataLoader workers
+        # keep sharing its memory.
+        # With INDEXED_ANNOTATION_READER, lines are only parsed when read.
+        if INDEXED_ANNOTATION_READER:
+            self.annotations = IndexedOdgtReader(annFile, parse_one_gt_line_as_stored,
+                                                 cache_size=ANNOTATION_LRU_SIZE)
+        else:
+            self.annotations = load_annotations(annFile, parse_one_gt_line, cache_dir=ANNOTATION_CACHE_DIR,
+                                                parse_key=get_label_vocabulary().digest(),
+                                                mmap_mode='c' if ANNOTATION_STORE_MMAP else None)
+        if subset_indices is not None:
+            self.annotations = AnnotationSubset(self.annotations, subset_indices)
         self.transforms = transforms
+        self.batch_transforms = batch_transforms if batch_transforms is not None else IntersectionBoxes()
         self.image_set = image_set
         self.image_folder_name = self.image_set
         if self.image_set == 'valid':
             self.image_folder_name = 'validation'
+        if load_depth is None:
+            load_depth = USE_DEPTH_DURING_TRAINING if image_set == 'train' else USE_DEPTH_DURING_INFERENCE
+        self.load_depth = load_depth
+        self.decode_size = decode_size
+        self.depth_stride = depth_stride
+        self.batch_scale = batch_scale
+        # Canonical shapes of the padded batches, see set_padding_buckets()
+        self.padding_buckets = None
+        self.image_shards = None
+        if image_shard_dir is not None and not CUSTOM_TSET_SET:
+            self.image_shards = ImageShardReader(image_shard_dir, self.image_folder_name, use_mmap=IMAGE_SHARD_MMAP)
+        self.shared_state = None
+        if shared_state:
+            self.publish_shared_state()
+
+    def image_path(self, img_name):
+        if not CUSTOM_TSET_SET:
+            return './data/2.5vrd/images/' + self.image_folder_name + '/' + img_name
+        return './data/2.5vrd/images/' + 'custom' + '/' + img_name
+
+    def publish_shared_state(self):
+        """
+        Publish the annotation arrays, the label vocabulary and the image
+        paths into one shared memory segment (see SharedArrays), which
+        DataLoader workers map instead of holding a copy each. The dataset is
+        then pickled with the name of the segment in place of these arrays.
+        Annotations read lazily (IndexedOdgtReader) stay as they are.
+        """
+        vocabulary = get_label_vocabulary()
+        arrays = {'vocabulary/entities': vocabulary.entities.astype(str),
+                  'vocabulary/names': vocabulary.names.astype(str)}
+        store, indices = self.annotations, None
+        if isinstance(store, AnnotationSubset):
+            store, indices = store.annotations, store.indices
+        if isinstance(store, AnnotationStore):
+            arrays.update(('annotations/' + name, np.asarray(array)) for name, array in store.arrays.items())
+            image_ids = store.arrays['image_id'] if indices is None else store.arrays['image_id'][indices]
+            arrays['image_paths'] = np.char.add(self.image_path(''), np.asarray(image_ids, dtype=str))
+        self.shared_state = SharedArrays.publish(arrays)
+        if isinstance(store, AnnotationStore):
+            # No longer pickled as the path of the cached store either
+            store.arrays = self.shared_state.view('annotations/')
+            store.path, store.mmap_mode = None, None
+
+    def __setstate__(self, state):
+        # DataLoader workers started with 'spawn' or 'forkserver' take the
+        # label vocabulary from shared memory rather than from the CSV file
+        self.__dict__.update(state)
+        if self.shared_state is not None and _label_vocabulary is None:
+            set_label_vocabulary(LabelVocabulary(self.shared_state['vocabulary/entities'],
+                                                 self.shared_state['vocabulary/names']))
 
     def __getitem__(self, index):
+        # ScaleBatchSampler gives (index, scale), all images of a batch are
+        # resized to the same scale
+        scale = None
+        if isinstance(index, tuple):
+            index, scale = index
         ann = self.annotations[index]
         img_name = ann['image_id']
         target = ann['annotations']
-        if not CUSTOM_TSET_SET:
-            img_path = './data/2.5vrd/images/' + self.image_folder_name + '/' + img_name
+        if self.shared_state is not None and 'image_paths' in self.shared_state:
+            img_path = str(self.shared_state['image_paths'][index])
         else:
-            img_path = './data/2.5vrd/images/' + 'custom' + '/' + img_name
-
-        try:
-            img = cv2.imread(img_path, cv2.IMREAD_COLOR)
-            img = Image.fromarray(img[:, :, ::-1]).convert('RGB')
-        except:
-            print(img_path)
-            raise NotImplementedError("Image not found")
+            img_path = self.image_path(img_name)
 
-        depth_name = img_name[:-3] + 'png'
-        depth_path = './data/2.5vrd/depth/' + self.image_folder_name + '/' + depth_name
-        try:
-            depth = cv2.imread(depth_path, cv2.IMREAD_COLOR)
-            depth = Image.fromarray(depth[:, :, ::-1]).convert('RGB')
-        except:
-            if not USE_DEPTH_DURING_TRAINING and not USE_DEPTH_DURING_INFERENCE:
-                depth = img.copy()
+        org_h, org_w = target['org_size'].tolist()
+        if self.image_shards is not None:
+            img, depth = self.read_from_shards(img_name)
+        else:
+            img, depth = self.read_from_folders(img_path, img_name, (org_h, org_w))
+        # Images in the shards may be downsized and images may be decoded at
+        # reduced resolution (decode_size), boxes are scaled from the
+        # original size to the decoded size
+        if img.size != (org_w, org_h) and (self.image_shards is not None or self.decode_size is not None):
+            target = scale_boxes(target, img.size[0] / org_w, img.size[1] / org_h)
 
         # Save img and depth to temp for visualization and debugging
         if SAVE_IMAGES:
             img.save('temp/' + img_name[:-4] + '_img.png')
-            depth.save('temp/' + img_name[:-4] + '_depth.png')
+            if depth is not None:
+                depth.save('temp/' + img_name[:-4] + '_depth.png')
 
         # before transform, boxes are in xyxy
         # after transform (nomalize), boxes are in cxcywh
         if self.transforms is not None:
+            if self.batch_scale is not None:
+                self.batch_scale.scale = scale
             img, depth, target = self.transforms(img, depth, target)
 
         # Save transformed img and depth
-        if SAVE_IMAGES:
+        if SAVE_IMAGES and not isinstance(self.batch_transforms, BatchTransforms):
             transformed_img = Image.fromarray((img.permute(1,2,0).numpy() * 255).astype(np.uint8))
             transformed_img.save('temp/' + img_name[:-4] + '_img_transformed.png')
 
-            transformed_depth = Image.fromarray((depth.permute(1, 2, 0).numpy() * 255).astype(np.uint8))
-            transformed_depth.save('temp/' + img_name[:-4] + '_depth_transformed.png')
+            if depth is not None:
+                transformed_depth = Image.fromarray((depth.permute(1, 2, 0).numpy() * 255).astype(np.uint8))
+                transformed_depth.save('temp/' + img_name[:-4] + '_depth_transformed.png')
 
-        assert img.shape == depth.shape
+        assert depth is None or img.shape[-2:] == depth.shape[-2:]
 
         # Put items in target into arrays to partially address the
         # EOF Error when num_workers > 1
@@ -591,57 +1039,116 @@ class two_point_five_VRD(VisionDataset):
         occlusion_labels = target['occlusion_labels']
         raw_distance_labels = target['raw_distance_labels']
         raw_occlusion_labels = target['raw_occlusion_labels']
-        image_id = target['image_id']
+        image_id = np.array(target['image_id'])
         org_size = target['org_size']
-        num_bounding_boxes_in_ground_truth = target['num_bounding_boxes_in_ground_truth']
-
-        # Compute interaction boxes
-        # (human boxes and object boxes are in the cxcywh format)
-        xmin = torch.max(human_boxes[:, 0] - human_boxes[:, 2] / 2, object_boxes[:, 0] - object_boxes[:, 2] / 2)
-        ymin = torch.max(human_boxes[:, 1] - human_boxes[:, 3] / 2, object_boxes[:, 1] - object_boxes[:, 3] / 2)
-        xmax = torch.min(human_boxes[:, 0] + human_boxes[:, 2] / 2, object_boxes[:, 0] + object_boxes[:, 2] / 2)
-        ymax = torch.min(human_boxes[:, 1] + human_boxes[:, 3] / 2, object_boxes[:, 1] + object_boxes[:, 3] / 2)
-        # address negative width and height by swapping min and max
-        xmin_adjusted = torch.min(xmin, xmax)
-        xmax_adjusted = torch.max(xmin, xmax)
-        ymin_adjusted = torch.min(ymin, ymax)
-        ymax_adjusted = torch.max(ymin, ymax)
-        w = xmax_adjusted - xmin_adjusted
-        h = ymax_adjusted - ymin_adjusted
-        cx = (xmin_adjusted + xmax_adjusted) / 2
-        cy = (ymin_adjusted + ymax_adjusted) / 2
-        # Randomly shift the location (center) of the ground truth intersection box
-        if RANDOMLY_SHIFT_GT_INTERSECTION_BOXES:
-            random_noise_scale_x, random_noise_scale_y = np.random.normal(loc=RAND_INTER_LOC, scale=RAND_INTER_SCALE, size=2)
-            cx += w * random_noise_scale_x
-            cy += h * random_noise_scale_y
-        # Randomly adjust the size of the ground truth intersection box
-        if RANDOMLY_ADJUST_SIZES_OF_GT_INTERSECTION_BOXES:
-            random_size_scale_x, random_size_scale_y = np.random.normal(loc=RAND_INTER_SIZE_LOC, scale=RAND_INTER_SIZE_SCALE, size=2)
-            w += w * random_size_scale_x
-            h += h * random_size_scale_y
-            # make sure the adjusted width and height are greater than zero
-            w = torch.max(0.00001 * torch.tensor(w.shape, device=w.device), w)
-            h = torch.max(0.00001 * torch.tensor(h.shape, device=h.device), h)
-        # If no intersection exists, set w and h to -1.
-        # Losses for intersection box will not be back-proped if
-        # w or h is -1 (<0).
-        if DO_NOT_PREDICT_INTERSECTION_BOX_IF_NO_INTERSECTION:
-            if (xmin > xmax).any() or (ymin > ymax).any():
-                w = w * 0 - 1
-                h = h * 0 - 1
-        # this intersection box should also be in the cxcywh format
-        intersection_boxes = torch.vstack([cx, cy, w, h]).T
-
-
-        image_id = np.array(image_id)
-        num_bounding_boxes_in_ground_truth = torch.tensor(num_bounding_boxes_in_ground_truth)
-
-        target.clear()
-        del target
-        gc.collect()
-
-        return img, depth, human_boxes, human_labels, object_boxes, object_labels, action_boxes, action_labels, occlusion_labels, raw_distance_labels, raw_occlusion_labels, image_id, org_size, num_bounding_boxes_in_ground_truth, intersection_boxes
+        num_bounding_boxes_in_ground_truth = torch.tensor(target['num_bounding_boxes_in_ground_truth'])
+
+        # Intersection boxes are computed for the whole batch by
+        # batch_transforms (see util.misc.build_collate_fn)
+        return img, depth, human_boxes, human_labels, object_boxes, object_labels, action_boxes, action_labels, occlusion_labels, raw_distance_labels, raw_occlusion_labels, image_id, org_size, num_bounding_boxes_in_ground_truth
+
+    def decode_factor(self, width, height):
+        """
+        :return: factor of the reduced resolution at which an image of
+            width x height is decoded, 1 without decode_size.
+        """
+        if self.decode_size is None:
+            return 1
+        return reduced_decode_factor(width, height, *self.decode_size)
+
+    def read_from_folders(self, img_path, img_name, org_size=None):
+        """
+        :param org_size: (height, width) of the image from the annotations,
+            to decode it at reduced resolution if decode_size is set.
+        """
+        factor = 1
+        if org_size is not None:
+            factor = self.decode_factor(org_size[1], org_size[0])
+        try:
+            img = cv2.imread(img_path, REDUCED_DECODE_FLAGS[factor])
+            img = Image.fromarray(img[:, :, ::-1]).convert('RGB')
+        except:
+            print(img_path)
+            raise NotImplementedError("Image not found")
+
+        # Depth maps are neither read nor transformed if they are not used
+        depth = None
+        if self.load_depth:
+            depth_name = img_name[:-3] + 'png'
+            depth_path = './data/2.5vrd/depth/' + self.image_folder_name + '/' + depth_name
+            try:
+                depth = cv2.imread(depth_path, REDUCED_DECODE_FLAGS[factor])
+                # Only one channel of the depth maps is used (channel 0 of
+                # the RGB image)
+                depth = np.ascontiguousarray(depth[:, :, 2])
+                if factor > 1 and depth.shape[:2] != (img.size[1], img.size[0]):
+                    # Reduced PNG and JPEG sizes may be rounded differently
+                    depth = cv2.resize(depth, img.size, interpolation=cv2.INTER_AREA)
+                depth = Image.fromarray(depth)
+            except:
+                print(depth_path)
+                raise NotImplementedError("Depth not found")
+        return img, depth
+
+    def read_from_shards(self, img_name):
+        try:
+            factor = self.decode_factor(*self.image_shards.size(img_name))
+            img = self.image_shards.read_image(img_name, factor)
+        except KeyError:
+            raise NotImplementedError("Image not found in image shards: " + img_name)
+        depth = None
+        if self.load_depth:
+            depth = self.image_shards.read_depth(img_name)
+            if depth is None:
+                raise NotImplementedError("Depth not found in image shards: " + img_name)
+            if depth.size != img.size:
+                depth = depth.resize(img.size, Image.BILINEAR)
+        return img, depth
+
+    @property
+    def collate_depth_stride(self):
+        """
+        Stride collate_fn pools the depth maps to (see util.misc.build_collate_fn),
+        None if BatchTransforms pool them after resizing them.
+        """
+        if isinstance(self.batch_transforms, BatchTransforms):
+            return None
+        return self.depth_stride
+
+    @property
+    def collate_padding_buckets(self):
+        """
+        Padding buckets collate_fn pads the batches to (see
+        util.misc.build_collate_fn), None if BatchTransforms pad them after
+        resizing them: the buckets are fitted to the resized sizes.
+        """
+        if isinstance(self.batch_transforms, BatchTransforms):
+            return None
+        return self.padding_buckets
+
+    def set_padding_buckets(self, padding_buckets):
+        """
+        Pad batches to the shapes of padding_buckets (a util.misc.PaddingBuckets,
+        or None to pad to the largest image), in collate_fn, or in
+        BatchTransforms if the dataset has them (see collate_padding_buckets).
+        """
+        self.padding_buckets = padding_buckets
+        if isinstance(self.batch_transforms, BatchTransforms):
+            self.batch_transforms.padding_buckets = padding_buckets
+
+    def image_sizes(self):
+        """
+        :return: (N, 2) array of the original (height, width) of the images,
+            read from the annotations without decoding any image.
+        """
+        return self.annotations.image_sizes()
+
+    def image_ids(self):
+        """
+        :return: (N,) string array of the image ids, in the order of the
+            indices of the dataset.
+        """
+        return self.annotations.image_ids()
 
     def __len__(self):
         return len(self.annotations)
@@ -653,20 +1160,49 @@ def build(image_set, test_scale=-1):
         annotation_file = './data/2.5vrd/annotation_train_combined.odgt'
         if USE_SMALL_ANNOTATION_FILE:
             annotation_file = './data/2.5vrd/' + small_annotation_file
+        subset_indices_file = TRAIN_SUBSET_INDICES
     elif image_set == 'valid':
         annotation_file = './data/2.5vrd/annotation_valid_combined.odgt'
         if USE_SMALL_VALID_ANNOTATION_FILE:
             annotation_file = './data/2.5vrd/' + small_valid_annotation_file
+        subset_indices_file = VALID_SUBSET_INDICES
     elif image_set == 'test':
         annotation_file = './data/2.5vrd/annotation_test_combined.odgt'
         if USE_SMALL_TEST_ANNOTATION_FILE:
             annotation_file = './data/2.5vrd/' + small_test_annotation_file
+        subset_indices_file = TEST_SUBSET_INDICES
     else:
         raise Exception()
+    subset_indices = None
+    if subset_indices_file is not None:
+        subset_indices = load_index_list(subset_indices_file)
+    # One scale per batch rather than per image for multi-scale training
+    # (BatchTransforms draw it themselves)
+    batch_scale = None
+    if BATCH_SCALE_SAMPLING and image_set == 'train' and not DEACTIVATE_EXTRA_TRANSFORMS:
+        batch_scale = BatchScale([800] if GPU_MEMORY_PRESSURE_TEST else
+                                 [480, 512, 544, 576, 608, 640, 672, 704, 736, 768, 800])
+    transforms = make_hico_transforms(image_set, test_scale, batch_scale)
+    batch_transforms = None
+    if image_set in BATCHED_AUGMENTATION_SPLITS:
+        transforms = ToUint8Tensor()
+        batch_transforms = make_hico_batch_transforms(image_set, test_scale)
+        batch_scale = None
     dataset = two_point_five_VRD(root='./data/2.5vrd',
                                  annFile=annotation_file,
                                  image_set = image_set,
-                                 transforms=make_hico_transforms(image_set, test_scale))
+                                 transforms=transforms,
+                                 image_shard_dir=IMAGE_SHARD_DIR,
+                                 batch_transforms=batch_transforms,
+                                 subset_indices=subset_indices,
+                                 decode_size=largest_resize(image_set, test_scale) if REDUCED_RESOLUTION_DECODE else None,
+                                 batch_scale=batch_scale,
+                                 shared_state=SHARED_MEMORY_STATE)
+    if FIXED_SHAPE_PADDING:
+        # A few canonical padded shapes fitted to the sizes the images are
+        # resized to
+        dataset.set_padding_buckets(PaddingBuckets.fit(resized_sizes(dataset.image_sizes(), image_set, test_scale),
+                                                       PADDING_BUCKETS_PER_SIDE))
     return dataset
 
 
@@ -16,6 +16,7 @@ import PIL
 import torchvision.transforms as T
 import torchvision.transforms.functional as F
 from util.box_ops import box_xyxy_to_cxcywh
+from datasets.annotation_reader import IndexedOdgtReader
 from PIL import Image
 
 
@@ -539,7 +540,8 @@ def make_hico_transforms(image_set, test_scale=-1):
 class HoiDetection(VisionDataset):
     def __init__(self, root, annFile, transform=None, target_transform=None, transforms=None):
         super(HoiDetection, self).__init__(root, transforms, transform, target_transform)
-        self.annotations = [parse_one_gt_line(l.strip()) for l in open(annFile, 'r').readlines()]
+        # Lines are indexed once and parsed when read
+        self.annotations = IndexedOdgtReader(annFile, parse_one_gt_line)
         self.transforms = transforms
 
     def __getitem__(self, index):
@@ -8,6 +8,7 @@
 """
 Train functions used in main.py
 """
+import collections
 import gc
 import math
 import os
@@ -23,8 +24,6 @@ from evaluation import *
 import pandas as pd
 from util.misc import is_main_process
 import torch.distributed as dist
-from models.position_encoding import build_position_encoding
-from torch import nn
 from util.misc import (NestedTensor, nested_tensor_from_tensor_list,
                        accuracy, get_world_size, interpolate,
                        is_dist_avail_and_initialized)
@@ -53,9 +52,11 @@ def progressBar(i, max, text):
 def train_one_epoch(args, writer, model: torch.nn.Module, criterion: torch.nn.Module, optimal_transport: torch.nn.Module,
                     data_loader: Iterable, optimizer: torch.optim.Optimizer,
                     device: torch.device, epoch: int, max_norm: float = 0,
-                    use_optimal_transport=False, lr_scheduler=None):
+                    use_optimal_transport=False, lr_scheduler=None, hard_example_sampler=None):
     """
     Train the model for one epoch.
+    :param hard_example_sampler: HardExampleSampler of data_loader, which
+        the loss of every image is recorded for (HARD_EXAMPLE_SAMPLING).
     """
     model.train()
     criterion.train()
@@ -99,6 +100,12 @@ def train_one_epoch(args, writer, model: torch.nn.Module, criterion: torch.nn.Mo
     metric_logger.add_meter('class_error_occlusion', utils.SmoothedValue(window_size=1, fmt='{value:.2f}'))
     header = 'Epoch: [{}]'.format(epoch)
     print_freq = 10
+    # Number of batches of every padded (height, width), see
+    # FIXED_SHAPE_PADDING
+    padded_shapes = collections.Counter()
+    # Padding is only measured if batches are built to reduce it
+    measure_padding = BUCKETED_BATCH_SAMPLER or BATCH_SCALE_SAMPLING or FIXED_SHAPE_PADDING
+    padded_pixels, total_pixels, padded_area = 0, 0, 0
 
     for samples, depth, targets in metric_logger.log_every(data_loader, print_freq, header):
 
@@ -148,38 +155,43 @@ def train_one_epoch(args, writer, model: torch.nn.Module, criterion: torch.nn.Mo
         # image_id and num_bounding_boxes_in_ground_truth
         original_targets = targets
 
-        # move tensors in the samples and targets to GPU and abandon objects
-        # that cannot be moved to GPU
+        # Padded pixels (see BUCKETED_BATCH_SAMPLER) and area of the padded
+        # batch (see BATCH_SCALE_SAMPLING), summed on the device of the mask
+        # (the CPU, samples are not moved yet) and read once per epoch, so
+        # that no iteration waits for them
+        if measure_padding:
+            padded_pixels = padded_pixels + samples.mask.sum()
+            total_pixels += samples.mask.numel()
+            padded_area += samples.mask.shape[-2] * samples.mask.shape[-1]
+        if FIXED_SHAPE_PADDING:
+            padded_shapes[tuple(samples.mask.shape[-2:])] += 1
+
+        # move tensors in the samples and targets to GPU (TargetBatch keeps
+        # image_id and num_bounding_boxes_in_ground_truth as they are)
         samples = samples.to(device)
-        targets = [{k: v.to(device) for k, v in t.items() if k not in ['image_id', 'num_bounding_boxes_in_ground_truth']} for t in targets]
+        targets = targets.to(device)
 
-        # Prepare depth or delete depth
+        # Depth maps come pooled to the stride of the backbone features (see
+        # util.misc.pool_depth_list), the model encodes their positions. depth
+        # is None if the dataset does not load it
         if USE_DEPTH_DURING_TRAINING:
-            depth.tensors = depth.tensors[:, 0:1]
             depth = depth.to(device)
-            with torch.no_grad():
-                if isinstance(depth, (list, torch.Tensor)):
-                    depth = nested_tensor_from_tensor_list(depth)
-                m = nn.MaxPool2d(32, stride=32, ceil_mode=True)
-                depth.tensors = m(depth.tensors)
-                depth.mask = (m(depth.mask.type(torch.float))).type(torch.bool)
-                PE = build_position_encoding(args)
-                pos_depth = PE(depth)
         else:
-            pos_depth = None
-            del depth.tensors
-            del depth.mask
-            del depth
-            gc.collect()
+            depth = None
 
         # Forward pass
-        outputs = model(samples, pos_depth=pos_depth, writer=writer)
+        outputs = model(samples, depth=depth, writer=writer)
 
         # Compute losses using outputs (after matching targets using the
         # Hungarian algorithm or optimal transport)
         loss_dict = criterion(outputs, targets, optimal_transport=optimal_transport)
         weight_dict = criterion.weight_dict
 
+        # Record the loss of every image for the next epochs
+        if hard_example_sampler is not None:
+            hard_example_sampler.record([str(image_id) for image_id in original_targets.images['image_id']],
+                                        criterion.per_image_losses(outputs, targets))
+
         # Sum up weighted losses in the loss dictionary
         losses = sum(loss_dict[k] * weight_dict[k] for k in loss_dict.keys() if k in weight_dict)
 
@@ -265,9 +277,20 @@ def train_one_epoch(args, writer, model: torch.nn.Module, criterion: torch.nn.Mo
 
     # gather stats from all processes
     metric_logger.synchronize_between_processes()
+    if hard_example_sampler is not None:
+        hard_example_sampler.update(device)
     print("Averaged stats:", metric_logger)
 
     train_stats = {k: meter.global_avg for k, meter in metric_logger.meters.items()}
+    # Distribution of the padded shapes of this process (see
+    # FIXED_SHAPE_PADDING), fewer shapes let compiled models and the CUDA
+    # caching allocator reuse more
+    if FIXED_SHAPE_PADDING:
+        if is_main_process():
+            print('Padded shapes: {} distinct, most common: {}'.format(
+                len(padded_shapes),
+                ', '.join('{}x{} ({})'.format(h, w, n) for (h, w), n in padded_shapes.most_common(5))))
+        train_stats['padded_shapes'] = {'{}x{}'.format(h, w): n for (h, w), n in padded_shapes.most_common()}
 
     # Write loss and lr to tensorboard at the end of each epoch
     writer.add_scalar('Loss_train_unscaled/1_ce_objects', objects_loss_ce_unscaled / len(data_loader), epoch)
@@ -278,6 +301,15 @@ def train_one_epoch(args, writer, model: torch.nn.Module, criterion: torch.nn.Mo
     writer.add_scalar('Misc_train/lr', train_stats['lr'], epoch)
     writer.add_scalar('Misc_train/error_distance', train_stats['class_error_action'], epoch)
     writer.add_scalar('Misc_train/error_occlusion', train_stats['class_error_occlusion'], epoch)
+    if measure_padding:
+        # Fraction of the pixels of the batches of this process that are
+        # padding, and average area of these batches
+        train_stats['padded_pixels'] = float(padded_pixels) / max(total_pixels, 1)
+        train_stats['padded_area'] = padded_area / max(len(data_loader), 1)
+        writer.add_scalar('Misc_train/padded_pixels', train_stats['padded_pixels'], epoch)
+        writer.add_scalar('Misc_train/padded_area', train_stats['padded_area'], epoch)
+    if FIXED_SHAPE_PADDING:
+        writer.add_scalar('Misc_train/num_padded_shapes', len(padded_shapes), epoch)
 
 
     torch.cuda.empty_cache()
@@ -316,31 +348,18 @@ def validate(args, writer, valid_or_test, model: torch.nn.Module, criterion: tor
     for samples, depth, targets in data_loader:
 
         samples = samples.to(device)
-        targets = [
-            {k: v.to(device) for k, v in t.items() if k not in ['image_id', 'num_bounding_boxes_in_ground_truth']} for
-            t in targets]
+        targets = targets.to(device)
 
-        # Prepare depth or delete depth
+        # Depth maps come pooled to the stride of the backbone features (see
+        # util.misc.pool_depth_list), the model encodes their positions. depth
+        # is None if the dataset does not load it
         if USE_DEPTH_DURING_INFERENCE:
-            depth.tensors = depth.tensors[:, 0:1]
             depth = depth.to(device)
-            with torch.no_grad():
-                if isinstance(depth, (list, torch.Tensor)):
-                    depth = nested_tensor_from_tensor_list(depth)
-                PE = build_position_encoding(args)
-                m = nn.MaxPool2d(32, stride=32, ceil_mode=True)
-                depth.tensors = m(depth.tensors)
-                depth.mask = (m(depth.mask.type(torch.float))).type(torch.bool)
-                pos_depth = PE(depth)
         else:
-            pos_depth = None
-            del depth.tensors
-            del depth.mask
-            del depth
-            gc.collect()
+            depth = None
 
         # Forward pass
-        outputs = model(samples, pos_depth)
+        outputs = model(samples, depth=depth)
 
         # Compute Losses
         loss_dict = criterion(outputs, targets, training=False)
@@ -452,27 +471,16 @@ def generate_evaluation_outputs(args, valid_or_test, model: torch.nn.Module, cri
         original_targets = targets
         samples = samples.to(device)
 
-        # Prepare depth or delete depth
+        # Depth maps come pooled to the stride of the backbone features (see
+        # util.misc.pool_depth_list), the model encodes their positions. depth
+        # is None if the dataset does not load it
         if USE_DEPTH_DURING_INFERENCE:
-            depth.tensors = depth.tensors[:, 0:1]
             depth = depth.to(device)
-            with torch.no_grad():
-                if isinstance(depth, (list, torch.Tensor)):
-                    depth = nested_tensor_from_tensor_list(depth)
-                PE = build_position_encoding(args)
-                m = nn.MaxPool2d(32, stride=32, ceil_mode=True)
-                depth.tensors = m(depth.tensors)
-                depth.mask = (m(depth.mask.type(torch.float))).type(torch.bool)
-                pos_depth = PE(depth)
         else:
-            pos_depth = None
-            del depth.tensors
-            del depth.mask
-            del depth
-            gc.collect()
+            depth = None
 
         # Forward pass
-        outputs = model(samples, pos_depth)
+        outputs = model(samples, depth=depth, prune_queries=True)
 
         # Construct Evaluation Outputs for all images in current batch
         hoi_list = generate_hoi_list_using_model_outputs(args, outputs, original_targets, filter=True)
@@ -45,6 +45,11 @@ def construct_evaluation_output_using_hoi_list(hoi_list, original_targets,
         if VISUALIZE_ATTENTION_WEIGHTS:
             num_hoi_to_produce = len(hoi_list[i]['hoi_list'])
 
+        # Look up entities of all objects of the current image at once
+        current_hois = hoi_list[i]['hoi_list'][:num_hoi_to_produce]
+        entity_1_of_image = get_label_vocabulary().names_to_entities([hoi['h_name'] for hoi in current_hois])
+        entity_2_of_image = get_label_vocabulary().names_to_entities([hoi['o_name'] for hoi in current_hois])
+
         for j in range(num_hoi_to_produce):
             current_hoi = hoi_list[i]['hoi_list'][j]
 
@@ -52,16 +57,14 @@ def construct_evaluation_output_using_hoi_list(hoi_list, original_targets,
             image_id_2 = current_image_id
 
             # object A name
-            object_A_name = current_hoi['h_name']
-            entity_1 = name_to_entity(object_A_name)
+            entity_1 = entity_1_of_image[j]
 
             # object A box
             xmin_1, ymin_1, xmax_1, ymax_1 = current_hoi['h_box']
             xmin_1, ymin_1, xmax_1, ymax_1 = xmin_1/ww, ymin_1/hh, xmax_1/ww, ymax_1/hh
 
             # object B name
-            object_B_name = current_hoi['o_name']
-            entity_2 = name_to_entity(object_B_name)
+            entity_2 = entity_2_of_image[j]
 
             # object B box
             xmin_2, ymin_2, xmax_2, ymax_2 = current_hoi['o_box']
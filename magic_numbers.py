@@ -9,6 +9,42 @@ sharing_strategy = "file_descriptor"
 
 DEACTIVATE_EXTRA_TRANSFORMS = False
 
+# The 2.5VRD CSV tables are loaded on first access. Set TABLE_CACHE_DIR to a
+# writable folder, e.g. 'data/2.5vrd/cache', to save compact copies of them
+# there and reload those instead of the CSV files ('feather' and 'parquet'
+# need pyarrow, otherwise 'pickle' is used). None always reads the CSV files.
+TABLE_CACHE_DIR = None
+TABLE_CACHE_FORMAT = 'feather'
+# Set ANNOTATION_CACHE_DIR to a writable folder, e.g. 'data/2.5vrd/cache', to
+# save the parsed .odgt annotations there and reload them while the .odgt file
+# is unchanged. None always parses the .odgt files.
+ANNOTATION_CACHE_DIR = None
+# Memory-map the cached annotations copy-on-write instead of reading them into
+# memory (only if ANNOTATION_CACHE_DIR is not None). The cache folder then has
+# to stay in place, and be readable by every rank, for the whole run
+ANNOTATION_STORE_MMAP = False
+# Index the lines of the .odgt files and parse them only when their items are
+# read (IndexedOdgtReader in datasets/annotation_reader.py), keeping the last
+# ANNOTATION_LRU_SIZE parsed items, instead of parsing the whole file into the
+# annotation store. For very large annotation files, startup and memory then
+# no longer grow with their parsed size.
+INDEXED_ANNOTATION_READER = False
+ANNOTATION_LRU_SIZE = 1024
+# Read images (and depth maps) from the image shards written by
+# tools/build_image_shards.py instead of the image folders, e.g.
+# IMAGE_SHARD_DIR = 'data/2.5vrd/shards'. IMAGE_SHARD_MMAP memory-maps the
+# shards, otherwise they are read with os.pread().
+IMAGE_SHARD_DIR = None
+IMAGE_SHARD_MMAP = True
+# Decode images that are at least twice as large as the transforms resize
+# them to at 1/2, 1/4 or 1/8 of their resolution (cv2.IMREAD_REDUCED_*),
+# whichever is the smallest that is still large enough
+REDUCED_RESOLUTION_DECODE = False
+# Splits ('train', 'valid', 'test') whose augmentation is applied to whole
+# padded batches after collate_fn (BatchTransforms in two_point_five_vrd.py)
+# instead of to every image in the DataLoader workers, e.g. ['train']
+BATCHED_AUGMENTATION_SPLITS = []
+
 # Train on a specific image specified by the index of that image
 TRAIN_ON_ONE_IMAGE = False
 index_of_that_image = 2
@@ -24,6 +60,13 @@ USE_SMALL_TEST_ANNOTATION_FILE = False
 small_test_annotation_file = 'small_test_combined.odgt'
 CUSTOM_TSET_SET = False
 #small_test_annotation_file = 'small_valid_combined_custom.odgt'
+# Or use the lines of the complete annotation file whose indices are listed
+# in a file (one index per line, or a .npy array), e.g.
+# TRAIN_SUBSET_INDICES = 'data/2.5vrd/small_train_indices.txt'. None uses
+# all lines.
+TRAIN_SUBSET_INDICES = None
+VALID_SUBSET_INDICES = None
+TEST_SUBSET_INDICES = None
 
 # Disable shuffle or not. Useful for debugging.
 USE_SEQUENTIAL_LOADER = False
@@ -74,9 +117,53 @@ BG_COEF = 0.0
 
 # Persistent worker for dataloader_train when num_workers > 0
 PERSISTENT_WORKERS=True
+# Publish the annotation arrays, label vocabulary and image paths of the
+# 2.5VRD datasets once into a shared memory segment (/dev/shm) that the
+# DataLoader workers map, instead of every worker holding a copy
+SHARED_MEMORY_STATE = False
 # num_workers and batch size for the validation and test sets
 num_workers_validation = 8 # 16
 batch_size_validation = 10  # 30
+# JSON profile written by tools/tune_data_loader.py, e.g.
+# 'data_loader_profile.json'. Its number of workers, prefetch factor, memory
+# pinning and sharing strategy then replace --num_workers,
+# num_workers_validation and sharing_strategy in main.py and vrd_test.py
+DATA_LOADER_PROFILE = None
+# collate_fn pads images into reusable buffers if it runs in the main process
+# (num_workers == 0). Pinned batches (to speed up copies to the GPU) are
+# allocated by the caching host allocator of CUDA instead of being pooled
+PIN_COLLATE_BUFFERS = False
+# Batch images of the same orientation and similar aspect ratio together
+# (AspectRatioBatchSampler in datasets/samplers.py) to reduce padding, with
+# ASPECT_RATIO_BINS aspect ratio bins per orientation
+BUCKETED_BATCH_SAMPLER = False
+ASPECT_RATIO_BINS = 3
+# Resize all training images of a batch to the same random scale
+# (ScaleBatchSampler in datasets/samplers.py, or BatchTransforms) instead of
+# a random scale per image, so that batches are not padded to the largest
+# scale. Combine with BUCKETED_BATCH_SAMPLER to also match aspect ratios
+BATCH_SCALE_SAMPLING = False
+# Train on HARD_EXAMPLE_BUDGET of the training images per epoch, drawn with
+# probabilities proportional to their loss in earlier epochs, mixed with
+# HARD_EXAMPLE_UNIFORM_MIX uniform probabilities (HardExampleSampler in
+# datasets/samplers.py). Not combined with BUCKETED_BATCH_SAMPLER
+HARD_EXAMPLE_SAMPLING = False
+HARD_EXAMPLE_BUDGET = 0.5
+HARD_EXAMPLE_UNIFORM_MIX = 0.2
+# Pad batches to one of PADDING_BUCKETS_PER_SIDE x PADDING_BUCKETS_PER_SIDE
+# canonical shapes (multiples of 32, fitted to the resized image sizes of
+# the split, see PaddingBuckets in util/misc.py) instead of to their largest
+# image, so that traced or compiled models and the CUDA caching allocator
+# see few distinct shapes. More buckets pad less but give more shapes
+FIXED_SHAPE_PADDING = False
+PADDING_BUCKETS_PER_SIDE = 4
+# Assemble the sine position embeddings of the feature maps (and of the
+# depth maps) from cached embeddings of every valid height and width
+# (CachedPositionEmbeddingSine in models/position_encoding.py) instead of
+# computing them for every batch. POSITION_EMBEDDING_CACHE_SIZE embeddings of
+# whole feature maps are kept
+CACHED_POSITION_EMBEDDING = False
+POSITION_EMBEDDING_CACHE_SIZE = 64
 
 # Uses the maximum resolution, instead of randomly select from scales,
 # to test if GPU memory is enough for training
@@ -87,6 +174,36 @@ VISUALIZE_ATTENTION_WEIGHTS = False
 
 # Cascade Decoders
 CASCADE = True
+# Run the distance and occlusion decoders as one decoder whose layers are
+# stacked along a group dimension (batched matmuls and one attention call
+# for both, see Transformer.fused_cascade_decoders in models/transformer.py),
+# if they have the same number of layers. Same parameters and outputs as
+# running them one after the other
+FUSED_CASCADE_DECODERS = False
+# When generating predictions (generate_evaluation_outputs(), not in
+# training or validate()), run the distance and occlusion decoders and the
+# relation heads only on the queries of the pair decoder that are most likely
+# human and object pairs (product of the largest non-background human and object
+# scores): the QUERY_PRUNING_TOP_K best of every image, and all those
+# scored at least QUERY_PRUNING_THRESHOLD (if not None). The other queries
+# are predicted as background, which drops them from the predictions. An
+# approximation, since the kept queries no longer attend to the others in
+# the cascade decoders
+QUERY_PRUNING = False
+QUERY_PRUNING_TOP_K = 20
+QUERY_PRUNING_THRESHOLD = None
+# Compute the attention of the encoder and decoder layers with
+# F.scaled_dot_product_attention (fused kernels, batch-first) from the
+# parameters of their nn.MultiheadAttention, so checkpoints load unchanged.
+# Attention weights are then only computed when something captures them
+# (VISUALIZE_ATTENTION_WEIGHTS, or TransformerDecoderLayer.register_attention_hook())
+SDPA_ATTENTION = False
+# Run the encoder on the valid (non-padding) tokens of every image, moved
+# to the front of its sequence, and the sequences cut to the longest image
+# (see TransformerEncoder.sparse_forward). Same outputs at valid tokens;
+# the encoder output (memory) is 0 at the padding it skips, which the
+# decoders mask
+SPARSE_ENCODER = False
 # Add depth to positional encodings
 USE_DEPTH_DURING_TRAINING = False
 USE_DEPTH_DURING_INFERENCE = False
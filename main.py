@@ -20,6 +20,8 @@ from torch.utils.data import DataLoader, DistributedSampler
 
 import util.misc as utils
 from datasets import build_dataset
+from datasets.samplers import AspectRatioBatchSampler, ScaleBatchSampler, HardExampleSampler
+from datasets.loader_profile import load_data_loader_profile, data_loader_options
 from engine import *
 from models import build_model
 
@@ -238,37 +240,69 @@ def main(args):
         sampler_train = torch.utils.data.RandomSampler(dataset_train)
         sampler_valid = torch.utils.data.RandomSampler(dataset_valid)
         #sampler_test = torch.utils.data.RandomSampler(dataset_test)
+    hard_example_sampler = None
+    if HARD_EXAMPLE_SAMPLING:
+        # A part of the training images per epoch, favouring those with high
+        # loss, split among processes like DistributedSampler does
+        assert not BUCKETED_BATCH_SAMPLER, 'HARD_EXAMPLE_SAMPLING replaces the sampler of the training set'
+        hard_example_sampler = HardExampleSampler(dataset_train.image_ids(), budget=HARD_EXAMPLE_BUDGET,
+                                                  uniform_mix=HARD_EXAMPLE_UNIFORM_MIX, seed=args.seed)
+        sampler_train = hard_example_sampler
     batch_sampler_train = torch.utils.data.BatchSampler(sampler_train,
                                                         args.batch_size,
                                                         drop_last=True)
+    if BUCKETED_BATCH_SAMPLER:
+        # Batches of similar aspect ratio, split among processes like
+        # DistributedSampler does (the world size is 1 if not distributed)
+        sampler_train = AspectRatioBatchSampler(dataset_train.image_sizes(), args.batch_size,
+                                                shuffle=True, drop_last=True, seed=args.seed,
+                                                num_bins=ASPECT_RATIO_BINS)
+        batch_sampler_train = sampler_train
+    batch_scale = getattr(dataset_train, 'batch_scale', None)
+    if batch_scale is not None:
+        # One scale per batch (BATCH_SCALE_SAMPLING), set_epoch() is passed
+        # on to the wrapped samplers
+        sampler_train = ScaleBatchSampler(batch_sampler_train, batch_scale.scales, seed=args.seed)
+        batch_sampler_train = sampler_train
+
+    # Workers, prefetch factor and pinning tuned by tools/tune_data_loader.py
+    # (DATA_LOADER_PROFILE), or --num_workers and num_workers_validation
+    loader_profile = load_data_loader_profile(DATA_LOADER_PROFILE)
+    train_loader_options = data_loader_options(loader_profile, 'train', args.num_workers)
+    valid_loader_options = data_loader_options(loader_profile, 'valid', num_workers_validation)
+    strategy = loader_profile.get('sharing_strategy', sharing_strategy)
 
     # This partially addresses the EOF Error
-    torch.multiprocessing.set_sharing_strategy(sharing_strategy)
+    torch.multiprocessing.set_sharing_strategy(strategy)
 
     def set_worker_sharing_strategy(worker_id: int) -> None:
-        torch.multiprocessing.set_sharing_strategy(sharing_strategy)
+        torch.multiprocessing.set_sharing_strategy(strategy)
 
     data_loader_train = DataLoader(dataset_train,
                                    batch_sampler=batch_sampler_train,
-                                   collate_fn=utils.collate_fn,
-                                   num_workers=args.num_workers,
+                                   collate_fn=utils.build_collate_fn(dataset_train),
                                    worker_init_fn=set_worker_sharing_strategy,
-                                   persistent_workers=(PERSISTENT_WORKERS and (args.num_workers > 0)))
+                                   persistent_workers=(PERSISTENT_WORKERS and (train_loader_options['num_workers'] > 0)),
+                                   **train_loader_options)
 
     # (For debugging purpose) create a sequential sampler
     sequential_data_loader_train = DataLoader(dataset_train,
                                               args.batch_size,
-                                              collate_fn=utils.collate_fn,
+                                              collate_fn=utils.build_collate_fn(dataset_train),
                                               num_workers=args.num_workers)
     # Construct batch samplers and data loaders for validation and test sets
     batch_sampler_valid = torch.utils.data.BatchSampler(sampler_valid,
                                                         batch_size_validation,
                                                         drop_last=False)
+    if BUCKETED_BATCH_SAMPLER:
+        batch_sampler_valid = AspectRatioBatchSampler(dataset_valid.image_sizes(), batch_size_validation,
+                                                      shuffle=True, drop_last=False, seed=args.seed,
+                                                      num_bins=ASPECT_RATIO_BINS)
     data_loader_valid = DataLoader(dataset_valid,
                                    batch_sampler=batch_sampler_valid,
-                                   collate_fn=utils.collate_fn,
-                                   num_workers=num_workers_validation,
-                                   worker_init_fn=set_worker_sharing_strategy)
+                                   collate_fn=utils.build_collate_fn(dataset_valid),
+                                   worker_init_fn=set_worker_sharing_strategy,
+                                   **valid_loader_options)
 
     # Load from pretrained DETR model.
     if args.num_queries == 100 and args.enc_layers == 6 and args.dec_layers == 6:
@@ -307,6 +341,8 @@ def main(args):
             if not args.manual_lr_change and not args.manual_lr_backbone_change:
                 lr_scheduler.load_state_dict(checkpoint['lr_scheduler'])
             args.start_epoch = checkpoint['epoch'] + 1
+        if hard_example_sampler is not None and 'hard_example_sampler' in checkpoint:
+            hard_example_sampler.load_state_dict(checkpoint['hard_example_sampler'])
         if args.manual_lr_change:
             optimizer.param_groups[0]['lr'] = args.manual_lr_change
             print('Changed lr to', args.manual_lr_change)
@@ -327,7 +363,7 @@ def main(args):
     start_time = time.time()
 
     for epoch in range(args.start_epoch, args.epochs):
-        if args.distributed:
+        if args.distributed or BUCKETED_BATCH_SAMPLER or batch_scale is not None or HARD_EXAMPLE_SAMPLING:
             sampler_train.set_epoch(epoch)
         if epoch == 0 and not USE_SMALL_VALID_ANNOTATION_FILE and not USE_SMALL_ANNOTATION_FILE and not GPU_MEMORY_PRESSURE_TEST:
             # Validate before training
@@ -343,7 +379,8 @@ def main(args):
                                       optimizer, device, epoch,
                                       args.clip_max_norm,
                                       use_optimal_transport=USE_OPTIMAL_TRANSPORT,
-                                      lr_scheduler = lr_scheduler)
+                                      lr_scheduler = lr_scheduler,
+                                      hard_example_sampler=hard_example_sampler)
         lr_scheduler.step()
 
         # Validate
@@ -365,14 +402,17 @@ def main(args):
                 checkpoint_paths.append(output_dir / f'checkpoint{epoch:04}.pth')
             if (epoch + 1) > args.lr_drop and (epoch + 1) % 10 == 0:
                 checkpoint_paths.append(output_dir / f'checkpoint{epoch:04}.pth')
+            checkpoint = {
+                'model': model_without_ddp.state_dict(),
+                'optimizer': optimizer.state_dict(),
+                'lr_scheduler': lr_scheduler.state_dict(),
+                'epoch': epoch,
+                'args': args,
+            }
+            if hard_example_sampler is not None:
+                checkpoint['hard_example_sampler'] = hard_example_sampler.state_dict()
             for checkpoint_path in checkpoint_paths:
-                utils.save_on_master({
-                    'model': model_without_ddp.state_dict(),
-                    'optimizer': optimizer.state_dict(),
-                    'lr_scheduler': lr_scheduler.state_dict(),
-                    'epoch': epoch,
-                    'args': args,
-                }, checkpoint_path)
+                utils.save_on_master(checkpoint, checkpoint_path)
 
         log_stats = {**{f'train_{k}': v for k, v in train_stats.items()},
                      'epoch': epoch,
@@ -14,6 +14,7 @@ from torch import nn
 from magic_numbers import *
 
 from util.box_ops import box_cxcywh_to_xyxy, generalized_box_iou
+from util.misc import cat_targets, target_sizes
 
 
 class HungarianMatcher(nn.Module):
@@ -71,12 +72,12 @@ class HungarianMatcher(nn.Module):
 
 
         # Also concat the target labels and boxes
-        human_tgt_ids = torch.cat([v["human_labels"] for v in targets])
-        human_tgt_box = torch.cat([v["human_boxes"] for v in targets])
-        object_tgt_ids = torch.cat([v["object_labels"] for v in targets])
-        object_tgt_box = torch.cat([v["object_boxes"] for v in targets])
-        action_tgt_ids = torch.cat([v["action_labels"] for v in targets])
-        occlusion_tgt_ids = torch.cat([v["occlusion_labels"] for v in targets])
+        human_tgt_ids = cat_targets(targets, "human_labels")
+        human_tgt_box = cat_targets(targets, "human_boxes")
+        object_tgt_ids = cat_targets(targets, "object_labels")
+        object_tgt_box = cat_targets(targets, "object_boxes")
+        action_tgt_ids = cat_targets(targets, "action_labels")
+        occlusion_tgt_ids = cat_targets(targets, "occlusion_labels")
 
         # Compute the classification cost. Contrary to the loss, we don't use the NLL,
         # but approximate it in 1 - proba[target class].
@@ -108,7 +109,7 @@ class HungarianMatcher(nn.Module):
 
         if (not DO_NOT_PREDICT_INTERSECTION_BOX_IF_NO_INTERSECTION) and ("intersection_pred_boxes" in outputs):
             intersection_out_bbox = outputs["intersection_pred_boxes"].flatten(0, 1)  # [bs * num_queries, 4]
-            intersection_tgt_box = torch.cat([v["intersection_boxes"] for v in targets])
+            intersection_tgt_box = cat_targets(targets, "intersection_boxes")
             intersection_cost_bbox = torch.cdist(intersection_out_bbox, intersection_tgt_box, p=1)
             intersection_cost_giou = -generalized_box_iou(box_cxcywh_to_xyxy(intersection_out_bbox),
                                                           box_cxcywh_to_xyxy(intersection_tgt_box))
@@ -121,7 +122,7 @@ class HungarianMatcher(nn.Module):
 
         C = C.view(bs, num_queries, -1).cpu()
 
-        sizes = [len(v["human_boxes"]) for v in targets]
+        sizes = target_sizes(targets)
         indices = [linear_sum_assignment(c[i]) for i, c in enumerate(C.split(sizes, -1))]
 
         result = [(torch.as_tensor(i, dtype=torch.int64), torch.as_tensor(j, dtype=torch.int64)) for i, j in indices]
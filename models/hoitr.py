@@ -17,11 +17,13 @@ from torch import nn
 from util import box_ops
 from util.misc import (NestedTensor, nested_tensor_from_tensor_list,
                        accuracy, get_world_size, interpolate,
-                       is_dist_avail_and_initialized)
+                       is_dist_avail_and_initialized, target_sizes,
+                       matched_targets, stacked_targets)
 
 from .backbone import build_backbone
 from .hoi_matcher import build_matcher as build_hoi_matcher
 from .transformer import build_transformer
+from .position_encoding import build_position_encoding
 
 from magic_numbers import *
 
@@ -30,12 +32,16 @@ import temp_vars
 # This will be modified by build() if train on 2.5vrd
 num_humans = 2
 
+# Relation logits of the classes other than background of the queries left
+# out by query pruning (see HoiTR.select_queries())
+PRUNED_QUERY_LOGIT = -1e4
+
 
 class HoiTR(nn.Module):
     """ This is the DETR module that performs object detection """
 
     def __init__(self, backbone, transformer, num_classes, num_actions,
-                 num_queries, aux_loss=False):
+                 num_queries, aux_loss=False, depth_position_embedding=None):
         """ Initializes the model.
         Parameters:
             backbone: torch module of the backbone to be used. See backbone.py
@@ -47,6 +53,9 @@ class HoiTR(nn.Module):
                 For COCO, we recommend 100 queries.
             aux_loss: True if auxiliary decoding losses (loss at each decoder
                 layer) are to be used.
+            depth_position_embedding: positional encoding of the pooled depth
+                maps passed to forward() (see build_position_encoding), or
+                None if depth is not used.
         """
         super().__init__()
         self.num_queries = num_queries
@@ -69,13 +78,53 @@ class HoiTR(nn.Module):
         self.occlusion_cls_embed = nn.Linear(hidden_dim, num_actions + 1)
         if PREDICT_INTERSECTION_BOX:
             self.intersection_box_embed = MLP(hidden_dim, hidden_dim, 4, 3)
-
-    def forward(self, samples: NestedTensor, pos_depth=None, writer=None):
+        # Built once rather than for every batch, and never trained. Its
+        # parameters (with the 'learned' encoding) become non-persistent
+        # buffers, so checkpoints have no keys of it and load either way
+        self.depth_position_embedding = depth_position_embedding
+        if depth_position_embedding is not None:
+            for module in depth_position_embedding.modules():
+                for name, parameter in list(module.named_parameters(recurse=False)):
+                    delattr(module, name)
+                    module.register_buffer(name, parameter.detach(), persistent=False)
+        # Queries kept for the cascade decoders by forward(prune_queries=True),
+        # None to keep all (see select_queries())
+        self.query_pruning_top_k = QUERY_PRUNING_TOP_K if QUERY_PRUNING else None
+        self.query_pruning_threshold = QUERY_PRUNING_THRESHOLD
+
+    def select_queries(self, pair_outputs):
+        """
+        Query pruning: the queries of the pair decoder the cascade decoders run
+        on, those most likely to be a human and object pair.
+        :param pair_outputs: [BS, num_queries, hidden_dim] output of the last
+            layer of the pair decoder.
+        :return: [BS, K] sorted indices of the queries of every image with the
+            highest product of the largest non-background human and object
+            scores: the query_pruning_top_k best, or as many as the image with
+            the most scored at least query_pruning_threshold.
+        """
+        human_scores = self.human_cls_embed(pair_outputs).softmax(-1)[..., :-1].max(-1)[0]
+        object_scores = self.object_cls_embed(pair_outputs).softmax(-1)[..., :-1].max(-1)[0]
+        scores = human_scores * object_scores
+        num_kept = self.query_pruning_top_k
+        if self.query_pruning_threshold is not None:
+            num_kept = max(num_kept, int((scores >= self.query_pruning_threshold).sum(1).max()))
+        num_kept = min(num_kept, scores.shape[1])
+        return scores.topk(num_kept, dim=1)[1].sort(dim=1)[0]
+
+    def forward(self, samples: NestedTensor, pos_depth=None, writer=None, depth=None, prune_queries=False):
         """ The forward expects a NestedTensor, which consists of:
                - samples.tensor: batched images, of shape
                     [batch_size x 3 x H x W]
                - samples.mask: a binary mask of shape [batch_size x H x W],
                     containing 1 on padded pixels
+            depth is a NestedTensor of the depth maps max-pooled to the
+            stride of the backbone features (see util.misc.pool_depth), whose
+            positional encoding is added to that of the features unless
+            pos_depth gives it already. With prune_queries, the cascade
+            decoders run only on the queries of select_queries() (if
+            query_pruning_top_k is not None) and the others are predicted as
+            background, so it is for predictions only, not losses.
 
             It returns a dict with the following elements:
                - "pred_logits": the classification logits (including no-object)
@@ -101,6 +150,11 @@ class HoiTR(nn.Module):
         src, mask = features[-1].decompose()
         assert mask is not None
 
+        if pos_depth is None and depth is not None:
+            assert self.depth_position_embedding is not None, 'depth given to a model built without depth'
+            with torch.no_grad():
+                pos_depth = self.depth_position_embedding(depth)
+
         if pos_depth is not None:
             # Make sure shape of encoded depth is the same as that of positional encoding
             assert pos[-1].shape == pos_depth.shape
@@ -134,18 +188,20 @@ class HoiTR(nn.Module):
 
         # Forward pass through transformer encoder rand decoders
         if CASCADE:
+            # Query pruning: the cascade decoders run on kept_queries only
+            prune_queries = prune_queries and self.query_pruning_top_k is not None and \
+                not VISUALIZE_ATTENTION_WEIGHTS
+            transformer_outputs = self.transformer(self.input_proj(src), mask,
+                                                   self.query_embed.weight,
+                                                   pos[-1],
+                                                   writer=writer,
+                                                   select_queries=self.select_queries if prune_queries else None)
+            kept_queries = transformer_outputs[-1] if prune_queries else None
             if IMPROVE_INTERMEDIATE_LAYERS:
                 hs, distance_decoder_out, occlusion_decoder_out, human_outputs_coord, object_outputs_coord = \
-                    self.transformer(self.input_proj(src), mask,
-                                     self.query_embed.weight,
-                                     pos[-1],
-                                     writer=writer)[:5]
+                    transformer_outputs[:5]
             else:
-                hs, distance_decoder_out, occlusion_decoder_out = \
-                    self.transformer(self.input_proj(src), mask,
-                                     self.query_embed.weight,
-                                     pos[-1],
-                                     writer=writer)[:3]
+                hs, distance_decoder_out, occlusion_decoder_out = transformer_outputs[:3]
         else:
             if IMPROVE_INTERMEDIATE_LAYERS:
                 hs, human_outputs_coord, object_outputs_coord = \
@@ -175,6 +231,18 @@ class HoiTR(nn.Module):
             occlusion_outputs_class = self.occlusion_cls_embed(occlusion_decoder_out)
             if PREDICT_INTERSECTION_BOX:
                 intersection_outputs_coord = self.intersection_box_embed(occlusion_decoder_out).sigmoid()
+            if kept_queries is not None:
+                # The other queries are background
+                background = torch.full((action_outputs_class.shape[-1],), PRUNED_QUERY_LOGIT,
+                                        device=kept_queries.device)
+                background[-1] = 0
+                action_outputs_class = scatter_queries(action_outputs_class, kept_queries, self.num_queries,
+                                                       background)
+                occlusion_outputs_class = scatter_queries(occlusion_outputs_class, kept_queries, self.num_queries,
+                                                          background)
+                if PREDICT_INTERSECTION_BOX:
+                    intersection_outputs_coord = scatter_queries(intersection_outputs_coord, kept_queries,
+                                                                 self.num_queries, 0)
         else:
             action_outputs_class = self.action_cls_embed(hs)
             occlusion_outputs_class = self.occlusion_cls_embed(hs)
@@ -297,6 +365,20 @@ class HoiTR(nn.Module):
             )]
 
 
+def scatter_queries(values, kept_queries, num_queries, fill):
+    """
+    :param values: [num_layers, BS, K, C] outputs of the queries kept_queries
+        [BS, K] of every image.
+    :param fill: value of the other queries, a number or [C].
+    :return: [num_layers, BS, num_queries, C] outputs of all queries.
+    """
+    num_layers, batch_size, _, num_channels = values.shape
+    out = values.new_empty((num_layers, batch_size, num_queries, num_channels))
+    out[:] = fill
+    index = kept_queries.view(1, batch_size, -1, 1).expand(num_layers, -1, -1, num_channels)
+    return out.scatter(2, index, values)
+
+
 class SetCriterion(nn.Module):
     """ This class computes the loss for DETR.
     The process happens in two steps:
@@ -328,6 +410,7 @@ class SetCriterion(nn.Module):
         self.weight_dict = weight_dict
         self.eos_coef = eos_coef
         self.losses = losses
+        self.last_indices = None
 
         human_empty_weight = torch.ones(num_humans + 1)
         human_empty_weight[-1] = self.eos_coef
@@ -362,16 +445,12 @@ class SetCriterion(nn.Module):
 
         idx = self._get_src_permutation_idx(indices)
 
-        human_target_classes_o = torch.cat(
-            [t["human_labels"][J] for t, (_, J) in zip(targets, indices)])
-        object_target_classes_o = torch.cat(
-            [t["object_labels"][J] for t, (_, J) in zip(targets, indices)])
-        action_target_classes_o = torch.cat(
-            [t["action_labels"][J] for t, (_, J) in zip(targets, indices)])
-        occlusion_target_classes_o = torch.cat(
-            [t["occlusion_labels"][J] for t, (_, J) in zip(targets, indices)])
-        raw_distance_target_classes_o = torch.cat([t["raw_distance_labels"][J] for t, (_, J) in zip(targets, indices)])
-        raw_occlusion_target_classes_o = torch.cat([t["raw_occlusion_labels"][J] for t, (_, J) in zip(targets, indices)])
+        human_target_classes_o = matched_targets(targets, "human_labels", indices)
+        object_target_classes_o = matched_targets(targets, "object_labels", indices)
+        action_target_classes_o = matched_targets(targets, "action_labels", indices)
+        occlusion_target_classes_o = matched_targets(targets, "occlusion_labels", indices)
+        raw_distance_target_classes_o = matched_targets(targets, "raw_distance_labels", indices)
+        raw_occlusion_target_classes_o = matched_targets(targets, "raw_occlusion_labels", indices)
 
         human_target_classes = torch.full(human_src_logits.shape[:2],
                                           num_humans,
@@ -453,7 +532,7 @@ class SetCriterion(nn.Module):
         pred_logits_action = outputs['action_pred_logits']
         device_action = pred_logits_action.device
         tgt_lengths_action = torch.as_tensor(
-            [len(v["action_labels"]) for v in targets], device=device_action)
+            target_sizes(targets), device=device_action)
         # Count the number of predictions that are NOT "no-object"
         # (which is the last class)
         card_pred_action = (
@@ -465,8 +544,7 @@ class SetCriterion(nn.Module):
         pred_logits_occlusion = outputs['occlusion_pred_logits']
         device_occlusion = pred_logits_occlusion.device
         tgt_lengths_occlusion = torch.as_tensor(
-            [len(v["occlusion_labels"]) for v in targets],
-            device=device_occlusion)
+            target_sizes(targets), device=device_occlusion)
         # Count the number of predictions that are NOT "no-object"
         # (which is the last class)
         card_pred_occlusion = (pred_logits_occlusion.argmax(-1) !=
@@ -491,12 +569,9 @@ class SetCriterion(nn.Module):
         idx = self._get_src_permutation_idx(indices)
 
         human_src_boxes = outputs['human_pred_boxes'][idx]
-        human_target_boxes = torch.cat(
-            [t['human_boxes'][i] for t, (_, i) in zip(targets, indices)], dim=0)
+        human_target_boxes = matched_targets(targets, 'human_boxes', indices)
         object_src_boxes = outputs['object_pred_boxes'][idx]
-        object_target_boxes = torch.cat(
-            [t['object_boxes'][i] for t, (_, i) in zip(targets, indices)],
-            dim=0)
+        object_target_boxes = matched_targets(targets, 'object_boxes', indices)
 
 
         human_loss_bbox = F.l1_loss(human_src_boxes, human_target_boxes,
@@ -507,9 +582,7 @@ class SetCriterion(nn.Module):
         num_boxes_intersection = num_boxes
         if PREDICT_INTERSECTION_BOX:
             intersection_src_boxes = outputs['intersection_pred_boxes'][idx]
-            intersection_target_boxes = torch.cat(
-                [t['intersection_boxes'][i] for t, (_, i) in zip(targets, indices)],
-                dim=0)
+            intersection_target_boxes = matched_targets(targets, 'intersection_boxes', indices)
             # do not calculate intersection box loss if no
             # intersection exits in the target
             if DO_NOT_PREDICT_INTERSECTION_BOX_IF_NO_INTERSECTION:
@@ -558,6 +631,51 @@ class SetCriterion(nn.Module):
                 'object_loss_giou']
         return losses
 
+    @torch.no_grad()
+    def per_image_losses(self, outputs, targets, indices=None):
+        """
+        Loss of every image of a batch (e.g. for HardExampleSampler): the
+        weighted classification losses of loss_labels() with hard labels,
+        averaged over the queries of the image, plus the weighted L1 and GIoU
+        losses of the human and object boxes of loss_boxes(), averaged over
+        the relations of the image. Auxiliary outputs are ignored.
+        :param indices: matches of the last layer, those of the last call of
+            forward() by default.
+        :return: (B,) tensor.
+        """
+        if indices is None:
+            indices = self.last_indices
+        idx = self._get_src_permutation_idx(indices)
+        action_src_logits = outputs['action_pred_logits']
+        device = action_src_logits.device
+        losses = torch.zeros(action_src_logits.shape[0], device=device)
+
+        heads = [('human', num_humans, self.human_empty_weight, 1),
+                 ('object', self.num_classes, self.object_empty_weight, 1),
+                 ('action', self.num_actions, self.action_empty_weight, 2),
+                 ('occlusion', self.num_actions, self.occlusion_empty_weight, 2)]
+        for name, empty_class, empty_weight, factor in heads:
+            src_logits = outputs[name + '_pred_logits']
+            target_classes = torch.full(src_logits.shape[:2], empty_class, dtype=torch.int64, device=device)
+            target_classes[idx] = matched_targets(targets, name + '_labels', indices)
+            loss_ce = F.cross_entropy(src_logits.transpose(1, 2), target_classes, empty_weight, reduction='none')
+            losses += factor * loss_ce.sum(1) / empty_weight[target_classes].sum(1)
+        losses *= self.weight_dict['loss_ce']
+
+        batch_idx = idx[0].to(device)
+        box_losses = torch.zeros_like(losses)
+        for name in ['human', 'object']:
+            src_boxes = outputs[name + '_pred_boxes'][idx]
+            target_boxes = matched_targets(targets, name + '_boxes', indices)
+            loss_bbox = F.l1_loss(src_boxes, target_boxes, reduction='none').sum(1)
+            loss_giou = 1 - torch.diag(box_ops.generalized_box_iou(
+                box_ops.box_cxcywh_to_xyxy(src_boxes),
+                box_ops.box_cxcywh_to_xyxy(target_boxes)))
+            box_losses.index_add_(0, batch_idx, self.weight_dict['loss_bbox'] * loss_bbox +
+                                  self.weight_dict['loss_giou'] * loss_giou)
+        num_matches = torch.bincount(batch_idx, minlength=len(losses)).clamp(min=1)
+        return losses + box_losses / num_matches
+
     def _get_src_permutation_idx(self, indices):
         # permute predictions following indices
         batch_idx = torch.cat(
@@ -601,13 +719,15 @@ class SetCriterion(nn.Module):
                 indices = OptimalTransport.forward(optimal_transport, outputs_without_aux, targets, indices_only=True)
         else:
             indices = self.matcher(outputs_without_aux, targets)
+        # Kept for per_image_losses()
+        self.last_indices = indices
 
         # Compute the average number of target boxes across all nodes,
         # for normalization purposes
         if USE_OPTIMAL_TRANSPORT and training:
             num_boxes = np.sum([len(k[0]) for k in indices])
         else:
-            num_boxes = sum(len(t["human_labels"]) for t in targets)
+            num_boxes = sum(target_sizes(targets))
 
         num_boxes = torch.as_tensor([num_boxes], dtype=torch.float,
                                     device=next(iter(outputs.values())).device)
@@ -690,6 +810,8 @@ def build(args):
         num_actions=num_actions,
         num_queries=args.num_queries,
         aux_loss=args.aux_loss,
+        depth_position_embedding=build_position_encoding(args)
+        if USE_DEPTH_DURING_TRAINING or USE_DEPTH_DURING_INFERENCE else None,
     )
 
     matcher = build_hoi_matcher(args)
@@ -789,10 +911,7 @@ class OptimalTransport(nn.Module):
         num_queries = self.num_queries
 
         def store_to_list(name):
-            result = list()
-            for i in range(len(targets)):
-                result.append(targets[i][name].reshape(-1))
-            return torch.vstack(result)
+            return stacked_targets(targets, name)
 
         human_src_boxes = outputs['human_pred_boxes']
         human_target_boxes = store_to_list('human_boxes')
@@ -858,10 +977,7 @@ class OptimalTransport(nn.Module):
         occlusion_src_logits = outputs['occlusion_pred_logits']
 
         def store_to_list(name):
-            result = list()
-            for i in range(len(targets)):
-                result.append(targets[i][name])
-            return torch.vstack(result)
+            return stacked_targets(targets, name)
 
         human_target_classes = store_to_list("human_labels")
         object_target_classes = store_to_list('object_labels')
@@ -985,10 +1101,7 @@ class OptimalTransport(nn.Module):
         num_queries = self.num_queries
 
         def store_to_list(name):
-            result = list()
-            for i in range(len(targets)):
-                result.append(targets[i][name].reshape(-1))
-            return torch.vstack(result)
+            return stacked_targets(targets, name)
 
         human_src_boxes = outputs['human_pred_boxes']
         human_target_boxes = store_to_list('human_boxes')
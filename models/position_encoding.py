@@ -2,11 +2,14 @@
 """
 Various positional encodings for the transformer.
 """
+import collections
 import math
 import torch
 from torch import nn
+import torchvision
 
 from util.misc import NestedTensor
+from magic_numbers import CACHED_POSITION_EMBEDDING, POSITION_EMBEDDING_CACHE_SIZE
 
 
 class PositionEmbeddingSine(nn.Module):
@@ -24,30 +27,131 @@ class PositionEmbeddingSine(nn.Module):
         if scale is None:
             scale = 2 * math.pi
         self.scale = scale
+        # Not saved in checkpoints
+        dim_t = torch.arange(self.num_pos_feats, dtype=torch.float32)
+        dim_t = self.temperature ** (2 * (torch.div(dim_t, 2, rounding_mode='floor')) / self.num_pos_feats)
+        self.register_buffer('dim_t', dim_t, persistent=False)
+
+    def _normalize(self, embed, last):
+        # embed / (last + eps) * scale, last being the cumulative sum at the
+        # end of the row or column
+        if self.normalize:
+            eps = 1e-6
+            embed = embed / (last + eps) * self.scale
+        return embed
+
+    def _sine(self, embed):
+        """
+        :return: sin/cos embedding (..., num_pos_feats) of positions embed.
+        """
+        pos = embed[..., None] / self.dim_t
+        return torch.stack((pos[..., 0::2].sin(), pos[..., 1::2].cos()), dim=-1).flatten(-2)
 
     def forward(self, tensor_list: NestedTensor):
-        x = tensor_list.tensors
         mask = tensor_list.mask
         assert mask is not None
         not_mask = ~mask
         y_embed = not_mask.cumsum(1, dtype=torch.float32)
         x_embed = not_mask.cumsum(2, dtype=torch.float32)
-        if self.normalize:
-            eps = 1e-6
-            y_embed = y_embed / (y_embed[:, -1:, :] + eps) * self.scale
-            x_embed = x_embed / (x_embed[:, :, -1:] + eps) * self.scale
-
-        dim_t = torch.arange(self.num_pos_feats, dtype=torch.float32, device=x.device)
-        dim_t = self.temperature ** (2 * (torch.div(dim_t, 2, rounding_mode='floor')) / self.num_pos_feats)
+        y_embed = self._normalize(y_embed, y_embed[:, -1:, :])
+        x_embed = self._normalize(x_embed, x_embed[:, :, -1:])
 
-        pos_x = x_embed[:, :, :, None] / dim_t
-        pos_y = y_embed[:, :, :, None] / dim_t
-        pos_x = torch.stack((pos_x[:, :, :, 0::2].sin(), pos_x[:, :, :, 1::2].cos()), dim=4).flatten(3)
-        pos_y = torch.stack((pos_y[:, :, :, 0::2].sin(), pos_y[:, :, :, 1::2].cos()), dim=4).flatten(3)
+        pos_x = self._sine(x_embed)
+        pos_y = self._sine(y_embed)
         pos = torch.cat((pos_y, pos_x), dim=3).permute(0, 3, 1, 2)
         return pos
 
 
+class CachedPositionEmbeddingSine(PositionEmbeddingSine):
+    """
+    PositionEmbeddingSine assembled from cached parts. collate_fn and the
+    backbone give every image a mask that is valid in a top-left h x w
+    rectangle of the padded H x W map, whose embedding then only depends on
+    (h, w, H, W), and separates into
+        y half: the embedding of row r (r + 1 normalized by h, or h for the
+            padding rows) in the first w columns, of 0 in the others
+            (masked columns),
+        x half: likewise for columns in the first h rows.
+    The row (column) embeddings of every h (w) and the embeddings of every
+    (h, w, H, W) are kept in least recently used caches, so a batch costs
+    one torch.stack() when its shapes were seen before. Masks of any other
+    pattern, and tracing, fall back to PositionEmbeddingSine.forward().
+    """
+
+    def __init__(self, num_pos_feats=64, temperature=10000, normalize=False, scale=None, cache_size=64):
+        """
+        :param cache_size: number of (h, w, H, W) embeddings kept, each of
+            2 * num_pos_feats * H * W floats.
+        """
+        super().__init__(num_pos_feats, temperature, normalize, scale)
+        self.cache_size = cache_size
+        self._side_cache = collections.OrderedDict()
+        self._image_cache = collections.OrderedDict()
+
+    @staticmethod
+    def _lookup(cache, key, compute, cache_size):
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            cache[key] = value
+            if len(cache) > cache_size:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return value
+
+    def _side(self, length):
+        """
+        :return: (num_pos_feats, length + 1) embeddings of the positions of a
+            side with length valid positions, and of its padding (column
+            length).
+        """
+        def compute():
+            embed = torch.arange(1, length + 2, dtype=torch.float32, device=self.dim_t.device).clamp_(max=length)
+            return self._sine(self._normalize(embed, embed[-1:])).T.contiguous()
+        return self._lookup(self._side_cache, (length, self.dim_t.device), compute, 4 * self.cache_size)
+
+    def _image(self, height, width, padded_height, padded_width):
+        """
+        :return: (2 * num_pos_feats, padded_height, padded_width) embedding
+            of an image valid in its top-left height x width.
+        """
+        def compute():
+            y_side, x_side = self._side(height), self._side(width)
+            # Positions in fully masked rows or columns are 0
+            empty = self._side(0)[:, 0]
+            pos = torch.empty(2 * self.num_pos_feats, padded_height, padded_width, device=self.dim_t.device)
+            pos_y, pos_x = pos[:self.num_pos_feats], pos[self.num_pos_feats:]
+            pos_y[:, :height, :width] = y_side[:, :height, None]
+            pos_y[:, height:, :width] = y_side[:, height:, None]
+            pos_y[:, :, width:] = empty[:, None, None]
+            pos_x[:, :height, :width] = x_side[:, None, :width]
+            pos_x[:, :height, width:] = x_side[:, None, width:]
+            pos_x[:, height:, :] = empty[:, None, None]
+            return pos
+        key = (height, width, padded_height, padded_width, self.dim_t.device)
+        return self._lookup(self._image_cache, key, compute, self.cache_size)
+
+    def forward(self, tensor_list: NestedTensor):
+        mask = tensor_list.mask
+        assert mask is not None
+        if torchvision._is_tracing():
+            return super().forward(tensor_list)
+        not_mask = ~mask
+        rows, columns = not_mask.any(2), not_mask.any(1)
+        heights, widths = rows.sum(1), columns.sum(1)
+        # Valid in a top-left rectangle: the valid rows and columns come
+        # first and every pixel in them is valid
+        rectangular = (not_mask.sum((1, 2)) == heights * widths) & \
+                      (rows.cumprod(1).sum(1) == heights) & (columns.cumprod(1).sum(1) == widths)
+        heights, widths, rectangular = torch.stack([heights, widths, rectangular.long()]).tolist()
+        if not all(rectangular):
+            return super().forward(tensor_list)
+        padded_height, padded_width = mask.shape[-2:]
+        return torch.stack([self._image(height, width, padded_height, padded_width)
+                            for height, width in zip(heights, widths)])
+
+
 class PositionEmbeddingLearned(nn.Module):
     """
     Absolute pos embedding, learned.
@@ -80,7 +184,11 @@ def build_position_encoding(args):
     N_steps = args.hidden_dim // 2
     if args.position_embedding in ('v2', 'sine'):
         # TODO find a better way of exposing other arguments
-        position_embedding = PositionEmbeddingSine(N_steps, normalize=True)
+        if CACHED_POSITION_EMBEDDING:
+            position_embedding = CachedPositionEmbeddingSine(N_steps, normalize=True,
+                                                             cache_size=POSITION_EMBEDDING_CACHE_SIZE)
+        else:
+            position_embedding = PositionEmbeddingSine(N_steps, normalize=True)
     elif args.position_embedding in ('v3', 'learned'):
         position_embedding = PositionEmbeddingLearned(N_steps)
     else:
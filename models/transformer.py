@@ -12,11 +12,13 @@ Copy-paste from torch.nn.Transformer with modifications:
     * extra LN at the end of encoder is removed
     * decoder returns a stack of activations from all decoding layers
 """
+import collections
 import copy
 from typing import Optional, List
 
 import torch
 import torch.nn.functional as F
+import torch.utils.hooks
 from torch import nn, Tensor
 from magic_numbers import *
 import temp_vars
@@ -67,7 +69,14 @@ class Transformer(nn.Module):
             if p.dim() > 1:
                 nn.init.xavier_uniform_(p)
 
-    def forward(self, src, mask, query_embed, pos_embed, writer=None):
+    def forward(self, src, mask, query_embed, pos_embed, writer=None, select_queries=None):
+        """
+        :param select_queries: None, or a function from the output of the last
+            layer of the pair decoder [BS, 100, 256] to the indices [BS, K] of
+            the queries to run the cascade decoders on. Their indices are then
+            returned last, and the cascade decoder outputs are of these K
+            queries only.
+        """
         # flatten NxCxHxW to HWxNxC
         bs, c, h, w = src.shape
         """
@@ -122,52 +131,138 @@ class Transformer(nn.Module):
                 return hs.transpose(1, 2), memory.permute(1, 2, 0).view(bs, c, h, w)
         else:
             hs = hs.transpose(1, 2)
+            cascade_query_embed = hs[-1]
+            if select_queries is not None:
+                kept_queries = select_queries(hs[-1])
+                cascade_query_embed = torch.gather(hs[-1], 1, kept_queries.unsqueeze(-1).expand(-1, -1, c))
+            distance_decoder_out, occlusion_decoder_out = self.cascade_decoders(cascade_query_embed.permute(1, 0, 2),
+                                                                                memory, mask, pos_embed,
+                                                                                (bs, c, h, w))
 
-            # Distance
-            if VISUALIZE_ATTENTION_WEIGHTS:
-                temp_vars.current_decoder = 'dist'
-            distance_query_embed = hs[-1]
-            distance_query_embed = distance_query_embed.permute(1, 0, 2)
-            distance_tgt = torch.zeros_like(distance_query_embed)
-            if IMPROVE_INTERMEDIATE_LAYERS:
-                distance_decoder_out, _, _ = self.distance_decoder(distance_tgt,
-                                                                   memory,
-                                                                   memory_key_padding_mask=mask,
-                                                                   pos=pos_embed,
-                                                                   query_pos=distance_query_embed,
-                                                                   shape=(bs, c, h, w))
-            else:
-                distance_decoder_out = self.distance_decoder(distance_tgt,
-                                                             memory,
-                                                             memory_key_padding_mask=mask,
-                                                             pos=pos_embed,
-                                                             query_pos=distance_query_embed,
-                                                             shape=(bs, c, h, w))
-            distance_decoder_out = distance_decoder_out.transpose(1, 2)
-
-            # Occlusion
-            if VISUALIZE_ATTENTION_WEIGHTS:
-                temp_vars.current_decoder = 'occl'
-            occlusion_query_embed = hs[-1]
-            occlusion_query_embed = occlusion_query_embed.permute(1, 0, 2)
-            occlusion_tgt = torch.zeros_like(occlusion_query_embed)
             if IMPROVE_INTERMEDIATE_LAYERS:
-                occlusion_decoder_out, _, _ = self.occlusion_decoder(
-                    occlusion_tgt, memory, memory_key_padding_mask=mask,
-                    pos=pos_embed, query_pos=occlusion_query_embed,shape=(bs, c, h, w))
+                outputs = hs, distance_decoder_out, occlusion_decoder_out, human_outputs_coord, object_outputs_coord, memory.permute(
+                    1, 2, 0).view(bs, c, h, w)
             else:
-                occlusion_decoder_out = self.occlusion_decoder(occlusion_tgt,
+                outputs = hs, distance_decoder_out, occlusion_decoder_out, memory.permute(1, 2, 0).view(bs, c, h, w)
+            if select_queries is not None:
+                outputs = outputs + (kept_queries,)
+            return outputs
+
+    def cascade_decoders(self, query_embed, memory, mask, pos_embed, shape, fused=None):
+        """
+        Run the distance and occlusion decoders.
+        :param query_embed: [100, BS, 256] query positions of both decoders
+            (the last output of the pair decoder).
+        :param memory, mask, pos_embed: flattened encoder output, padding
+            mask and positional encoding.
+        :param fused: run them with fused_cascade_decoders() (if possible,
+            see can_fuse_cascade_decoders()), FUSED_CASCADE_DECODERS if None.
+        :return: (distance_decoder_out, occlusion_decoder_out), each
+            [num_layers, BS, 100, 256].
+        """
+        if fused is None:
+            fused = FUSED_CASCADE_DECODERS
+        if fused and self.can_fuse_cascade_decoders():
+            return self.fused_cascade_decoders(query_embed, memory, mask, pos_embed)
+
+        bs, c, h, w = shape
+
+        # Distance
+        if VISUALIZE_ATTENTION_WEIGHTS:
+            temp_vars.current_decoder = 'dist'
+        distance_query_embed = query_embed
+        distance_tgt = torch.zeros_like(distance_query_embed)
+        if IMPROVE_INTERMEDIATE_LAYERS:
+            distance_decoder_out, _, _ = self.distance_decoder(distance_tgt,
                                                                memory,
                                                                memory_key_padding_mask=mask,
                                                                pos=pos_embed,
-                                                               query_pos=occlusion_query_embed,shape=(bs, c, h, w))
-            occlusion_decoder_out = occlusion_decoder_out.transpose(1, 2)
+                                                               query_pos=distance_query_embed,
+                                                               shape=(bs, c, h, w))
+        else:
+            distance_decoder_out = self.distance_decoder(distance_tgt,
+                                                         memory,
+                                                         memory_key_padding_mask=mask,
+                                                         pos=pos_embed,
+                                                         query_pos=distance_query_embed,
+                                                         shape=(bs, c, h, w))
+        distance_decoder_out = distance_decoder_out.transpose(1, 2)
+
+        # Occlusion
+        if VISUALIZE_ATTENTION_WEIGHTS:
+            temp_vars.current_decoder = 'occl'
+        occlusion_query_embed = query_embed
+        occlusion_tgt = torch.zeros_like(occlusion_query_embed)
+        if IMPROVE_INTERMEDIATE_LAYERS:
+            occlusion_decoder_out, _, _ = self.occlusion_decoder(
+                occlusion_tgt, memory, memory_key_padding_mask=mask,
+                pos=pos_embed, query_pos=occlusion_query_embed,shape=(bs, c, h, w))
+        else:
+            occlusion_decoder_out = self.occlusion_decoder(occlusion_tgt,
+                                                           memory,
+                                                           memory_key_padding_mask=mask,
+                                                           pos=pos_embed,
+                                                           query_pos=occlusion_query_embed,shape=(bs, c, h, w))
+        occlusion_decoder_out = occlusion_decoder_out.transpose(1, 2)
+        return distance_decoder_out, occlusion_decoder_out
+
+    def can_fuse_cascade_decoders(self):
+        # Attention weights are only computed by the layers themselves, and
+        # pre-norm layers are not fused
+        decoders = [self.distance_decoder, self.occlusion_decoder]
+        layers = [layer for decoder in decoders for layer in decoder.layers]
+        return not VISUALIZE_ATTENTION_WEIGHTS and not IMPROVE_INTERMEDIATE_LAYERS and \
+            len(decoders[0].layers) == len(decoders[1].layers) and \
+            decoders[0].return_intermediate == decoders[1].return_intermediate and \
+            not any(layer.normalize_before or layer._attention_hooks for layer in layers)
+
+    def fused_cascade_decoders(self, query_embed, memory, mask, pos_embed):
+        """
+        The distance and occlusion decoders (post-norm layers) run as one:
+        their queries and layer parameters are stacked along a group
+        dimension, the linear layers of both are one torch.baddbmm, and the
+        attention heads of both are attended by one
+        F.scaled_dot_product_attention. Both take the same query positions,
+        memory, mask and positional encoding, so the keys and values of
+        memory are projected for both groups by one matmul.
+        :return: (distance_decoder_out, occlusion_decoder_out), each
+            [num_layers, BS, 100, 256], as cascade_decoders().
+        """
+        decoders = [self.distance_decoder, self.occlusion_decoder]
+        query_pos = query_embed.unsqueeze(0).expand(len(decoders), -1, -1, -1)
+        tgt = torch.zeros_like(query_pos)
+        memory_key = memory + pos_embed
+        norms = [decoder.norm for decoder in decoders]
 
-            if IMPROVE_INTERMEDIATE_LAYERS:
-                return hs, distance_decoder_out, occlusion_decoder_out, human_outputs_coord, object_outputs_coord, memory.permute(
-                    1, 2, 0).view(bs, c, h, w)
-            else:
-                return hs, distance_decoder_out, occlusion_decoder_out, memory.permute(1, 2, 0).view(bs, c, h, w)
+        # Dropout probabilities are the same for both groups
+        dropout = lambda x, module: F.dropout(x, module.p, self.training)
+
+        intermediate = []
+        for layers in zip(*[decoder.layers for decoder in decoders]):
+            layer = layers[0]
+
+            # Self-Attention
+            q = tgt + query_pos
+            tgt2 = _grouped_attention([l.self_attn for l in layers], q, q, tgt)
+            tgt = _grouped_layer_norm(tgt + dropout(tgt2, layer.dropout1), [l.norm1 for l in layers])
+
+            # Multi-Head Attention (keys and values shared by the groups)
+            tgt2 = _grouped_attention([l.multihead_attn for l in layers], tgt + query_pos, memory_key, memory,
+                                      key_padding_mask=mask)
+            tgt = _grouped_layer_norm(tgt + dropout(tgt2, layer.dropout2), [l.norm2 for l in layers])
+
+            # Feed Forward
+            tgt2 = _grouped_linear(tgt, [l.linear1 for l in layers])
+            tgt2 = _grouped_linear(dropout(layer.activation(tgt2), layer.dropout), [l.linear2 for l in layers])
+            tgt = _grouped_layer_norm(tgt + dropout(tgt2, layer.dropout3), [l.norm3 for l in layers])
+
+            if decoders[0].return_intermediate:
+                intermediate.append(_grouped_layer_norm(tgt, norms))
+        if not decoders[0].return_intermediate:
+            intermediate.append(_grouped_layer_norm(tgt, norms))
+        # [G, num_layers, 100, BS, 256]
+        outputs = torch.stack(intermediate, dim=1)
+        return outputs[0].transpose(1, 2), outputs[1].transpose(1, 2)
 
 
 class TransformerEncoder(nn.Module):
@@ -177,11 +272,14 @@ class TransformerEncoder(nn.Module):
         self.layers = _get_clones(encoder_layer, num_layers)
         self.num_layers = num_layers
         self.norm = norm
+        self.sparse = SPARSE_ENCODER
 
     def forward(self, src,
                 mask: Optional[Tensor] = None,
                 src_key_padding_mask: Optional[Tensor] = None,
                 pos: Optional[Tensor] = None):
+        if self.sparse and mask is None and src_key_padding_mask is not None:
+            return self.sparse_forward(src, src_key_padding_mask, pos)
         output = src
 
         for layer in self.layers:
@@ -193,6 +291,40 @@ class TransformerEncoder(nn.Module):
 
         return output
 
+    def sparse_forward(self, src, src_key_padding_mask, pos: Optional[Tensor] = None):
+        """
+        The encoder on the valid tokens of every image and as few padding
+        tokens as possible: the tokens of every image are reordered valid
+        ones first (stable, so in order), the sequences are cut to the
+        longest image, and the layers run on them as in forward() with the
+        remaining padding masked. Attention and feed forward layers are per
+        token, so valid tokens come out as in forward(), in the original
+        order.
+        :param src: [h*w, BS, 256].
+        :param src_key_padding_mask: [BS, h*w], True at padding.
+        :return: [h*w, BS, 256], equal to forward() at the valid tokens. At
+            padding, equal to forward() where a padding token was kept and
+            0 elsewhere; the decoders mask padding, so their outputs are the
+            same.
+        """
+        # [BS, h*w] -> [h*w, BS], valid tokens first in every image and the
+        # sequences cut to the longest image (the one synchronization)
+        order = torch.sort(src_key_padding_mask.to(torch.uint8), dim=1, stable=True)[1].T
+        order = order[:int((~src_key_padding_mask).sum(1).max())]
+        index = order.unsqueeze(-1).expand(-1, -1, src.shape[-1])
+        output = src.gather(0, index)
+        if pos is not None:
+            pos = pos.gather(0, index)
+        mask = src_key_padding_mask.gather(1, order.T)
+
+        for layer in self.layers:
+            output = layer(output, src_key_padding_mask=mask, pos=pos)
+
+        if self.norm is not None:
+            output = self.norm(output)
+
+        return output.new_zeros(src.shape).scatter_(0, index, output)
+
 
 class temp_MLP(nn.Module):
     """ Very simple multi-layer perceptron (also called FFN)"""
@@ -326,8 +458,8 @@ class TransformerEncoderLayer(nn.Module):
         src_key_padding_mask is [BS, h*w]
         """
         # Self-Attention
-        src2 = self.self_attn(q, k, value=src, attn_mask=src_mask,
-                              key_padding_mask=src_key_padding_mask)[0]
+        src2 = multi_head_attention(self.self_attn, q, k, src, attn_mask=src_mask,
+                                    key_padding_mask=src_key_padding_mask)[0]
         src = src + self.dropout1(src2)
         src = self.norm1(src)
 
@@ -343,8 +475,8 @@ class TransformerEncoderLayer(nn.Module):
                     pos: Optional[Tensor] = None):
         src2 = self.norm1(src)
         q = k = self.with_pos_embed(src2, pos)
-        src2 = self.self_attn(q, k, value=src2, attn_mask=src_mask,
-                              key_padding_mask=src_key_padding_mask)[0]
+        src2 = multi_head_attention(self.self_attn, q, k, src2, attn_mask=src_mask,
+                                    key_padding_mask=src_key_padding_mask)[0]
         src = src + self.dropout1(src2)
         src2 = self.norm2(src)
         src2 = self.linear2(self.dropout(self.activation(self.linear1(src2))))
@@ -394,6 +526,20 @@ class TransformerDecoderLayer(nn.Module):
 
         self.activation = _get_activation_fn(activation)
         self.normalize_before = normalize_before
+        self._attention_hooks = collections.OrderedDict()
+
+    def register_attention_hook(self, hook):
+        """
+        :param hook: called as hook(layer, attention_weights) with the
+            [BS, 100, h*w] cross-attention weights (averaged over the heads)
+            of every forward pass (post-norm layers only). Attention weights
+            are only computed if a hook (or VISUALIZE_ATTENTION_WEIGHTS) asks
+            for them.
+        :return: a handle whose remove() removes the hook.
+        """
+        handle = torch.utils.hooks.RemovableHandle(self._attention_hooks)
+        self._attention_hooks[handle.id] = hook
+        return handle
 
     def with_pos_embed(self, tensor, pos: Optional[Tensor]):
         return tensor if pos is None else tensor + pos
@@ -418,8 +564,8 @@ class TransformerDecoderLayer(nn.Module):
         """
         # Self-Attention
         q = k = self.with_pos_embed(tgt, query_pos)
-        tgt2 = self.self_attn(q, k, value=tgt, attn_mask=tgt_mask,
-                              key_padding_mask=tgt_key_padding_mask)[0]
+        tgt2 = multi_head_attention(self.self_attn, q, k, tgt, attn_mask=tgt_mask,
+                                    key_padding_mask=tgt_key_padding_mask)[0]
         tgt = tgt + self.dropout1(tgt2)
         tgt = self.norm1(tgt)
         """
@@ -434,10 +580,15 @@ class TransformerDecoderLayer(nn.Module):
         """
 
         # Multi-Head Attention
-        tgt2, attention_weights = self.multihead_attn(query=self.with_pos_embed(tgt, query_pos),
-                                   key=self.with_pos_embed(memory, pos),
-                                   value=memory, attn_mask=memory_mask,
-                                   key_padding_mask=memory_key_padding_mask)[0:2]
+        # Attention weights are only computed if captured
+        tgt2, attention_weights = multi_head_attention(self.multihead_attn, self.with_pos_embed(tgt, query_pos),
+                                                       self.with_pos_embed(memory, pos), memory,
+                                                       attn_mask=memory_mask,
+                                                       key_padding_mask=memory_key_padding_mask,
+                                                       need_weights=VISUALIZE_ATTENTION_WEIGHTS or
+                                                       bool(self._attention_hooks))
+        for hook in self._attention_hooks.values():
+            hook(self, attention_weights)
         if VISUALIZE_ATTENTION_WEIGHTS:
             bs, c, h, w = shape
 
@@ -484,14 +635,13 @@ class TransformerDecoderLayer(nn.Module):
                     query_pos: Optional[Tensor] = None):
         tgt2 = self.norm1(tgt)
         q = k = self.with_pos_embed(tgt2, query_pos)
-        tgt2 = self.self_attn(q, k, value=tgt2, attn_mask=tgt_mask,
-                              key_padding_mask=tgt_key_padding_mask)[0]
+        tgt2 = multi_head_attention(self.self_attn, q, k, tgt2, attn_mask=tgt_mask,
+                                    key_padding_mask=tgt_key_padding_mask)[0]
         tgt = tgt + self.dropout1(tgt2)
         tgt2 = self.norm2(tgt)
-        tgt2 = self.multihead_attn(query=self.with_pos_embed(tgt2, query_pos),
-                                   key=self.with_pos_embed(memory, pos),
-                                   value=memory, attn_mask=memory_mask,
-                                   key_padding_mask=memory_key_padding_mask)[0]
+        tgt2 = multi_head_attention(self.multihead_attn, self.with_pos_embed(tgt2, query_pos),
+                                    self.with_pos_embed(memory, pos), memory, attn_mask=memory_mask,
+                                    key_padding_mask=memory_key_padding_mask)[0]
         tgt = tgt + self.dropout2(tgt2)
         tgt2 = self.norm3(tgt)
         tgt2 = self.linear2(self.dropout(self.activation(self.linear1(tgt2))))
@@ -519,6 +669,133 @@ class TransformerDecoderLayer(nn.Module):
                                  tgt_key_padding_mask, memory_key_padding_mask, pos, query_pos, writer, shape, layer_index)
 
 
+def multi_head_attention(attention, query, key, value, attn_mask=None, key_padding_mask=None, need_weights=False):
+    """
+    :param attention: nn.MultiheadAttention whose parameters to use.
+    :param query: [L, BS, E].
+    :param key, value: [S, BS, E].
+    :param key_padding_mask: [BS, S], True where key is padding.
+    :param need_weights: whether to return the attention weights. Without
+        them, and without attn_mask, the attention is computed by
+        _sdpa_attention() if SDPA_ATTENTION.
+    :return: ([L, BS, E] attention outputs, [BS, L, S] attention weights
+        averaged over the heads, or None if not need_weights with SDPA).
+    """
+    if SDPA_ATTENTION and not need_weights and attn_mask is None:
+        return _sdpa_attention(attention, query, key, value, key_padding_mask), None
+    return attention(query, key, value=value, attn_mask=attn_mask, key_padding_mask=key_padding_mask)[:2]
+
+
+def _in_projection(attention, query, key, value):
+    """
+    :return: query, key and value projected by the in_proj parameters of
+        nn.MultiheadAttention attention (with bias, no extra keys).
+    """
+    embed_dim = query.shape[-1]
+    weight, bias = attention.in_proj_weight, attention.in_proj_bias
+    if query is key:
+        # Self-attention with the same positional encoding: query and key
+        # projected by one matmul
+        q, k = F.linear(query, weight[:2 * embed_dim], bias[:2 * embed_dim]).chunk(2, dim=-1)
+    else:
+        q = F.linear(query, weight[:embed_dim], bias[:embed_dim])
+        k = F.linear(key, weight[embed_dim:2 * embed_dim], bias[embed_dim:2 * embed_dim])
+    v = F.linear(value, weight[2 * embed_dim:], bias[2 * embed_dim:])
+    return q, k, v
+
+
+def _sdpa_attention(attention, query, key, value, key_padding_mask=None):
+    """
+    The attention of nn.MultiheadAttention attention (with bias, no extra
+    keys), computed by F.scaled_dot_product_attention on batch-first
+    [BS, num_heads, L, head_dim] heads.
+    :return: [L, BS, E] attention outputs.
+    """
+    length, batch_size, embed_dim = query.shape
+    source_length = key.shape[0]
+    num_heads = attention.num_heads
+    head_dim = embed_dim // num_heads
+
+    def heads(x):
+        # [L, BS, E] -> [BS, num_heads, L, head_dim]
+        return x.view(x.shape[0], batch_size, num_heads, head_dim).permute(1, 2, 0, 3)
+
+    q, k, v = _in_projection(attention, query, key, value)
+    mask = None
+    if key_padding_mask is not None:
+        # True where attending
+        mask = ~key_padding_mask.view(batch_size, 1, 1, source_length)
+    out = F.scaled_dot_product_attention(heads(q), heads(k), heads(v), attn_mask=mask,
+                                         dropout_p=attention.dropout if attention.training else 0.0)
+    out = out.permute(2, 0, 1, 3).reshape(length, batch_size, embed_dim)
+    return F.linear(out, attention.out_proj.weight, attention.out_proj.bias)
+
+
+def _grouped_linear(x, linears):
+    """
+    :param x: [G, ..., in] inputs of G groups.
+    :param linears: the nn.Linear of every group.
+    :return: [G, ..., out], every group through its nn.Linear, as one
+        torch.baddbmm.
+    """
+    weight = torch.stack([linear.weight for linear in linears])
+    bias = torch.stack([linear.bias for linear in linears])
+    shape = x.shape
+    out = torch.baddbmm(bias.unsqueeze(1), x.reshape(shape[0], -1, shape[-1]), weight.transpose(1, 2))
+    return out.view(shape[:-1] + (weight.shape[1],))
+
+
+def _grouped_layer_norm(x, norms):
+    # One nn.LayerNorm per group, so that the result is the same as theirs
+    return torch.stack([norm(x[i]) for i, norm in enumerate(norms)])
+
+
+def _grouped_attention(attentions, query, key, value, key_padding_mask=None):
+    """
+    The attention of the nn.MultiheadAttention (with bias, no extra keys)
+    of G groups, their heads attended as G * num_heads heads by one
+    F.scaled_dot_product_attention.
+    :param query: [G, L, BS, E].
+    :param key, value: [G, S, BS, E], or [S, BS, E] for all groups, which is
+        then projected for all groups by one matmul.
+    :param key_padding_mask: [BS, S], True where key is padding.
+    :return: [G, L, BS, E] attention outputs.
+    """
+    num_groups, length, batch_size, embed_dim = query.shape
+    num_heads = attentions[0].num_heads
+    head_dim = embed_dim // num_heads
+    weight = torch.stack([attention.in_proj_weight for attention in attentions])
+    bias = torch.stack([attention.in_proj_bias for attention in attentions])
+
+    def project(x, part):
+        # -> [G, S, BS, E] (or [S, BS, G * E] for all groups)
+        w, b = weight[:, part * embed_dim:(part + 1) * embed_dim], bias[:, part * embed_dim:(part + 1) * embed_dim]
+        if x.dim() == 3:
+            return F.linear(x, w.reshape(-1, embed_dim), b.reshape(-1))
+        out = torch.baddbmm(b.unsqueeze(1), x.reshape(num_groups, -1, embed_dim), w.transpose(1, 2))
+        return out.view(x.shape)
+
+    def heads(x):
+        # -> [BS, G * num_heads, S, head_dim], a view of the keys and values
+        # projected for all groups
+        if x.dim() == 3:
+            return x.view(x.shape[0], batch_size, num_groups * num_heads, head_dim).permute(1, 2, 0, 3)
+        x = x.view(num_groups, x.shape[1], batch_size, num_heads, head_dim).permute(2, 0, 3, 1, 4)
+        return x.reshape(batch_size, num_groups * num_heads, -1, head_dim)
+
+    mask = None
+    if key_padding_mask is not None:
+        # True where attending
+        mask = ~key_padding_mask.view(batch_size, 1, 1, -1)
+    out = F.scaled_dot_product_attention(heads(project(query, 0)), heads(project(key, 1)),
+                                         heads(project(value, 2)), attn_mask=mask,
+                                         dropout_p=attentions[0].dropout if attentions[0].training else 0.0)
+    # [BS, G * num_heads, L, head_dim] -> [G, L, BS, E]
+    out = out.view(batch_size, num_groups, num_heads, length, head_dim).permute(1, 3, 0, 2, 4)
+    return _grouped_linear(out.reshape(num_groups, length, batch_size, embed_dim),
+                           [attention.out_proj for attention in attentions])
+
+
 def _get_clones(module, N):
     return nn.ModuleList([copy.deepcopy(module) for i in range(N)])
 
@@ -135,6 +135,11 @@ def generate_hoi_list_using_model_outputs(args, outputs, original_targets, filte
         else:
             top_k_indices = torch.argsort(-action_row_max_values * occlusion_row_max_values)[:top_k]
 
+        # Look up names of all kept objects at once
+        if args.dataset_file == 'two_point_five_vrd':
+            human_name_list = get_label_vocabulary().index_to_names(human_idx_max_list)
+            object_name_list = get_label_vocabulary().index_to_names(object_idx_max_list)
+
         hoi_list = []
         for idx_box in top_k_indices:
             # distance
@@ -157,7 +162,7 @@ def generate_hoi_list_using_model_outputs(args, outputs, original_targets, filte
                                    cy + 0.5 * h]))
             h_cls = human_val_max_list[idx_box]                 # obj A score
             if args.dataset_file == 'two_point_five_vrd':       # obj A name
-                h_name = index_to_name(int(cid))
+                h_name = human_name_list[int(idx_box)]
             else:
                 h_name = coco_instance_id_to_name[int(cid)]
 
@@ -169,7 +174,7 @@ def generate_hoi_list_using_model_outputs(args, outputs, original_targets, filte
                                    cy + 0.5 * h]))
             o_cls = object_val_max_list[idx_box]                # obj B score
             if args.dataset_file == 'two_point_five_vrd':       # obj B name
-                o_name = index_to_name(int(cid))
+                o_name = object_name_list[int(idx_box)]
             else:
                 o_name = coco_instance_id_to_name[int(cid)]
 
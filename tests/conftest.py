@@ -0,0 +1,92 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Tests of the optimized code paths against their reference implementations.
+
+Run from the project root:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def synthetic_annotation(line):
+    """
+    :param line: JSON line {"file_name": ..., "num_relations": ...} (and
+        the height and width of the image).
+    :return: dict(image_id=..., annotations=...) like parse_one_gt_line(),
+        with random values seeded by the line.
+    """
+    import json
+    import zlib
+
+    import torch
+
+    from datasets.annotation_store import RELATION_FIELDS
+
+    item = json.loads(line)
+    generator = torch.Generator().manual_seed(zlib.crc32(line.encode('utf-8')))
+    num_relations = item['num_relations']
+    annotations = dict()
+    for name, (dtype, shape) in RELATION_FIELDS.items():
+        if dtype == np.int64:
+            annotations[name] = torch.randint(0, 600, (num_relations,) + shape, generator=generator)
+        else:
+            annotations[name] = torch.rand((num_relations,) + shape, generator=generator).to(
+                getattr(torch, np.dtype(dtype).name))
+    annotations['org_size'] = torch.randint(100, 1000, (2,), generator=generator)
+    annotations['num_bounding_boxes_in_ground_truth'] = 2 * num_relations
+    annotations['image_id'] = item['file_name']
+    return dict(image_id=item['file_name'], annotations=annotations)
+
+
+@pytest.fixture
+def odgt_file(tmp_path):
+    """
+    :return: path of an .odgt file of synthetic_annotation() lines, one of
+        them of an image without relations.
+    """
+    path = tmp_path / 'annotation.odgt'
+    with open(path, 'w') as f:
+        for i, num_relations in enumerate([3, 0, 5, 1]):
+            f.write('{{"file_name": "{:016x}.jpg", "height": {}, "width": {}, "num_relations": {}}}\n'.format(
+                i, 480 + i, 640 - i, num_relations))
+    return path
+
+
+def make_sample(generator, height, width, num_relations=3):
+    """
+    :return: a random sample as two_point_five_VRD.__getitem__() returns it
+        to collate_fn, of an image of height x width.
+    """
+    import torch
+
+    boxes = lambda: torch.rand(num_relations, 4, generator=generator)
+    labels = lambda: torch.randint(0, 600, (num_relations,), generator=generator)
+    return (torch.rand(3, height, width, generator=generator), None,
+            boxes(), labels(), boxes(), labels(), boxes(), labels(), labels(),
+            torch.rand(num_relations, 5, generator=generator).half(),
+            torch.rand(num_relations, 5, generator=generator).half(),
+            np.array('{:016x}.jpg'.format(int(torch.randint(1 << 30, (1,), generator=generator)))),
+            torch.as_tensor([height, width]), torch.tensor(num_relations))
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """
+    :return: a new PaddedBufferPool, used by collate_fn during the test.
+    """
+    import util.misc as utils
+
+    pool = utils.PaddedBufferPool()
+    monkeypatch.setattr(utils, 'collate_buffer_pool', pool)
+    return pool
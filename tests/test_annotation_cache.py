@@ -0,0 +1,55 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import os
+
+import pytest
+import torch
+
+from conftest import synthetic_annotation
+from datasets.annotation_cache import load_annotations
+
+
+def assert_same_annotations(store, expected):
+    assert len(store) == len(expected)
+    for item, expected_item in zip(store, expected):
+        assert item['image_id'] == expected_item['image_id']
+        for name, value in expected_item['annotations'].items():
+            if isinstance(value, torch.Tensor):
+                assert torch.equal(item['annotations'][name], value), name
+            else:
+                assert item['annotations'][name] == value, name
+
+
+def test_cache_is_reloaded(odgt_file, tmp_path):
+    with open(odgt_file) as f:
+        expected = [synthetic_annotation(line.strip()) for line in f]
+    cache_dir = tmp_path / 'cache'
+    assert_same_annotations(load_annotations(str(odgt_file), synthetic_annotation, cache_dir=str(cache_dir)),
+                            expected)
+    assert len(os.listdir(cache_dir)) == 1
+
+    def parse_line(line):
+        raise AssertionError('the cache is not reloaded')
+
+    assert_same_annotations(load_annotations(str(odgt_file), parse_line, cache_dir=str(cache_dir)), expected)
+
+
+def test_corrupted_cache_warns_and_parses(odgt_file, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    load_annotations(str(odgt_file), synthetic_annotation, cache_dir=str(cache_dir))
+    cache_path = cache_dir / os.listdir(cache_dir)[0]
+    with open(cache_path / 'offsets.npy', 'wb') as f:
+        f.write(b'not an array')
+    with pytest.warns(UserWarning, match='Ignoring the annotation cache'):
+        store = load_annotations(str(odgt_file), synthetic_annotation, cache_dir=str(cache_dir))
+    with open(odgt_file) as f:
+        assert_same_annotations(store, [synthetic_annotation(line.strip()) for line in f])
+
+
+def test_no_cache_without_cache_dir(odgt_file, tmp_path):
+    load_annotations(str(odgt_file), synthetic_annotation)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [odgt_file.name]
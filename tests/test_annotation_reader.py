@@ -0,0 +1,107 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import os
+import pickle
+
+import numpy as np
+import pytest
+import torch
+
+from conftest import synthetic_annotation
+from datasets.annotation_cache import load_annotations
+from datasets.annotation_reader import IndexedOdgtReader, AnnotationSubset
+
+
+def assert_same_item(item, expected):
+    assert item['image_id'] == expected['image_id']
+    assert item['annotations'].keys() == expected['annotations'].keys()
+    for name, value in expected['annotations'].items():
+        if isinstance(value, torch.Tensor):
+            assert torch.equal(item['annotations'][name], value), name
+        else:
+            assert item['annotations'][name] == value, name
+
+
+def assert_same_items(reader, expected):
+    assert len(reader) == len(expected)
+    for item, expected_item in zip(reader, expected):
+        assert_same_item(item, expected_item)
+
+
+def test_items_match_load_annotations(odgt_file):
+    reader = IndexedOdgtReader(str(odgt_file), synthetic_annotation)
+    assert_same_items(reader, load_annotations(str(odgt_file), synthetic_annotation))
+    assert_same_item(reader[-1], reader[3])
+    with pytest.raises(IndexError):
+        reader[4]
+    assert reader.image_sizes().tolist() == [[480, 640], [481, 639], [482, 638], [483, 637]]
+    assert reader.image_ids().tolist() == ['{:016x}.jpg'.format(i) for i in range(4)]
+    # Only the images with relations
+    reader = IndexedOdgtReader(str(odgt_file), synthetic_annotation,
+                               keep=lambda item: len(item['annotations']['human_labels']) > 0)
+    assert reader.image_ids().tolist() == ['{:016x}.jpg'.format(i) for i in [0, 2, 3]]
+
+
+def test_items_are_copies(odgt_file):
+    reader = IndexedOdgtReader(str(odgt_file), synthetic_annotation)
+    with open(odgt_file) as f:
+        expected = synthetic_annotation(f.readline().strip())
+    item = reader[0]
+    item['annotations']['human_boxes'].mul_(0)
+    item['annotations']['image_id'] = 'modified'
+    assert_same_item(reader[0], expected)
+
+
+def test_least_recently_used_items_are_dropped(odgt_file):
+    reader = IndexedOdgtReader(str(odgt_file), synthetic_annotation, cache_size=2)
+    for index in [0, 1, 0, 2]:
+        reader[index]
+    assert list(reader._cache) == [0, 2]
+    reader[3]
+    assert list(reader._cache) == [2, 3]
+    with open(odgt_file) as f:
+        assert_same_items(reader, [synthetic_annotation(line.strip()) for line in f])
+    assert len(reader._cache) == 2
+
+
+def test_file_is_reopened_after_fork_and_pickle(odgt_file):
+    # Without cache, so that every item is read from the file
+    reader = IndexedOdgtReader(str(odgt_file), synthetic_annotation, cache_size=0)
+    expected = list(reader)
+    parent_file = reader._file
+    pid = os.fork()
+    if pid == 0:
+        # The child reads with a file of its own, not at the position of
+        # the parent's
+        status = 0
+        try:
+            assert_same_item(reader[2], expected[2])
+            assert reader._file is not parent_file
+        except BaseException:
+            status = 1
+        os._exit(status)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert reader._file is parent_file
+    assert_same_items(reader, expected)
+
+    copy = pickle.loads(pickle.dumps(reader))
+    assert copy._file is None and len(copy._cache) == 0
+    assert_same_items(copy, expected)
+
+
+def test_annotation_subset(odgt_file):
+    reader = IndexedOdgtReader(str(odgt_file), synthetic_annotation)
+    subset = AnnotationSubset(reader, [3, 0, 2])
+    assert len(subset) == 3
+    assert_same_items(subset, [reader[3], reader[0], reader[2]])
+    assert_same_item(subset[-1], reader[2])
+    assert subset.image_ids().tolist() == ['{:016x}.jpg'.format(i) for i in [3, 0, 2]]
+    assert np.array_equal(subset.image_sizes(), reader.image_sizes()[[3, 0, 2]])
+    # Of a list too
+    assert_same_item(AnnotationSubset(list(reader), [1])[0], reader[1])
+    with pytest.raises(AssertionError):
+        AnnotationSubset(reader, [4])
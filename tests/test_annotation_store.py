@@ -0,0 +1,61 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import os
+import pickle
+
+import numpy as np
+import pytest
+import torch
+
+from conftest import synthetic_annotation
+from datasets.annotation_store import AnnotationStore
+
+
+@pytest.fixture
+def annotations(odgt_file):
+    with open(odgt_file) as f:
+        return [synthetic_annotation(line.strip()) for line in f]
+
+
+def assert_same_items(store, annotations):
+    assert len(store) == len(annotations)
+    for item, expected in zip(store, annotations):
+        assert item['image_id'] == expected['image_id']
+        for name, value in expected['annotations'].items():
+            if isinstance(value, torch.Tensor):
+                assert item['annotations'][name].dtype == value.dtype, name
+                assert torch.equal(item['annotations'][name], value), name
+            else:
+                assert item['annotations'][name] == value, name
+
+
+def test_from_annotations(annotations):
+    store = AnnotationStore.from_annotations(annotations)
+    assert_same_items(store, annotations)
+    assert store.num_relations() == 9
+    assert store[-1]['image_id'] == annotations[-1]['image_id']
+    with pytest.raises(IndexError):
+        store[len(annotations)]
+    assert np.array_equal(store.image_sizes(), [a['annotations']['org_size'].numpy() for a in annotations])
+
+
+@pytest.mark.parametrize('mmap_mode', [None, 'c'])
+def test_save_load_round_trip(annotations, tmp_path, mmap_mode):
+    AnnotationStore.from_annotations(annotations).save(str(tmp_path / 'cache' / 'store'))
+    store = AnnotationStore.load(str(tmp_path / 'cache' / 'store'), mmap_mode=mmap_mode)
+    assert_same_items(store, annotations)
+    # A memory-mapped store is pickled as its path, an in-memory one whole
+    assert_same_items(pickle.loads(pickle.dumps(store)), annotations)
+    assert sorted(os.listdir(tmp_path / 'cache')) == ['store']
+
+
+def test_save_over_existing_store(annotations, tmp_path):
+    # As when another process saved the same store first
+    AnnotationStore.from_annotations(annotations).save(str(tmp_path / 'cache' / 'store'))
+    AnnotationStore.from_annotations(annotations).save(str(tmp_path / 'cache' / 'store'))
+    assert_same_items(AnnotationStore.load(str(tmp_path / 'cache' / 'store')), annotations)
+    assert sorted(os.listdir(tmp_path / 'cache')) == ['store']
@@ -0,0 +1,58 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import torch
+from torch import nn
+
+import models.transformer
+from models.transformer import Transformer, multi_head_attention
+
+
+def test_sdpa_attention_matches_multihead_attention(monkeypatch):
+    torch.manual_seed(0)
+    attention = nn.MultiheadAttention(32, 4).eval()
+    query, key, value = torch.randn(7, 3, 32), torch.randn(11, 3, 32), torch.randn(11, 3, 32)
+    key_padding_mask = torch.zeros(3, 11, dtype=torch.bool)
+    key_padding_mask[1, 8:] = True
+    key_padding_mask[2, 3:] = True
+    expected = attention(query, key, value, key_padding_mask=key_padding_mask)[0]
+    expected_self = attention(query, query, value[:7])[0]
+    monkeypatch.setattr(models.transformer, 'SDPA_ATTENTION', True)
+    out, weights = multi_head_attention(attention, query, key, value, key_padding_mask=key_padding_mask)
+    assert weights is None
+    assert torch.allclose(out, expected, atol=1e-5)
+    # Query and key projected by one matmul
+    assert torch.allclose(multi_head_attention(attention, query, query, value[:7])[0], expected_self, atol=1e-5)
+    # Attention weights still come from nn.MultiheadAttention
+    out, weights = multi_head_attention(attention, query, key, value, key_padding_mask=key_padding_mask,
+                                        need_weights=True)
+    assert torch.allclose(out, expected, atol=1e-6)
+    assert weights.shape == (3, 7, 11)
+
+
+def test_sdpa_transformer_matches_multihead_attention(monkeypatch):
+    torch.manual_seed(0)
+    transformer = Transformer(d_model=32, nhead=4, num_encoder_layers=2, num_decoder_layers=2,
+                              num_decoder_layer_distance=2, num_decoder_layer_occlusion=2, dim_feedforward=64,
+                              return_intermediate_dec=True).eval()
+    src, pos = torch.randn(2, 32, 4, 5), torch.randn(2, 32, 4, 5)
+    mask = torch.zeros(2, 4, 5, dtype=torch.bool)
+    mask[1, 3:] = True
+    mask[1, :, 4:] = True
+    query_embed = torch.randn(6, 32)
+    with torch.no_grad():
+        expected = transformer(src, mask, query_embed, pos)
+        monkeypatch.setattr(models.transformer, 'SDPA_ATTENTION', True)
+        weights = []
+        handle = transformer.decoder.layers[0].register_attention_hook(lambda layer, w: weights.append(w))
+        outputs = transformer(src, mask, query_embed, pos)
+        handle.remove()
+        transformer(src, mask, query_embed, pos)
+    for a, b in zip(outputs, expected):
+        assert torch.allclose(a, b, atol=1e-5)
+    # Once, with the weights of the pair decoder's first layer
+    assert len(weights) == 1 and weights[0].shape == (2, 6, 20)
+    assert torch.allclose(weights[0].sum(-1), torch.ones(2, 6), atol=1e-5)
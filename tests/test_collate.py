@@ -0,0 +1,46 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import pytest
+import torch
+
+import util.misc as utils
+from conftest import make_sample
+
+
+def test_collate_matches_nested_tensor(pool):
+    generator = torch.Generator().manual_seed(0)
+    batch = [make_sample(generator, 40, 56), make_sample(generator, 64, 32)]
+    samples, depth, targets = utils.collate_fn(list(batch))
+    expected = utils.nested_tensor_from_tensor_list([sample[0] for sample in batch])
+    assert depth is None
+    assert torch.equal(samples.tensors, expected.tensors)
+    assert torch.equal(samples.mask, expected.mask)
+    assert torch.equal(targets[1]['human_boxes'], batch[1][2])
+
+
+def test_second_collate_keeps_live_views(pool):
+    generator = torch.Generator().manual_seed(0)
+    samples, _, _ = utils.collate_fn([make_sample(generator, 40, 56), make_sample(generator, 64, 32)])
+    # Only views derived from the batch stay alive
+    image, mask = samples.tensors[0, :, :20], samples.mask[1].view(-1)
+    expected_image, expected_mask = image.clone(), mask.clone()
+    del samples
+    for _ in range(3):
+        utils.collate_fn([make_sample(generator, 40, 56), make_sample(generator, 64, 32)])
+    assert torch.equal(image, expected_image)
+    assert torch.equal(mask, expected_mask)
+
+
+def test_released_buffers_are_reused(pool):
+    if not pool.enabled:
+        pytest.skip('torch cannot count the references to a storage')
+    generator = torch.Generator().manual_seed(0)
+    samples, _, _ = utils.collate_fn([make_sample(generator, 40, 56)])
+    pointer = samples.tensors.data_ptr()
+    del samples
+    samples, _, _ = utils.collate_fn([make_sample(generator, 32, 48)])
+    assert samples.tensors.data_ptr() == pointer
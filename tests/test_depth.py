@@ -0,0 +1,57 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import torch
+from torch import nn
+
+from models.hoitr import HoiTR
+from models.position_encoding import PositionEmbeddingLearned
+from models.transformer import Transformer
+from util.misc import NestedTensor, pool_depth, pool_depth_list
+
+
+def padded_depth_batch(depth_list, shape):
+    tensors = torch.zeros((len(depth_list), 1) + shape)
+    mask = torch.ones((len(depth_list),) + shape, dtype=torch.bool)
+    for t, m, d in zip(tensors, mask, depth_list):
+        t[:, :d.shape[1], :d.shape[2]] = d
+        m[:d.shape[1], :d.shape[2]] = False
+    return NestedTensor(tensors, mask)
+
+
+def test_pool_depth_list_matches_pooling_the_padded_batch():
+    generator = torch.Generator().manual_seed(0)
+    # Normalized depth is negative in places, so blocks with padding take
+    # the maximum with the zero padding
+    depth_list = [torch.randn((1,) + size, generator=generator) for size in [(70, 100), (64, 33), (95, 64)]]
+    for shape in [None, (128, 160)]:
+        pooled = pool_depth_list(depth_list, stride=32, shape=shape)
+        expected = pool_depth(padded_depth_batch(depth_list, shape or (95, 100)), stride=32)
+        assert torch.equal(pooled.tensors, expected.tensors)
+        assert torch.equal(pooled.mask, expected.mask)
+
+
+class Backbone(nn.Module):
+    num_channels = 8
+
+
+def build_hoitr(depth_position_embedding=None):
+    transformer = Transformer(d_model=16, nhead=2, num_encoder_layers=1, num_decoder_layers=1,
+                              num_decoder_layer_distance=1, num_decoder_layer_occlusion=1, dim_feedforward=32,
+                              return_intermediate_dec=True)
+    return HoiTR(Backbone(), transformer, num_classes=5, num_actions=3, num_queries=4,
+                 depth_position_embedding=depth_position_embedding)
+
+
+def test_learned_depth_position_embedding_is_not_saved():
+    torch.manual_seed(0)
+    model = build_hoitr(PositionEmbeddingLearned(8))
+    assert not any(key.startswith('depth_position_embedding') for key in model.state_dict())
+    assert not any(name.startswith('depth_position_embedding') for name, _ in model.named_parameters())
+    # Checkpoints of models without depth load strictly
+    model.load_state_dict(build_hoitr().state_dict())
+    depth = pool_depth(padded_depth_batch([torch.rand(1, 64, 96)], (64, 96)))
+    assert model.depth_position_embedding(depth).shape == (1, 16, 2, 3)
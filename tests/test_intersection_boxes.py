@@ -0,0 +1,79 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import numpy as np
+import torch
+
+import datasets.two_point_five_vrd as two_point_five_vrd
+from datasets.two_point_five_vrd import compute_intersection_boxes
+
+
+def image_intersection_boxes(human_boxes, object_boxes):
+    # The per-image computation compute_intersection_boxes() replaced,
+    # without the random shift and size
+    xmin = torch.max(human_boxes[:, 0] - human_boxes[:, 2] / 2, object_boxes[:, 0] - object_boxes[:, 2] / 2)
+    ymin = torch.max(human_boxes[:, 1] - human_boxes[:, 3] / 2, object_boxes[:, 1] - object_boxes[:, 3] / 2)
+    xmax = torch.min(human_boxes[:, 0] + human_boxes[:, 2] / 2, object_boxes[:, 0] + object_boxes[:, 2] / 2)
+    ymax = torch.min(human_boxes[:, 1] + human_boxes[:, 3] / 2, object_boxes[:, 1] + object_boxes[:, 3] / 2)
+    xmin_adjusted, xmax_adjusted = torch.min(xmin, xmax), torch.max(xmin, xmax)
+    ymin_adjusted, ymax_adjusted = torch.min(ymin, ymax), torch.max(ymin, ymax)
+    w = xmax_adjusted - xmin_adjusted
+    h = ymax_adjusted - ymin_adjusted
+    cx = (xmin_adjusted + xmax_adjusted) / 2
+    cy = (ymin_adjusted + ymax_adjusted) / 2
+    if two_point_five_vrd.DO_NOT_PREDICT_INTERSECTION_BOX_IF_NO_INTERSECTION:
+        if (xmin > xmax).any() or (ymin > ymax).any():
+            w = w * 0 - 1
+            h = h * 0 - 1
+    return torch.vstack([cx, cy, w, h]).T
+
+
+def random_boxes(num_boxes, generator):
+    centers = torch.rand(num_boxes, 2, generator=generator)
+    sizes = 0.05 + 0.4 * torch.rand(num_boxes, 2, generator=generator)
+    return torch.cat([centers, sizes], dim=1)
+
+
+def batch(sizes):
+    generator = torch.Generator().manual_seed(0)
+    return random_boxes(sum(sizes), generator), random_boxes(sum(sizes), generator)
+
+
+def per_image(human_boxes, object_boxes, sizes):
+    return torch.cat([image_intersection_boxes(h, o) for h, o in zip(human_boxes.split(sizes),
+                                                                     object_boxes.split(sizes))])
+
+
+def test_compute_intersection_boxes_matches_per_image(monkeypatch):
+    sizes = [3, 0, 7, 1, 12]
+    human_boxes, object_boxes = batch(sizes)
+    # All relations of the first image intersect
+    object_boxes[:3] = human_boxes[:3]
+    for skip_without_intersection in [False, True]:
+        monkeypatch.setattr(two_point_five_vrd, 'DO_NOT_PREDICT_INTERSECTION_BOX_IF_NO_INTERSECTION',
+                            skip_without_intersection)
+        expected = per_image(human_boxes, object_boxes, sizes)
+        assert torch.allclose(compute_intersection_boxes(human_boxes, object_boxes, sizes), expected, atol=1e-6)
+        assert torch.allclose(compute_intersection_boxes(human_boxes[:3], object_boxes[:3]), expected[:3], atol=1e-6)
+    # Some images have relations without intersection, others not
+    assert len({bool((box[:, 2] < 0).any()) for box in expected.split(sizes) if len(box)}) == 2
+
+
+def test_compute_intersection_boxes_draws_noise_per_image(monkeypatch):
+    sizes = [4, 6]
+    human_boxes, object_boxes = batch(sizes)
+    expected = per_image(human_boxes, object_boxes, sizes)
+    monkeypatch.setattr(two_point_five_vrd, 'RANDOMLY_SHIFT_GT_INTERSECTION_BOXES', True)
+    monkeypatch.setattr(two_point_five_vrd, 'RANDOMLY_ADJUST_SIZES_OF_GT_INTERSECTION_BOXES', True)
+    np.random.seed(0)
+    boxes = compute_intersection_boxes(human_boxes, object_boxes, sizes)
+    # Shift and size relative to the box sizes are the same within an image
+    shift = (boxes[:, :2] - expected[:, :2]) / expected[:, 2:]
+    scale = boxes[:, 2:] / expected[:, 2:]
+    for image_shift, image_scale in zip(shift.split(sizes), scale.split(sizes)):
+        assert torch.allclose(image_shift, image_shift[:1].expand_as(image_shift), atol=1e-4)
+        assert torch.allclose(image_scale, image_scale[:1].expand_as(image_scale), atol=1e-4)
+    assert not torch.allclose(shift[0], shift[-1])
@@ -0,0 +1,20 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+from datasets.loader_profile import data_loader_options
+
+
+def test_data_loader_options():
+    profile = {'train': {'num_workers': 4, 'prefetch_factor': 3, 'pin_memory': True},
+               'valid': {'num_workers': 0, 'prefetch_factor': 2}}
+    assert data_loader_options(profile, 'train', 8) == dict(num_workers=4, prefetch_factor=3, pin_memory=True)
+    # No prefetch factor without workers, and the options of 'valid' for 'test'
+    assert data_loader_options(profile, 'valid', 8) == dict(num_workers=0)
+    assert data_loader_options(profile, 'test', 8) == dict(num_workers=0)
+    assert data_loader_options(dict(), 'train', 8) == dict(num_workers=8)
+    # The given number of workers if the profile sets none
+    assert data_loader_options({'train': {'pin_memory': False}}, 'train', 2) == dict(pin_memory=False, num_workers=2)
+    assert data_loader_options({'train': {'prefetch_factor': 4}}, 'train', 0) == dict(num_workers=0)
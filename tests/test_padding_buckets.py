@@ -0,0 +1,79 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import itertools
+
+import numpy as np
+import torch
+
+import util.misc as utils
+from util.misc import PaddingBuckets, fit_padding_sizes
+from conftest import make_sample
+
+
+def total_padding(sizes, buckets, stride=32):
+    rounded = np.ceil(np.asarray(sizes) / stride) * stride
+    return sum(min(bucket for bucket in buckets if bucket >= size) - size for size in rounded)
+
+
+def brute_force_padding(sizes, num_sizes, stride=32):
+    # Least padding over all choices of at most num_sizes of the sizes
+    # (rounded to stride), the largest one included
+    values = sorted(set(int(v) for v in np.ceil(np.asarray(sizes) / stride) * stride))
+    return min(total_padding(sizes, list(smaller) + [values[-1]], stride)
+               for k in range(num_sizes) for smaller in itertools.combinations(values[:-1], k))
+
+
+def test_fit_padding_sizes_is_optimal():
+    rng = np.random.RandomState(0)
+    for _ in range(20):
+        sizes = rng.randint(200, 1333, rng.randint(1, 40))
+        for num_sizes in [1, 2, 3, 4]:
+            buckets = fit_padding_sizes(sizes, num_sizes)
+            assert buckets == sorted(buckets) and len(buckets) <= num_sizes
+            assert all(bucket % 32 == 0 for bucket in buckets)
+            assert buckets[-1] >= sizes.max()
+            assert total_padding(sizes, buckets) == brute_force_padding(sizes, num_sizes)
+
+
+def test_padding_buckets_shape():
+    buckets = PaddingBuckets.fit([[480, 640], [600, 800], [800, 1088], [500, 660]], num_buckets=2)
+    # Widths 640, 672 and 800 padded to 800 (288 columns of padding) rather
+    # than to 672 and 1088 (320)
+    assert buckets.heights == [512, 800] and buckets.widths == [800, 1088]
+    assert buckets.shape(480, 640) == (512, 800)
+    assert buckets.shape(513, 801) == (800, 1088)
+    # Beyond the largest bucket: multiples of the stride
+    assert buckets.shape(801, 1100) == (832, 1120)
+
+
+def test_collate_pads_to_padding_buckets(pool):
+    generator = torch.Generator().manual_seed(0)
+    batch = [make_sample(generator, 40, 56), make_sample(generator, 64, 30)]
+    samples, _, _ = utils.collate_fn(list(batch), padding_buckets=PaddingBuckets([64, 128], [64, 96]))
+    assert samples.tensors.shape == (2, 3, 64, 64)
+    expected = utils.nested_tensor_from_tensor_list([sample[0] for sample in batch])
+    assert torch.equal(samples.tensors[:, :, :64, :56], expected.tensors)
+    assert torch.equal(samples.mask[:, :64, :56], expected.mask)
+    assert samples.mask[:, :, 56:].all()
+
+
+def test_batch_transforms_pad_instead_of_collate():
+    from datasets.two_point_five_vrd import two_point_five_VRD, BatchTransforms, IntersectionBoxes
+
+    buckets = PaddingBuckets([64, 128], [64, 96])
+    dataset = two_point_five_VRD.__new__(two_point_five_VRD)
+    dataset.depth_stride = None
+    for batch_transforms, collate_buckets in [(IntersectionBoxes(), buckets),
+                                              (BatchTransforms(0, 1, 0, 1), None)]:
+        dataset.batch_transforms = batch_transforms
+        dataset.set_padding_buckets(buckets)
+        collate = utils.build_collate_fn(dataset)
+        assert collate.keywords.get('padding_buckets') is collate_buckets
+        if isinstance(batch_transforms, BatchTransforms):
+            # The raw images are padded to the largest, the resized ones to
+            # the buckets
+            assert batch_transforms.padding_buckets is buckets
@@ -0,0 +1,68 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import math
+
+import pytest
+import torch
+
+from models.position_encoding import PositionEmbeddingSine, CachedPositionEmbeddingSine
+from util.misc import NestedTensor
+
+
+def original_sine(tensor_list, num_pos_feats, temperature=10000, normalize=False, scale=2 * math.pi):
+    # PositionEmbeddingSine.forward() before the position embeddings were
+    # cached
+    not_mask = ~tensor_list.mask
+    y_embed = not_mask.cumsum(1, dtype=torch.float32)
+    x_embed = not_mask.cumsum(2, dtype=torch.float32)
+    if normalize:
+        eps = 1e-6
+        y_embed = y_embed / (y_embed[:, -1:, :] + eps) * scale
+        x_embed = x_embed / (x_embed[:, :, -1:] + eps) * scale
+    dim_t = torch.arange(num_pos_feats, dtype=torch.float32)
+    dim_t = temperature ** (2 * (torch.div(dim_t, 2, rounding_mode='floor')) / num_pos_feats)
+    pos_x = x_embed[:, :, :, None] / dim_t
+    pos_y = y_embed[:, :, :, None] / dim_t
+    pos_x = torch.stack((pos_x[:, :, :, 0::2].sin(), pos_x[:, :, :, 1::2].cos()), dim=4).flatten(3)
+    pos_y = torch.stack((pos_y[:, :, :, 0::2].sin(), pos_y[:, :, :, 1::2].cos()), dim=4).flatten(3)
+    return torch.cat((pos_y, pos_x), dim=3).permute(0, 3, 1, 2)
+
+
+def feature_masks(sizes, shape):
+    """
+    :return: NestedTensor of a batch of feature maps valid in the top-left
+        sizes of shape, as collate_fn and the backbone give them.
+    """
+    mask = torch.ones((len(sizes),) + shape, dtype=torch.bool)
+    for m, (h, w) in zip(mask, sizes):
+        m[:h, :w] = False
+    return NestedTensor(torch.zeros((len(sizes), 3) + shape), mask)
+
+
+@pytest.mark.parametrize('normalize', [True, False])
+def test_cached_position_embedding_matches_sine(normalize):
+    sine = PositionEmbeddingSine(16, normalize=normalize)
+    cached = CachedPositionEmbeddingSine(16, normalize=normalize, cache_size=2)
+    batches = [feature_masks([(5, 7), (3, 7), (5, 2)], (5, 7)),
+               feature_masks([(4, 6), (4, 6)], (6, 9)),
+               # Fully padded rows and columns, and a batch seen before
+               feature_masks([(0, 0), (6, 1)], (6, 9)),
+               feature_masks([(5, 7), (3, 7), (5, 2)], (5, 7))]
+    for _ in range(2):
+        for batch in batches:
+            expected = original_sine(batch, 16, normalize=normalize)
+            assert torch.allclose(sine(batch), expected, atol=1e-6)
+            assert torch.allclose(cached(batch), expected, atol=1e-6)
+    assert len(cached._image_cache) <= 2
+
+
+def test_cached_position_embedding_falls_back_for_other_masks():
+    cached = CachedPositionEmbeddingSine(16, normalize=True)
+    batch = feature_masks([(4, 5)], (5, 6))
+    # Not a top-left rectangle
+    batch.mask[0, 0, 0] = True
+    assert torch.allclose(cached(batch), original_sine(batch, 16, normalize=True), atol=1e-6)
@@ -0,0 +1,84 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import torch
+from torch import nn
+
+from models.hoitr import HoiTR, PRUNED_QUERY_LOGIT, scatter_queries
+from models.transformer import Transformer
+from util.misc import NestedTensor
+
+NUM_QUERIES = 6
+
+
+class Backbone(nn.Module):
+    """
+    Random stride-32 features of the images and their positional encoding.
+    """
+    num_channels = 8
+
+    def forward(self, samples):
+        batch_size, _, height, width = samples.tensors.shape
+        shape = (batch_size, self.num_channels, height // 32, width // 32)
+        mask = samples.mask[:, ::32, ::32]
+        generator = torch.Generator().manual_seed(0)
+        return [NestedTensor(torch.randn(shape, generator=generator), mask)], \
+            [torch.randn((batch_size, 16) + shape[2:], generator=generator)]
+
+
+def build_hoitr(top_k):
+    torch.manual_seed(0)
+    transformer = Transformer(d_model=16, nhead=2, num_encoder_layers=1, num_decoder_layers=2,
+                              num_decoder_layer_distance=2, num_decoder_layer_occlusion=2, dim_feedforward=32,
+                              return_intermediate_dec=True)
+    model = HoiTR(Backbone(), transformer, num_classes=5, num_actions=3, num_queries=NUM_QUERIES, aux_loss=True)
+    model.query_pruning_top_k = top_k
+    model.query_pruning_threshold = None
+    return model.eval()
+
+
+def samples():
+    mask = torch.ones((2, 96, 128), dtype=torch.bool)
+    mask[0, :96, :128] = False
+    mask[1, :64, :96] = False
+    return NestedTensor(torch.zeros((2, 3, 96, 128)), mask)
+
+
+def test_scatter_queries():
+    values = torch.arange(2 * 2 * 2 * 3, dtype=torch.float).view(2, 2, 2, 3)
+    kept_queries = torch.tensor([[0, 3], [1, 2]])
+    out = scatter_queries(values, kept_queries, 4, torch.tensor([-1., -2., -3.]))
+    assert out.shape == (2, 2, 4, 3)
+    for image, queries in enumerate(kept_queries.tolist()):
+        assert torch.equal(out[:, image, queries], values[:, image])
+        others = [query for query in range(4) if query not in queries]
+        assert (out[:, image, others] == torch.tensor([-1., -2., -3.])).all()
+
+
+def test_keeping_all_queries_changes_nothing():
+    with torch.no_grad():
+        outputs = build_hoitr(None)(samples(), prune_queries=True)
+        pruned_outputs = build_hoitr(NUM_QUERIES)(samples(), prune_queries=True)
+    for key, value in outputs.items():
+        if key != 'aux_outputs':
+            assert torch.allclose(pruned_outputs[key], value, atol=1e-6), key
+
+
+def test_pruned_queries_are_background():
+    model = build_hoitr(2)
+    with torch.no_grad():
+        outputs = model(samples(), prune_queries=True)
+        unpruned_outputs = model(samples())
+    kept = (outputs['action_pred_logits'][..., :-1] != PRUNED_QUERY_LOGIT).any(-1)
+    assert kept.sum(1).tolist() == [2, 2]
+    for key in ['action_pred_logits', 'occlusion_pred_logits']:
+        pruned = outputs[key][~kept]
+        assert (pruned[:, :-1] == PRUNED_QUERY_LOGIT).all() and (pruned[:, -1] == 0).all()
+        assert (pruned.argmax(-1) == pruned.shape[-1] - 1).all()
+    # The pair decoder outputs are those of every query, and without
+    # prune_queries (validate()) no query is pruned
+    assert torch.equal(outputs['human_pred_logits'], unpruned_outputs['human_pred_logits'])
+    assert (unpruned_outputs['action_pred_logits'][..., :-1] != PRUNED_QUERY_LOGIT).all()
@@ -0,0 +1,46 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import numpy as np
+import pytest
+
+from util.raw_labels import raw_votes_to_frequencies, NUM_RAW_LABEL_BINS
+
+
+def loop_frequencies(raw_votes):
+    # The per-relation loop raw_votes_to_frequencies() replaced
+    labels = []
+    for raw in raw_votes:
+        values, counts = np.unique(np.array([int(x) for x in raw.split(',')]), return_counts=True)
+        frequencies = counts / counts.sum()
+        expanded_frequency = np.zeros(NUM_RAW_LABEL_BINS, dtype=np.float16)
+        for value, frequency in zip(values, frequencies):
+            expanded_frequency[value] = frequency
+        labels.append(expanded_frequency)
+    return np.array(labels, dtype=np.float16).reshape(-1, NUM_RAW_LABEL_BINS)
+
+
+def test_raw_votes_to_frequencies_matches_loop():
+    rng = np.random.RandomState(0)
+    raw_votes = [','.join(str(v) for v in rng.randint(0, NUM_RAW_LABEL_BINS, rng.randint(1, 8)))
+                 for _ in range(200)] + ['3', '0,0,0', '-1,0,0', '-5,2']
+    frequencies = raw_votes_to_frequencies(raw_votes)
+    assert frequencies.dtype == np.float16
+    assert np.array_equal(frequencies, loop_frequencies(raw_votes))
+    assert raw_votes_to_frequencies([]).shape == (0, NUM_RAW_LABEL_BINS)
+
+
+def test_raw_votes_to_frequencies_counts_negative_votes_in_their_bin():
+    # The loop kept the frequency of only one of -1 and 4
+    assert np.array_equal(raw_votes_to_frequencies(['-1,4', '1,-4,2,2']),
+                          np.array([[0, 0, 0, 0, 1], [0, 0.5, 0.5, 0, 0]], dtype=np.float16))
+
+
+def test_raw_votes_to_frequencies_rejects_votes_out_of_range():
+    with pytest.raises(ValueError):
+        raw_votes_to_frequencies(['1,5'])
+    with pytest.raises(ValueError):
+        raw_votes_to_frequencies(['-6'])
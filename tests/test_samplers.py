@@ -0,0 +1,35 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import numpy as np
+
+from datasets.samplers import HardExampleSampler
+
+
+def test_hard_example_sampler_without_uniform_mix_fills_with_zero_loss_images():
+    image_ids = list(range(10))
+    sampler = HardExampleSampler(image_ids, budget=0.5, uniform_mix=0, num_replicas=1, rank=0, seed=0)
+    # Only 2 of the 5 images to draw have a non-zero loss
+    sampler.record(image_ids, np.array([3, 1] + [0] * 8, dtype=np.float32))
+    sampler.update()
+    for epoch in range(5):
+        sampler.set_epoch(epoch)
+        indices = list(sampler)
+        assert len(indices) == len(sampler) == 5
+        assert len(set(indices)) == 5
+        assert {0, 1} <= set(indices)
+
+
+def test_hard_example_sampler_splits_indices_across_processes():
+    image_ids = ['a', 'b', 'c', 'd', 'e']
+    samplers = [HardExampleSampler(image_ids, budget=1, uniform_mix=0.2, num_replicas=2, rank=rank, seed=3)
+                for rank in range(2)]
+    for sampler in samplers:
+        sampler.record(image_ids, np.arange(5, dtype=np.float32))
+        sampler.update()
+    indices = [list(sampler) for sampler in samplers]
+    assert len(indices[0]) == len(indices[1]) == 3
+    assert set(indices[0] + indices[1]) == set(range(5))
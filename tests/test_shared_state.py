@@ -0,0 +1,42 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import os
+import pickle
+import subprocess
+import sys
+
+import numpy as np
+
+from datasets.shared_state import SharedArrays, SEGMENT_PREFIX
+
+
+def test_publish_and_attach(tmp_path):
+    arrays = dict(boxes=np.random.RandomState(0).rand(7, 4).astype(np.float32),
+                  names=np.array(['a.jpg', 'bb.jpg']), empty=np.zeros((0, 5), dtype=np.float16))
+    shared = SharedArrays.publish(arrays, directory=str(tmp_path))
+    attached = pickle.loads(pickle.dumps(shared))
+    for key, array in arrays.items():
+        assert attached[key].dtype == array.dtype
+        assert np.array_equal(attached[key], array)
+    path = shared.path
+    del shared
+    assert not os.path.exists(path)
+
+
+def test_segments_of_killed_processes_are_removed(tmp_path):
+    # The pid of a process that has exited, as if it was killed before
+    # removing its segments
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    stale = ['{}{}-0123456789ab'.format(SEGMENT_PREFIX, process.pid),
+             '{}{}-0123456789ab.{}.tmp'.format(SEGMENT_PREFIX, process.pid, process.pid)]
+    live = '{}{}-0123456789ab'.format(SEGMENT_PREFIX, os.getpid())
+    for name in stale + [live, 'other-file']:
+        (tmp_path / name).write_bytes(b'x')
+
+    shared = SharedArrays.publish(dict(x=np.arange(3)), directory=str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == sorted([live, 'other-file', shared.name])
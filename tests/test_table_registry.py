@@ -0,0 +1,51 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from datasets.table_registry import TableRegistry, compact_table
+
+
+@pytest.fixture
+def csv_root(tmp_path):
+    rng = np.random.RandomState(0)
+    table = pd.DataFrame(dict(image_id=rng.choice(['a', 'b', 'c'], 50), score=rng.rand(50),
+                              label=rng.randint(0, 600, 50)))
+    table.to_csv(tmp_path / 'table.csv', index=False)
+    return tmp_path
+
+
+@pytest.mark.parametrize('cache_format', ['feather', 'pickle'])
+def test_cached_copy_is_reloaded(csv_root, cache_format):
+    expected = compact_table(pd.read_csv(csv_root / 'table.csv'))
+    registry = TableRegistry(str(csv_root), cache_dir=str(csv_root / 'cache'), cache_format=cache_format)
+    registry.register('table', 'table.csv')
+    pd.testing.assert_frame_equal(registry['table'], expected)
+
+    reloaded = TableRegistry(str(csv_root), cache_dir=str(csv_root / 'cache'), cache_format=cache_format)
+    reloaded.register('table', 'table.csv')
+    assert reloaded.cache_path('table') == registry.cache_path('table')
+    pd.testing.assert_frame_equal(reloaded['table'], expected)
+
+
+def test_corrupted_copy_warns_and_reads_csv(csv_root):
+    registry = TableRegistry(str(csv_root), cache_dir=str(csv_root / 'cache'), cache_format='pickle')
+    registry.register('table', 'table.csv')
+    expected = registry['table']
+    with open(registry.cache_path('table'), 'wb') as f:
+        f.write(b'not a table')
+    registry.unload()
+    with pytest.warns(UserWarning, match='Ignoring the cached copy'):
+        pd.testing.assert_frame_equal(registry['table'], expected)
+
+
+def test_no_cache_by_default(csv_root):
+    registry = TableRegistry(str(csv_root))
+    registry.register('table', 'table.csv')
+    registry['table']
+    assert sorted(p.name for p in csv_root.iterdir()) == ['table.csv']
@@ -0,0 +1,79 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+import torch
+
+from models.transformer import Transformer
+
+
+def build_transformer():
+    torch.manual_seed(0)
+    return Transformer(d_model=32, nhead=4, num_encoder_layers=2, num_decoder_layers=2, num_decoder_layer_distance=2,
+                       num_decoder_layer_occlusion=2, dim_feedforward=64, return_intermediate_dec=True).eval()
+
+
+def padded_batch(sizes, shape, hidden_dim=32):
+    """
+    :return: Transformer.forward() arguments of images of the given sizes
+        padded to shape.
+    """
+    generator = torch.Generator().manual_seed(1)
+    mask = torch.ones((len(sizes),) + shape, dtype=torch.bool)
+    for m, (h, w) in zip(mask, sizes):
+        m[:h, :w] = False
+    src = torch.randn((len(sizes), hidden_dim) + shape, generator=generator)
+    pos = torch.randn((len(sizes), hidden_dim) + shape, generator=generator)
+    query_embed = torch.randn(10, hidden_dim, generator=generator)
+    return src, mask, query_embed, pos
+
+
+def test_sparse_encoder_matches_dense_encoder():
+    transformer = build_transformer()
+    src, mask, query_embed, pos = padded_batch([(3, 5), (4, 2), (2, 6)], (4, 6))
+    flatten = lambda x: x.flatten(2).permute(2, 0, 1)
+    with torch.no_grad():
+        outputs = []
+        for sparse in [False, True]:
+            transformer.encoder.sparse = sparse
+            memory = transformer.encoder(flatten(src), src_key_padding_mask=mask.flatten(1), pos=flatten(pos))
+            outputs.append((memory, transformer(src, mask, query_embed, pos)))
+    (dense_memory, dense), (sparse_memory, sparse) = outputs
+    valid = ~mask.flatten(1).T
+    assert torch.allclose(dense_memory[valid], sparse_memory[valid], atol=1e-5)
+    # The padding tokens kept up to the longest image as well, 0 elsewhere
+    kept = sparse_memory.abs().sum(-1) > 0
+    assert kept.sum(0).tolist() == [15, 15, 15]
+    assert torch.allclose(dense_memory[kept], sparse_memory[kept], atol=1e-5)
+    # Padding of memory differs, the decoders mask it
+    for a, b in zip(dense[:3], sparse[:3]):
+        assert torch.allclose(a, b, atol=1e-5)
+
+
+def test_fused_cascade_decoders_match_sequential_decoders():
+    transformer = build_transformer()
+    src, mask, query_embed, pos = padded_batch([(3, 5), (4, 2)], (4, 6))
+    flatten = lambda x: x.flatten(2).permute(2, 0, 1)
+    arguments = (query_embed.unsqueeze(1).repeat(1, 2, 1), flatten(src), mask.flatten(1), flatten(pos),
+                 (2, 32, 4, 6))
+    assert transformer.can_fuse_cascade_decoders()
+    with torch.no_grad():
+        sequential = transformer.cascade_decoders(*arguments, fused=False)
+        fused = transformer.cascade_decoders(*arguments, fused=True)
+    for a, b in zip(sequential, fused):
+        assert a.shape == b.shape == (2, 2, 10, 32)
+        assert torch.allclose(a, b, atol=1e-5)
+    # Same gradients, in float64: the first self-attention attends zero
+    # queries, whose float32 gradients are rounding noise in either path
+    transformer.double()
+    arguments = tuple(a.double() if torch.is_tensor(a) and a.is_floating_point() else a for a in arguments)
+    gradients = []
+    for fused in [False, True]:
+        transformer.zero_grad()
+        sum(out.square().sum() for out in transformer.cascade_decoders(*arguments, fused=fused)).backward()
+        gradients.append([p.grad.clone() for p in transformer.distance_decoder.parameters()] +
+                         [p.grad.clone() for p in transformer.occlusion_decoder.parameters()])
+    for a, b in zip(*gradients):
+        assert torch.allclose(a, b, atol=1e-9)
@@ -0,0 +1,77 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Construction time of two_point_five_VRD annotations:
+    1. parsing every line with parse_one_gt_line() (previous behaviour),
+    2. cold cache: parsing + writing the cache,
+    3. warm cache: reloading the cache (memory-mapped with --mmap),
+    4. building every item from the reloaded arrays (done lazily in
+       __getitem__, i.e. spread over an epoch).
+
+Run from the project root:
+    python tools/benchmark/annotation_cache.py --ann_file ./data/2.5vrd/annotation_train_combined.odgt
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.two_point_five_vrd import parse_one_gt_line, get_label_vocabulary
+from datasets.annotation_cache import load_annotations
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser('2.5VRD annotation cache benchmark')
+    parser.add_argument('--ann_file', default='./data/2.5vrd/annotation_train_combined.odgt')
+    parser.add_argument('--repeats', default=3, type=int)
+    parser.add_argument('--mmap', action='store_true', help='memory-map the cached columns')
+    args = parser.parse_args()
+
+    parse_key = get_label_vocabulary().digest()
+    mmap_mode = 'c' if args.mmap else None
+
+    def parse():
+        with open(args.ann_file, 'r') as f:
+            return [parse_one_gt_line(l.strip()) for l in f.readlines()]
+
+    parse_times = [timed(parse)[0] for _ in range(args.repeats)]
+
+    cold_times, warm_times, access_times = [], [], []
+    for _ in range(args.repeats):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cold_times.append(timed(lambda: load_annotations(args.ann_file, parse_one_gt_line,
+                                                             cache_dir, parse_key, mmap_mode))[0])
+            warm_time, annotations = timed(lambda: load_annotations(args.ann_file, parse_one_gt_line,
+                                                                    cache_dir, parse_key, mmap_mode))
+            warm_times.append(warm_time)
+            access_times.append(timed(lambda: list(annotations))[0])
+        finally:
+            shutil.rmtree(cache_dir)
+
+    print(f'{args.ann_file}: {len(annotations)} images, '
+          f'{annotations.num_relations()} relations, {annotations.nbytes() / 1024 ** 2:.1f} MB of columns')
+    print(f'parse_one_gt_line (no cache): {np.median(parse_times):8.3f} s')
+    print(f'cold cache (parse + write):   {np.median(cold_times):8.3f} s')
+    print(f'warm cache (reload):          {np.median(warm_times):8.3f} s')
+    print(f'all items from warm cache:    {np.median(access_times):8.3f} s')
+    print(f'speedup (no cache / warm):    {np.median(parse_times) / np.median(warm_times):8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
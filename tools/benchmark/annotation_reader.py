@@ -0,0 +1,115 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Startup time, resident memory and random access throughput of the 2.5VRD
+annotations of a split, read
+    eager:   readlines() and parse_one_gt_line() of every line (the
+             annotation store without cache),
+    store:   the cached annotation store (ANNOTATION_CACHE_DIR, memory-mapped
+             with ANNOTATION_STORE_MMAP),
+    indexed: IndexedOdgtReader (INDEXED_ANNOTATION_READER).
+The annotation file can be repeated to emulate a larger custom set. Every
+mode runs in its own process, so memory is measured separately.
+
+Run from the project root:
+    python tools/benchmark/annotation_reader.py --image_set train --repeat 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+annotation_files = {
+    'train': './data/2.5vrd/annotation_train_combined.odgt',
+    'valid': './data/2.5vrd/annotation_valid_combined.odgt',
+    'test': './data/2.5vrd/annotation_test_combined.odgt',
+}
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def run_mode(mode, ann_file, cache_dir, num_reads, seed):
+    from datasets.two_point_five_vrd import parse_one_gt_line, parse_one_gt_line_as_stored, get_label_vocabulary
+    from datasets.annotation_cache import load_annotations
+    from datasets.annotation_reader import IndexedOdgtReader
+    from datasets.annotation_store import AnnotationStore
+    parse_key = get_label_vocabulary().digest()
+    # Build the cache beforehand, only its loading is part of the startup
+    if mode == 'store':
+        load_annotations(ann_file, parse_one_gt_line, cache_dir=cache_dir, parse_key=parse_key)
+
+    rss = rss_mb()
+    start = time.perf_counter()
+    if mode == 'eager':
+        with open(ann_file, 'r') as f:
+            annotations = AnnotationStore.from_annotations([parse_one_gt_line(l.strip()) for l in f.readlines()])
+    elif mode == 'store':
+        annotations = load_annotations(ann_file, parse_one_gt_line, cache_dir=cache_dir, parse_key=parse_key,
+                                       mmap_mode='c')
+    else:
+        annotations = IndexedOdgtReader(ann_file, parse_one_gt_line_as_stored)
+    startup = time.perf_counter() - start
+    memory = rss_mb() - rss
+
+    order = np.random.RandomState(seed).randint(len(annotations), size=num_reads)
+    start = time.perf_counter()
+    for index in order:
+        annotations[int(index)]
+    throughput = num_reads / (time.perf_counter() - start)
+    print(json.dumps(dict(mode=mode, items=len(annotations), startup=startup, memory=memory,
+                          throughput=throughput)))
+
+
+def main():
+    parser = argparse.ArgumentParser('Annotation reader benchmark')
+    parser.add_argument('--image_set', default='train', choices=['train', 'valid', 'test'])
+    parser.add_argument('--repeat', default=1, type=int, help='number of copies of the annotation file')
+    parser.add_argument('--num_reads', default=2000, type=int)
+    parser.add_argument('--seed', default=42, type=int)
+    parser.add_argument('--mode', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--ann_file', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--cache_dir', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        run_mode(args.mode, args.ann_file, args.cache_dir, args.num_reads, args.seed)
+        return
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        ann_file = os.path.join(temp_dir, 'annotations.odgt')
+        with open(annotation_files[args.image_set], 'r') as f:
+            lines = [l.strip() for l in f if l.strip()]
+        with open(ann_file, 'w') as f:
+            for _ in range(args.repeat):
+                f.write('\n'.join(lines) + '\n')
+        print(f'{args.image_set} x {args.repeat}: {len(lines) * args.repeat} lines, '
+              f'{os.path.getsize(ann_file) / 1024 ** 2:.1f} MB')
+        print(f'{"mode":8s} {"startup s":>10s} {"memory MB":>10s} {"reads/s":>10s}')
+        for mode in ['eager', 'store', 'indexed']:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--mode', mode, '--ann_file', ann_file,
+                                     '--cache_dir', os.path.join(temp_dir, 'cache'),
+                                     '--num_reads', str(args.num_reads), '--seed', str(args.seed)],
+                                    check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f'{mode:8s} {result["startup"]:10.2f} {result["memory"]:10.1f} {result["throughput"]:10.0f}')
+
+
+if __name__ == '__main__':
+    main()
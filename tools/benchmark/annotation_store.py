@@ -0,0 +1,125 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Memory of DataLoader workers reading 2.5VRD annotations held as
+    list:  a list of dicts of tensors (previous self.annotations),
+    store: an AnnotationStore in memory,
+    mmap:  an AnnotationStore memory-mapped from its cache folder.
+
+Every worker accesses its items like two_point_five_VRD.__getitem__ does,
+over several epochs with persistent workers, and reports its RSS, its
+private dirty memory (pages copied on write after the fork) and its PSS,
+read from /proc/self/smaps_rollup (Linux only).
+
+Run from the project root:
+    python tools/benchmark/annotation_store.py --num_images 50000
+"""
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+from collections import defaultdict
+
+import numpy as np
+import torch
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.two_point_five_vrd import parse_one_gt_line
+from datasets.annotation_store import AnnotationStore
+
+
+def memory_stats():
+    stats = dict()
+    with open('/proc/self/smaps_rollup', 'r') as f:
+        for line in f:
+            fields = line.split()
+            if fields[0] in ['Rss:', 'Pss:', 'Private_Dirty:']:
+                stats[fields[0][:-1]] = int(fields[1]) / 1024
+    return stats
+
+
+class AnnotationProbe(Dataset):
+    def __init__(self, annotations, gc_every):
+        self.annotations = annotations
+        self.gc_every = gc_every
+
+    def __len__(self):
+        return len(self.annotations)
+
+    def __getitem__(self, indices):
+        # One call per batch of indices, to keep the inter-process traffic low
+        for index in indices:
+            ann = self.annotations[index]
+            target = ann['annotations']
+            sum(float(target[name].float().sum()) for name in ['human_boxes', 'object_boxes', 'action_labels'])
+            # __getitem__ calls gc.collect() (every item), which visits every
+            # container object of the process
+            if self.gc_every > 0 and index % self.gc_every == 0:
+                gc.collect()
+        return torch.utils.data.get_worker_info().id, memory_stats()
+
+
+def run(annotations, num_workers, epochs, gc_every, batch_size):
+    sampler = BatchSampler(RandomSampler(range(len(annotations))), batch_size, drop_last=False)
+    loader = DataLoader(AnnotationProbe(annotations, gc_every), sampler=sampler, batch_size=None,
+                        num_workers=num_workers, persistent_workers=True)
+    last_stats = dict()
+    for _ in range(epochs):
+        for worker_id, stats in loader:
+            last_stats[worker_id] = stats
+    del loader
+    summary = defaultdict(list)
+    for stats in last_stats.values():
+        for key, value in stats.items():
+            summary[key].append(value)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser('AnnotationStore worker memory benchmark')
+    parser.add_argument('--ann_file', default='./data/2.5vrd/annotation_train_combined.odgt')
+    parser.add_argument('--num_images', default=50000, type=int,
+                        help='lines of ann_file are repeated to reach num_images')
+    parser.add_argument('--num_workers', default=[1, 2, 4, 8], type=int, nargs='+')
+    parser.add_argument('--epochs', default=2, type=int)
+    parser.add_argument('--batch_size', default=256, type=int)
+    parser.add_argument('--gc_every', default=1000, type=int,
+                        help='call gc.collect() every gc_every items in the workers, 0 to disable')
+    parser.add_argument('--modes', default=['list', 'store', 'mmap'], nargs='+')
+    args = parser.parse_args()
+
+    with open(args.ann_file, 'r') as f:
+        lines = [l.strip() for l in f.readlines()]
+    lines = [lines[i % len(lines)] for i in range(args.num_images)]
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        print(f'{"mode":6s} {"workers":>7s} {"RSS/worker":>11s} {"private/worker":>15s} {"PSS total":>10s}  (MB)')
+        for mode in args.modes:
+            annotations = [parse_one_gt_line(l) for l in lines]
+            if mode != 'list':
+                annotations = AnnotationStore.from_annotations(annotations)
+            if mode == 'mmap':
+                annotations.save(os.path.join(cache_dir, 'store'))
+                annotations = AnnotationStore.load(os.path.join(cache_dir, 'store'), mmap_mode='c')
+            gc.collect()
+            for num_workers in args.num_workers:
+                summary = run(annotations, num_workers, args.epochs, args.gc_every, args.batch_size)
+                pss_total = sum(summary['Pss']) + memory_stats()['Pss']
+                print(f'{mode:6s} {num_workers:7d} {np.mean(summary["Rss"]):11.1f} '
+                      f'{np.mean(summary["Private_Dirty"]):15.1f} {pss_total:10.1f}')
+            del annotations
+            gc.collect()
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Average area (height x width) of the padded image tensor per batch, as
+train_one_epoch() logs it (padded_area), and fraction of the padded pixels
+that are padding, over the batches of an epoch of the 2.5VRD training set
+with training images resized to
+    per-image: a random scale per image (RandomResize, the default),
+    per-batch: one random scale per batch (ScaleBatchSampler,
+               BATCH_SCALE_SAMPLING),
+for batches from RandomSampler + BatchSampler and from
+AspectRatioBatchSampler (BUCKETED_BATCH_SAMPLER). Resized sizes are computed
+from the annotated image sizes, so no image is decoded; the second branch of
+RandomSelect (resize to 400-600 first) gives the same sizes up to rounding.
+
+Run from the project root:
+    python tools/benchmark/batch_scale.py --batch_size 2 8
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.two_point_five_vrd import build, get_size_with_aspect_ratio
+from datasets.samplers import AspectRatioBatchSampler, ScaleBatchSampler
+
+train_scales = [480, 512, 544, 576, 608, 640, 672, 704, 736, 768, 800]
+
+
+def padded_batches(batches, image_sizes, scales, rng, max_size=1333):
+    """
+    :param batches: lists of indices, or of (index, scale) pairs.
+    :return: (average padded area, padded fraction) of the batches.
+    """
+    areas, padded, valid = [], 0, 0
+    for batch in batches:
+        sizes = []
+        for item in batch:
+            index, scale = item if isinstance(item, tuple) else (item, scales[rng.randint(len(scales))])
+            height, width = image_sizes[index]
+            sizes.append(get_size_with_aspect_ratio((width, height), scale, max_size))
+        sizes = np.array(sizes)
+        areas.append(sizes[:, 0].max() * sizes[:, 1].max())
+        padded += len(batch) * areas[-1]
+        valid += np.prod(sizes, axis=1).sum()
+    return np.mean(areas), 1 - valid / padded
+
+
+def main():
+    parser = argparse.ArgumentParser('Batch scale sampling benchmark')
+    parser.add_argument('--batch_size', default=[2, 8], type=int, nargs='+')
+    parser.add_argument('--num_epochs', default=3, type=int)
+    parser.add_argument('--seed', default=42, type=int)
+    args = parser.parse_args()
+
+    dataset = build('train', test_scale=-1)
+    image_sizes = dataset.image_sizes()
+    print(f'train: {len(dataset)} images, {args.num_epochs} epochs '
+          f'(padded area per batch in kpixels, padded fraction)')
+    print(f'{"batch":>5s} {"sampler":>8s} {"per-image":>16s} {"per-batch":>16s}')
+    for batch_size in args.batch_size:
+        for sampler_name in ['random', 'bucketed']:
+            results = np.zeros((2, 2))
+            for epoch in range(args.num_epochs):
+                if sampler_name == 'random':
+                    generator = torch.Generator()
+                    generator.manual_seed(args.seed + epoch)
+                    batch_sampler = torch.utils.data.BatchSampler(
+                        torch.utils.data.RandomSampler(dataset, generator=generator), batch_size, drop_last=True)
+                else:
+                    batch_sampler = AspectRatioBatchSampler(image_sizes, batch_size, drop_last=True, seed=args.seed)
+                    batch_sampler.set_epoch(epoch)
+                batches = list(batch_sampler)
+                rng = np.random.RandomState(args.seed + epoch)
+                results[0] += padded_batches(batches, image_sizes, train_scales, rng)
+                scale_sampler = ScaleBatchSampler(batches, train_scales, seed=args.seed)
+                scale_sampler.set_epoch(epoch)
+                results[1] += padded_batches(list(scale_sampler), image_sizes, train_scales, rng)
+            results /= args.num_epochs
+            print(f'{batch_size:5d} {sampler_name:>8s} ' +
+                  ' '.join(f'{area / 1000:9.0f} {fraction:6.3f}' for area, fraction in results))
+
+
+if __name__ == '__main__':
+    main()
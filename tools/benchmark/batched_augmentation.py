@@ -0,0 +1,99 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Throughput (samples/s) on CPU of the augmentation of a 2.5VRD split:
+    per-image: make_hico_transforms() on PIL images, then collate_fn() and
+               IntersectionBoxes,
+    batched:   ToUint8Tensor, collate_fn() of the uint8 images, then
+               BatchTransforms (BATCHED_AUGMENTATION_SPLITS).
+Images are decoded once beforehand, so decoding (which both share) is not
+part of the comparison.
+
+Run from the project root:
+    python tools/benchmark/batched_augmentation.py --image_set train --batch_size 8
+"""
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.two_point_five_vrd import build, make_hico_transforms, make_hico_batch_transforms, ToUint8Tensor, \
+    IntersectionBoxes
+import util.misc as utils
+
+
+def per_image(batch, transforms):
+    samples = [transforms(img, depth, target) for img, depth, target in batch]
+    samples, depth, targets = utils.collate_fn([(img, depth) + sample_tail(target) for img, depth, target in samples])
+    return IntersectionBoxes()(samples, depth, targets)
+
+
+def batched(batch, batch_transforms):
+    to_tensor = ToUint8Tensor()
+    samples = [to_tensor(img, depth, target) for img, depth, target in batch]
+    samples, depth, targets = utils.collate_fn([(img, depth) + sample_tail(target) for img, depth, target in samples])
+    return batch_transforms(samples, depth, targets)
+
+
+def sample_tail(target):
+    # The items of __getitem__ after img and depth
+    return (target['human_boxes'], target['human_labels'], target['object_boxes'], target['object_labels'],
+            target['action_boxes'], target['action_labels'], target['occlusion_labels'],
+            target['raw_distance_labels'], target['raw_occlusion_labels'], torch.tensor(0), target['org_size'],
+            torch.tensor(target['num_bounding_boxes_in_ground_truth']))
+
+
+def throughput(function, batches, transforms):
+    torch.manual_seed(0)
+    start = time.perf_counter()
+    for batch in batches:
+        function(batch, transforms)
+    return sum(len(batch) for batch in batches) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser('Batched augmentation benchmark')
+    parser.add_argument('--image_set', default='train', choices=['train', 'valid', 'test'])
+    parser.add_argument('--batch_size', default=8, type=int)
+    parser.add_argument('--num_batches', default=10, type=int)
+    parser.add_argument('--num_threads', default=0, type=int, help='torch threads, 0 for the default')
+    args = parser.parse_args()
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+
+    test_scale = -1 if args.image_set == 'train' else 800
+    dataset = build(args.image_set, test_scale=test_scale)
+    num_batches = min(args.num_batches, len(dataset) // args.batch_size)
+    batches = []
+    for i in range(num_batches):
+        batch = []
+        for index in range(i * args.batch_size, (i + 1) * args.batch_size):
+            ann = dataset.annotations[index]
+            img_path = './data/2.5vrd/images/' + dataset.image_folder_name + '/' + ann['image_id']
+            img, depth = dataset.read_from_folders(img_path, ann['image_id'])
+            batch.append((img, depth, ann['annotations']))
+        batches.append(batch)
+
+    transforms = make_hico_transforms(args.image_set, test_scale)
+    batch_transforms = make_hico_batch_transforms(args.image_set, test_scale)
+    # warm up
+    per_image(batches[0], transforms)
+    batched(batches[0], batch_transforms)
+
+    print(f'{args.image_set}, batch size {args.batch_size}, {num_batches} batches, {torch.get_num_threads()} threads')
+    old = throughput(per_image, batches, transforms)
+    new = throughput(batched, batches, batch_transforms)
+    print(f'per-image transforms: {old:8.2f} samples/s')
+    print(f'batch transforms:     {new:8.2f} samples/s')
+    print(f'speedup:              {new / old:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Fraction of padded pixels in the batches of an epoch of a 2.5VRD split with
+    random:    RandomSampler + BatchSampler (the default),
+    bucketed:  AspectRatioBatchSampler (BUCKETED_BATCH_SAMPLER).
+Resized image sizes are computed from the annotated image sizes as the
+transforms of the split would resize them (a random scale per image for
+'train', test_scale otherwise), so no image is decoded.
+
+Run from the project root:
+    python tools/benchmark/bucketed_sampler.py --image_set train --batch_size 2 8
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.two_point_five_vrd import build, get_size_with_aspect_ratio
+from datasets.samplers import AspectRatioBatchSampler
+
+train_scales = [480, 512, 544, 576, 608, 640, 672, 704, 736, 768, 800]
+
+
+def resized_sizes(image_sizes, scales, rng):
+    return np.array([get_size_with_aspect_ratio((w, h), scales[rng.randint(len(scales))], 1333)
+                     for h, w in image_sizes])
+
+
+def padded_fraction(batches, sizes):
+    valid, padded = 0, 0
+    for batch in batches:
+        batch_sizes = sizes[batch]
+        valid += np.prod(batch_sizes, axis=1).sum()
+        padded += len(batch) * batch_sizes[:, 0].max() * batch_sizes[:, 1].max()
+    return 1 - valid / padded
+
+
+def main():
+    parser = argparse.ArgumentParser('Bucketed batch sampler benchmark')
+    parser.add_argument('--image_set', default='train', choices=['train', 'valid', 'test'])
+    parser.add_argument('--batch_size', default=[2, 8], type=int, nargs='+')
+    parser.add_argument('--test_scale', default=800, type=int)
+    parser.add_argument('--num_bins', default=[1, 2, 3, 5], type=int, nargs='+')
+    parser.add_argument('--num_epochs', default=3, type=int)
+    parser.add_argument('--seed', default=42, type=int)
+    args = parser.parse_args()
+
+    dataset = build(args.image_set, test_scale=-1 if args.image_set == 'train' else args.test_scale)
+    image_sizes = dataset.image_sizes()
+    scales = train_scales if args.image_set == 'train' else [args.test_scale]
+    orientations = np.bincount((image_sizes[:, 1] >= image_sizes[:, 0]).astype(int), minlength=2)
+    print(f'{args.image_set}: {len(dataset)} images, {orientations[0]} portrait, {orientations[1]} landscape, '
+          f'{len(scales)} scale(s), {args.num_epochs} epochs (padded pixel fraction)')
+    print(f'{"batch":>5s} {"random":>8s} ' + ' '.join(f'{"bins=" + str(b):>8s}' for b in args.num_bins))
+    for batch_size in args.batch_size:
+        rng = np.random.RandomState(args.seed)
+        fractions = np.zeros(1 + len(args.num_bins))
+        for epoch in range(args.num_epochs):
+            sizes = resized_sizes(image_sizes, scales, rng)
+            generator = torch.Generator()
+            generator.manual_seed(args.seed + epoch)
+            sampler = torch.utils.data.BatchSampler(torch.utils.data.RandomSampler(dataset, generator=generator),
+                                                    batch_size, drop_last=args.image_set == 'train')
+            fractions[0] += padded_fraction(list(sampler), sizes)
+            for i, num_bins in enumerate(args.num_bins):
+                sampler = AspectRatioBatchSampler(image_sizes, batch_size, drop_last=args.image_set == 'train',
+                                                  seed=args.seed, num_bins=num_bins)
+                sampler.set_epoch(epoch)
+                fractions[1 + i] += padded_fraction(list(sampler), sizes)
+        fractions /= args.num_epochs
+        print(f'{batch_size:5d} ' + ' '.join(f'{fraction:8.3f}' for fraction in fractions))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Latency (ms per batch, inference) of the distance and occlusion decoders
+of the cascade, run
+    sequential:       one decoder after the other with nn.MultiheadAttention
+                      (the default),
+    sequential sdpa:  the same with SDPA_ATTENTION,
+    fused:            as one decoder with their layers stacked along a group
+                      dimension (FUSED_CASCADE_DECODERS, see
+                      Transformer.fused_cascade_decoders).
+The decoders attend to an encoder output of a batch of images padded to
+--height x --width (800 x 1088 by default, 25 x 34 tokens) with part of
+every image but the first one masked as padding. The largest difference
+between the outputs of the sequential and fused decoders is reported as well.
+
+Run from the project root:
+    python tools/benchmark/cascade_decoders.py --batch_size 1 8 --dec_layers 3
+    python tools/benchmark/cascade_decoders.py --device cuda --dec_layers 6
+"""
+import argparse
+import os
+import sys
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import models.transformer
+from models.transformer import Transformer
+from sdpa_attention import inputs, time_ms
+
+
+def main():
+    parser = argparse.ArgumentParser('Cascade decoder benchmark')
+    parser.add_argument('--batch_size', default=[1, 8], type=int, nargs='+')
+    parser.add_argument('--dec_layers', default=3, type=int,
+                        help='layers of the distance and of the occlusion decoder')
+    parser.add_argument('--height', default=800, type=int)
+    parser.add_argument('--width', default=1088, type=int)
+    parser.add_argument('--hidden_dim', default=256, type=int)
+    parser.add_argument('--nheads', default=8, type=int)
+    parser.add_argument('--dim_feedforward', default=2048, type=int)
+    parser.add_argument('--num_queries', default=100, type=int)
+    parser.add_argument('--repeat', default=20, type=int)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--seed', default=42, type=int)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    device = torch.device(args.device)
+    transformer = Transformer(d_model=args.hidden_dim, nhead=args.nheads, num_encoder_layers=0,
+                              num_decoder_layers=0, num_decoder_layer_distance=args.dec_layers,
+                              num_decoder_layer_occlusion=args.dec_layers, dim_feedforward=args.dim_feedforward,
+                              return_intermediate_dec=True).to(device).eval()
+
+    def run(batch, fused, sdpa=False):
+        models.transformer.SDPA_ATTENTION = sdpa
+        return transformer.cascade_decoders(*batch, fused=fused)
+
+    print(f'{args.device}, {torch.get_num_threads()} threads, {args.dec_layers} + {args.dec_layers} layers, '
+          f'{args.height} x {args.width} (ms per batch)')
+    print(f'{"batch":>5s} {"sequential":>10s} {"seq sdpa":>9s} {"fused":>9s} {"speedup":>8s} {"max diff":>9s}')
+    for batch_size in args.batch_size:
+        batch = inputs(batch_size, args.height, args.width, args.hidden_dim, args.num_queries, device)
+        with torch.no_grad():
+            difference = max((a - b).abs().max().item() for a, b in zip(run(batch, False), run(batch, True)))
+            sequential_ms, sdpa_ms, fused_ms = time_ms([lambda: run(batch, False), lambda: run(batch, False, True),
+                                                        lambda: run(batch, True)], device, args.repeat)
+        # Speedup over the faster sequential run
+        print(f'{batch_size:5d} {sequential_ms:10.2f} {sdpa_ms:9.2f} {fused_ms:9.2f} '
+              f'{min(sequential_ms, sdpa_ms) / fused_ms:7.2f}x {difference:9.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Time and allocator traffic per batch of collate_fn() in the main process:
+the previous implementation (deep copies of every sample, fresh zeroed
+padded batches) vs. the current one (no deep copies, padded batches in
+reusable buffers, TargetBatch). Samples are synthetic normalized images of
+random sizes around 800x1066 with 2.5VRD targets.
+
+Allocator traffic is the sum of the CPU allocations recorded by
+torch.profiler while collating.
+
+Run from the project root:
+    python tools/benchmark/collate.py --batch_sizes 2 8 32
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from torch.profiler import profile, ProfilerActivity
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import util.misc as utils
+
+
+def previous_collate_fn(batch):
+    names = ['human_boxes', 'human_labels', 'object_boxes', 'object_labels', 'action_boxes', 'action_labels',
+             'occlusion_labels', 'raw_distance_labels', 'raw_occlusion_labels', 'image_id', 'org_size',
+             'num_bounding_boxes_in_ground_truth', 'intersection_boxes']
+    for i in range(len(batch)):
+        target = dict(zip(names, copy.deepcopy(batch[i][2:])))
+        target['image_id'] = target['image_id'].item()
+        target['num_bounding_boxes_in_ground_truth'] = target['num_bounding_boxes_in_ground_truth'].item()
+        batch[i] = (copy.deepcopy(batch[i][0]), copy.deepcopy(batch[i][1]), target)
+    batch = list(zip(*batch))
+    batch[0] = utils.nested_tensor_from_tensor_list(batch[0])
+    if any(depth is None for depth in batch[1]):
+        batch[1] = None
+    else:
+        batch[1] = utils.nested_tensor_from_tensor_list(batch[1])
+    return batch
+
+
+def make_sample(rng, num_relations, with_depth):
+    h, w = (800, int(rng.randint(900, 1333))) if rng.rand() < 0.5 else (int(rng.randint(900, 1333)), 800)
+    img = torch.randn(3, h, w)
+    boxes = lambda: torch.rand(num_relations, 4)
+    labels = lambda: torch.from_numpy(rng.randint(0, 600, num_relations))
+    return (img, torch.randn(3, h, w) if with_depth else None,
+            boxes(), labels(), boxes(), labels(), boxes(), labels(), labels(),
+            torch.rand(num_relations, 5).half(), torch.rand(num_relations, 5).half(),
+            np.array('{:016x}.jpg'.format(rng.randint(1 << 30))), torch.as_tensor([h, w]),
+            torch.tensor(num_relations))
+
+
+def allocated(function, batches):
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        for batch in batches:
+            function(list(batch))
+    sizes = [event.self_cpu_memory_usage for event in prof.events() if event.self_cpu_memory_usage > 0]
+    return sum(sizes) / len(batches), len(sizes) / len(batches)
+
+
+def per_batch_time(function, batches):
+    start = time.perf_counter()
+    for batch in batches:
+        function(list(batch))
+    return (time.perf_counter() - start) / len(batches)
+
+
+def main():
+    parser = argparse.ArgumentParser('collate_fn benchmark')
+    parser.add_argument('--batch_sizes', default=[2, 8, 32], type=int, nargs='+')
+    parser.add_argument('--num_batches', default=10, type=int)
+    parser.add_argument('--num_relations', default=20, type=int)
+    parser.add_argument('--with_depth', action='store_true')
+    parser.add_argument('--seed', default=42, type=int)
+    args = parser.parse_args()
+
+    print(f'{"batch":>5s} {"previous ms":>12s} {"current ms":>11s} {"previous MB":>12s} {"current MB":>11s} '
+          f'{"previous allocs":>16s} {"current allocs":>15s}')
+    for batch_size in args.batch_sizes:
+        rng = np.random.RandomState(args.seed)
+        # A few distinct batches, collated in turn
+        batches = [[make_sample(rng, args.num_relations, args.with_depth) for _ in range(batch_size)]
+                   for _ in range(min(args.num_batches, 3))]
+        batches = [batches[i % len(batches)] for i in range(args.num_batches)]
+        for function in [previous_collate_fn, utils.collate_fn]:
+            function(list(batches[0]))
+        times = [per_batch_time(f, batches) for f in [previous_collate_fn, utils.collate_fn]]
+        traffic = [allocated(f, batches) for f in [previous_collate_fn, utils.collate_fn]]
+        print(f'{batch_size:5d} {times[0] * 1000:12.1f} {times[1] * 1000:11.1f} '
+              f'{traffic[0][0] / 1024 ** 2:12.1f} {traffic[1][0] / 1024 ** 2:11.1f} '
+              f'{traffic[0][1]:16.0f} {traffic[1][1]:15.0f}')
+    print(f'buffer pool: {utils.collate_buffer_pool.nbytes() / 1024 ** 2:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Per-batch time of the data path of 2.5VRD with and without depth:
+    decode:     reading the image, and reading the depth map (or copying the
+                image if there is no depth map, as __getitem__ used to do),
+    transforms: flip/resize/normalize of make_hico_transforms(),
+    collate:    collate_fn() into NestedTensors.
+Both paths use the same random seeds, so they apply the same transforms.
+
+Run from the project root:
+    python tools/benchmark/depth_free_loading.py --image_set train --batch_size 2
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.two_point_five_vrd import build
+import util.misc as utils
+
+
+def decode(dataset, index, with_depth):
+    img_name = dataset.annotations[index]['image_id']
+    img = cv2.imread('./data/2.5vrd/images/' + dataset.image_folder_name + '/' + img_name, cv2.IMREAD_COLOR)
+    img = Image.fromarray(img[:, :, ::-1]).convert('RGB')
+    if not with_depth:
+        return img, None
+    depth_path = './data/2.5vrd/depth/' + dataset.image_folder_name + '/' + img_name[:-3] + 'png'
+    depth = cv2.imread(depth_path, cv2.IMREAD_COLOR)
+    if depth is None:
+        return img, img.copy()
+    return img, Image.fromarray(depth[:, :, ::-1]).convert('RGB')
+
+
+def run_batch(dataset, indices, with_depth, times):
+    start = time.perf_counter()
+    decoded = [decode(dataset, index, with_depth) for index in indices]
+    times['decode'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    transformed = []
+    for index, (img, depth) in zip(indices, decoded):
+        random.seed(index)
+        transformed.append(dataset.transforms(img, depth, dataset.annotations[index]['annotations']))
+    times['transforms'] += time.perf_counter() - start
+
+    # The targets of __getitem__ are not part of the comparison
+    samples = []
+    for index, (img, depth, _) in zip(indices, transformed):
+        random.seed(index)
+        sample = dataset[index]
+        samples.append((img, depth) + tuple(sample[2:]))
+    start = time.perf_counter()
+    utils.collate_fn(samples)
+    times['collate'] += time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser('Depth-free data path benchmark')
+    parser.add_argument('--image_set', default='train', choices=['train', 'valid', 'test'])
+    parser.add_argument('--batch_size', default=2, type=int)
+    parser.add_argument('--num_batches', default=20, type=int)
+    args = parser.parse_args()
+
+    dataset = build(args.image_set, test_scale=-1 if args.image_set == 'train' else 800)
+    num_batches = min(args.num_batches, len(dataset) // args.batch_size)
+    batches = [list(range(i * args.batch_size, (i + 1) * args.batch_size)) for i in range(num_batches)]
+
+    results = dict()
+    for with_depth in [True, False]:
+        times = dict(decode=0.0, transforms=0.0, collate=0.0)
+        torch.manual_seed(0)
+        for indices in batches:
+            run_batch(dataset, indices, with_depth, times)
+        results[with_depth] = times
+
+    print(f'{args.image_set}, batch size {args.batch_size}, {num_batches} batches (ms per batch)')
+    print(f'{"stage":12s} {"with depth":>11s} {"depth-free":>11s} {"saved":>8s}')
+    for stage in ['decode', 'transforms', 'collate']:
+        old, new = results[True][stage] * 1000 / num_batches, results[False][stage] * 1000 / num_batches
+        print(f'{stage:12s} {old:11.1f} {new:11.1f} {old - new:8.1f}')
+    old, new = sum(results[True].values()) * 1000 / num_batches, sum(results[False].values()) * 1000 / num_batches
+    print(f'{"total":12s} {old:11.1f} {new:11.1f} {old - new:8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Time per batch (ms) of getting the depth maps of a batch from the dataset
+to the model, for depth maps at the size of the resized images:
+    previous: 3-channel depth maps transformed as images, padded at full
+              resolution by collate_fn, then in the training loop the first
+              channel sliced, max-pooled to stride 32 and encoded by a
+              position encoding built for every batch,
+    current:  single-channel depth maps, pooled by collate_fn (see
+              util.misc.pool_depth_list) and encoded by the position
+              encoding the model holds.
+Reported per stage: transforms of the depth maps of the batch (resize,
+to_tensor, Normalize), collate_fn, and the training loop (copy to --device
+and position encoding), with the size of the collated depth batch that
+workers send to the main process.
+
+Run from the project root:
+    python tools/benchmark/depth_pipeline.py --batch_size 2 8
+"""
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.two_point_five_vrd import hico_depth_mean, hico_depth_std, depth_stride, get_size_with_aspect_ratio
+from models.position_encoding import build_position_encoding
+import torchvision.transforms.functional as F
+import util.misc as utils
+
+train_scales = [480, 512, 544, 576, 608, 640, 672, 704, 736, 768, 800]
+# (width, height) of typical Open Images originals
+resolutions = [(1024, 768), (1024, 683), (768, 1024), (1024, 576)]
+
+
+def synthetic_depth(width, height, rng):
+    small = rng.randint(0, 256, (height // 64 + 1, width // 64 + 1)).astype(np.uint8)
+    return Image.fromarray(small).resize((width, height), Image.BILINEAR)
+
+
+def transform(depth, size, channels):
+    if channels == 3:
+        depth = depth.convert('RGB')
+    depth = F.resize(depth, size)
+    depth = F.to_tensor(depth)
+    return F.normalize(depth, mean=hico_depth_mean[:channels], std=hico_depth_std[:channels])
+
+
+def previous_loop(depth, args, device):
+    depth.tensors = depth.tensors[:, 0:1]
+    depth = depth.to(device)
+    with torch.no_grad():
+        m = torch.nn.MaxPool2d(32, stride=32, ceil_mode=True)
+        depth.tensors = m(depth.tensors)
+        depth.mask = (m(depth.mask.type(torch.float))).type(torch.bool)
+        PE = build_position_encoding(args)
+        return PE(depth)
+
+
+def current_loop(depth, position_embedding, device):
+    depth = depth.to(device)
+    with torch.no_grad():
+        return position_embedding(depth)
+
+
+def timed(function, repeat, device):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser('Depth pipeline benchmark')
+    parser.add_argument('--batch_size', default=[2, 8], type=int, nargs='+')
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--hidden_dim', default=256, type=int)
+    parser.add_argument('--position_embedding', default='sine', choices=('sine', 'learned'))
+    parser.add_argument('--repeat', default=10, type=int)
+    parser.add_argument('--seed', default=42, type=int)
+    args = parser.parse_args()
+    device = torch.device(args.device)
+    pe_args = SimpleNamespace(hidden_dim=args.hidden_dim, position_embedding=args.position_embedding)
+    position_embedding = build_position_encoding(pe_args).to(device)
+
+    print(f'{args.device}, {torch.get_num_threads()} threads, {args.position_embedding} position encoding (ms)')
+    print(f'{"batch":>5s} {"":8s} {"transforms":>10s} {"collate":>8s} {"loop":>8s} {"total":>8s} {"batch MB":>9s}')
+    for batch_size in args.batch_size:
+        rng = np.random.RandomState(args.seed)
+        depths, sizes = [], []
+        for i in range(batch_size):
+            width, height = resolutions[i % len(resolutions)]
+            depths.append(synthetic_depth(width, height, rng))
+            sizes.append(get_size_with_aspect_ratio((width, height), train_scales[rng.randint(len(train_scales))],
+                                                    1333))
+
+        results = {}
+        for name, channels in [('previous', 3), ('current', 1)]:
+            depth_list, transforms_ms = timed(
+                lambda: [transform(d, s, channels) for d, s in zip(depths, sizes)], args.repeat, device)
+            if name == 'previous':
+                collate = lambda: utils.nested_tensor_from_tensor_list(depth_list)
+            else:
+                collate = lambda: utils.pool_depth_list(depth_list, depth_stride)
+            collated, collate_ms = timed(collate, args.repeat, device)
+            megabytes = (collated.tensors.numel() * collated.tensors.element_size() + collated.mask.numel()) / 1024 ** 2
+            if name == 'previous':
+                loop = lambda: previous_loop(utils.NestedTensor(collated.tensors, collated.mask), pe_args, device)
+            else:
+                loop = lambda: current_loop(collated, position_embedding, device)
+            results[name], loop_ms = timed(loop, args.repeat, device)
+            total = transforms_ms + collate_ms + loop_ms
+            print(f'{batch_size:5d} {name:8s} {transforms_ms:10.2f} {collate_ms:8.2f} {loop_ms:8.2f} {total:8.2f} '
+                  f'{megabytes:9.2f}')
+        if args.position_embedding == 'sine':
+            assert torch.allclose(results['previous'], results['current'], atol=1e-5)
+
+
+if __name__ == '__main__':
+    main()
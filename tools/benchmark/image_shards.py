@@ -0,0 +1,95 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Throughput (images/s) of two_point_five_VRD reading images from
+    folders: the image folders (cv2.imread of the original files),
+    pread:   image shards read with os.pread(),
+    mmap:    memory-mapped image shards,
+in dataset order and in random order, for decoding only and for complete
+__getitem__ calls (decoding + transforms of the split).
+
+Build the shards first, e.g.
+    python tools/build_image_shards.py --output_dir data/2.5vrd/shards --splits validation
+Run from the project root:
+    python tools/benchmark/image_shards.py --shard_dir data/2.5vrd/shards --image_set valid
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.two_point_five_vrd import two_point_five_VRD, make_hico_transforms
+from datasets.image_shards import ImageShardReader
+
+annotation_files = {
+    'train': './data/2.5vrd/annotation_train_combined.odgt',
+    'valid': './data/2.5vrd/annotation_valid_combined.odgt',
+    'test': './data/2.5vrd/annotation_test_combined.odgt',
+}
+
+
+def build_dataset(image_set, shard_dir, use_mmap):
+    dataset = two_point_five_VRD(root='./data/2.5vrd', annFile=annotation_files[image_set], image_set=image_set,
+                                 transforms=make_hico_transforms(image_set, -1 if image_set == 'train' else 800),
+                                 image_shard_dir=shard_dir)
+    if shard_dir is not None:
+        dataset.image_shards = ImageShardReader(shard_dir, dataset.image_folder_name, use_mmap=use_mmap)
+    return dataset
+
+
+def decode(dataset, index):
+    img_name = dataset.annotations[index]['image_id']
+    if dataset.image_shards is not None:
+        return dataset.read_from_shards(img_name)
+    return dataset.read_from_folders('./data/2.5vrd/images/' + dataset.image_folder_name + '/' + img_name, img_name)
+
+
+def throughput(function, dataset, order):
+    start = time.perf_counter()
+    for index in order:
+        function(dataset, index)
+    return len(order) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser('Image shard benchmark')
+    parser.add_argument('--shard_dir', default='data/2.5vrd/shards')
+    parser.add_argument('--image_set', default='valid', choices=['train', 'valid', 'test'])
+    parser.add_argument('--num_images', default=0, type=int, help='0 for all images of the split')
+    parser.add_argument('--seed', default=42, type=int)
+    args = parser.parse_args()
+
+    datasets = dict(folders=build_dataset(args.image_set, None, False),
+                    pread=build_dataset(args.image_set, args.shard_dir, False),
+                    mmap=build_dataset(args.image_set, args.shard_dir, True))
+    num_images = len(datasets['folders'])
+    if args.num_images > 0:
+        num_images = min(num_images, args.num_images)
+    orders = dict(sequential=list(range(num_images)),
+                  random=list(np.random.RandomState(args.seed).permutation(num_images)))
+
+    # Warm up the page cache, so that all layouts are compared without disk
+    # latency (drop the page cache beforehand to compare cold reads)
+    for dataset in datasets.values():
+        throughput(decode, dataset, orders['sequential'])
+
+    print(f'{args.image_set}: {num_images} images (images/s)')
+    print(f'{"layout":8s} {"order":10s} {"decode":>8s} {"getitem":>8s}')
+    for order_name, order in orders.items():
+        for name, dataset in datasets.items():
+            decode_throughput = throughput(decode, dataset, order)
+            random.seed(args.seed)
+            getitem_throughput = throughput(lambda d, i: d[i], dataset, order)
+            print(f'{name:8s} {order_name:10s} {decode_throughput:8.1f} {getitem_throughput:8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Micro-benchmark of class/entity lookups over a simulated pass on the test set:
+DataFrame filters (previous implementation) vs. LabelVocabulary.
+
+Run from the project root:
+    python tools/benchmark/label_vocabulary.py --num_images 500
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.label_vocabulary import LabelVocabulary
+
+
+def load_class_descriptions(path):
+    class_descriptions_boxable = pd.read_csv(path, header=None)
+    class_descriptions_boxable.loc[-1] = ['', '']
+    class_descriptions_boxable.index = class_descriptions_boxable.index + 1
+    class_descriptions_boxable.sort_index(inplace=True)
+    return class_descriptions_boxable
+
+
+def pandas_name_to_index(df, name):
+    index = -1
+    try:
+        index = df[df[1] == name].index.item()
+    except:
+        pass
+    return index
+
+
+def pandas_index_to_name(df, index):
+    return df.iloc[index][1]
+
+
+def pandas_name_to_entity(df, name):
+    return df[df[1] == name][0].item()
+
+
+def run_pandas(df, boxes, predictions, num_outputs):
+    for names in boxes:
+        for name in names:
+            pandas_name_to_index(df, name)
+    for human_indices, object_indices in predictions:
+        human_names = [pandas_index_to_name(df, int(i)) for i in human_indices]
+        object_names = [pandas_index_to_name(df, int(i)) for i in object_indices]
+        for j in range(num_outputs):
+            pandas_name_to_entity(df, human_names[j])
+            pandas_name_to_entity(df, object_names[j])
+
+
+def run_vocabulary(vocabulary, boxes, predictions, num_outputs):
+    for names in boxes:
+        vocabulary.names_to_indices(names)
+    for human_indices, object_indices in predictions:
+        human_names = vocabulary.index_to_names(human_indices)
+        object_names = vocabulary.index_to_names(object_indices)
+        vocabulary.names_to_entities(human_names[:num_outputs])
+        vocabulary.names_to_entities(object_names[:num_outputs])
+
+
+def main():
+    parser = argparse.ArgumentParser('LabelVocabulary benchmark')
+    parser.add_argument('--class_descriptions', default='data/2.5vrd/class-descriptions-boxable.csv')
+    parser.add_argument('--num_images', default=500, type=int)
+    parser.add_argument('--num_queries', default=100, type=int)
+    parser.add_argument('--boxes_per_image', default=8, type=int)
+    parser.add_argument('--outputs_per_image', default=56, type=int,
+                        help='rows written per image, n * (n - 1) for n ground truth boxes')
+    parser.add_argument('--seed', default=42, type=int)
+    args = parser.parse_args()
+
+    df = load_class_descriptions(args.class_descriptions)
+    rng = np.random.RandomState(args.seed)
+    num_classes = len(df)
+
+    boxes = [list(df[1].values[rng.randint(1, num_classes, args.boxes_per_image)])
+             for _ in range(args.num_images)]
+    predictions = [(rng.randint(1, num_classes, args.num_queries),
+                    rng.randint(1, num_classes, args.num_queries))
+                   for _ in range(args.num_images)]
+    num_outputs = min(args.outputs_per_image, args.num_queries)
+
+    start = time.perf_counter()
+    vocabulary = LabelVocabulary.from_dataframe(df)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    run_pandas(df, boxes, predictions, num_outputs)
+    pandas_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    run_vocabulary(vocabulary, boxes, predictions, num_outputs)
+    vocabulary_time = time.perf_counter() - start
+
+    print(f'classes: {num_classes}, images: {args.num_images}, queries per image: {args.num_queries}')
+    print(f'LabelVocabulary build:   {build_time * 1000:10.2f} ms')
+    print(f'DataFrame lookups:       {pandas_time * 1000:10.2f} ms')
+    print(f'LabelVocabulary lookups: {vocabulary_time * 1000:10.2f} ms')
+    print(f'speedup:                 {pandas_time / vocabulary_time:10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Padding against shape reuse of the batches of a 2.5VRD split, padded
+    largest:  to their largest image (the default),
+    buckets:  to one of K x K canonical shapes (FIXED_SHAPE_PADDING with
+              PADDING_BUCKETS_PER_SIDE = K, see util.misc.PaddingBuckets),
+over the batches of a few epochs of RandomSampler + BatchSampler, with the
+images resized as make_hico_transforms() does (a random training scale per
+image, or test_scale). Sizes are computed from the annotated image sizes,
+so no image is decoded. For every padding: number of distinct padded shapes
+(each one a new trace or compilation of a compiled model, and new
+allocations), share of the batches in the 5 most common shapes, average
+padded area per batch and fraction of the padded pixels that are padding.
+
+Run from the project root:
+    python tools/benchmark/padding_buckets.py --image_set train --batch_size 2 8
+    python tools/benchmark/padding_buckets.py --image_set valid --batch_size 10 --buckets 1 2 4
+"""
+import argparse
+import collections
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.two_point_five_vrd import build, get_size_with_aspect_ratio, largest_resize, resized_sizes
+from util.misc import PaddingBuckets
+
+train_scales = [480, 512, 544, 576, 608, 640, 672, 704, 736, 768, 800]
+
+
+def batch_sizes(image_sizes, batch_size, num_epochs, scales, max_size, rng):
+    """
+    :return: lists of the resized (height, width) of the images of every
+        batch.
+    """
+    batches = []
+    for _ in range(num_epochs):
+        order = rng.permutation(len(image_sizes))
+        for start in range(0, len(order) - batch_size + 1, batch_size):
+            sizes = []
+            for index in order[start:start + batch_size]:
+                height, width = image_sizes[index]
+                if scales is None:
+                    sizes.append((height, width))
+                else:
+                    scale = scales[rng.randint(len(scales))]
+                    sizes.append(get_size_with_aspect_ratio((width, height), scale, max_size))
+            batches.append(np.array(sizes))
+    return batches
+
+
+def padding_stats(batches, padding_buckets=None):
+    shapes = collections.Counter()
+    padded, valid = 0, 0
+    for sizes in batches:
+        shape = (sizes[:, 0].max(), sizes[:, 1].max())
+        if padding_buckets is not None:
+            shape = padding_buckets.shape(*shape)
+        shapes[shape] += 1
+        padded += len(sizes) * shape[0] * shape[1]
+        valid += np.prod(sizes, axis=1).sum()
+    top = sum(n for _, n in shapes.most_common(5)) / len(batches)
+    area = padded / sum(len(sizes) for sizes in batches)
+    return len(shapes), top, area, 1 - valid / padded
+
+
+def main():
+    parser = argparse.ArgumentParser('Padding bucket benchmark')
+    parser.add_argument('--image_set', default='train', choices=['train', 'valid', 'test'])
+    parser.add_argument('--test_scale', default=800, type=int, help='scale of the validation and test sets')
+    parser.add_argument('--batch_size', default=[2, 8], type=int, nargs='+')
+    parser.add_argument('--buckets', default=[2, 3, 4, 6, 8], type=int, nargs='+',
+                        help='numbers of canonical heights and widths')
+    parser.add_argument('--num_epochs', default=3, type=int)
+    parser.add_argument('--seed', default=42, type=int)
+    args = parser.parse_args()
+
+    test_scale = -1 if args.image_set == 'train' else args.test_scale
+    dataset = build(args.image_set, test_scale=test_scale)
+    image_sizes = dataset.image_sizes()
+    largest = largest_resize(args.image_set, test_scale)
+    scales = None if largest is None else (train_scales if args.image_set == 'train' else [test_scale])
+    fitted_sizes = resized_sizes(image_sizes, args.image_set, test_scale)
+    print(f'{args.image_set}: {len(dataset)} images, {args.num_epochs} epochs '
+          f'(padded area per image in kpixels)')
+    for num_buckets in args.buckets:
+        print(f'K={num_buckets}: {PaddingBuckets.fit(fitted_sizes, num_buckets)}')
+    print(f'{"batch":>5s} {"padding":>9s} {"shapes":>6s} {"top 5":>6s} {"area":>6s} {"padded":>6s}')
+    for batch_size in args.batch_size:
+        rng = np.random.RandomState(args.seed)
+        batches = batch_sizes(image_sizes, batch_size, args.num_epochs, scales,
+                              None if largest is None else largest[1], rng)
+        for num_buckets in [None] + args.buckets:
+            padding_buckets = None if num_buckets is None else PaddingBuckets.fit(fitted_sizes, num_buckets)
+            num_shapes, top, area, fraction = padding_stats(batches, padding_buckets)
+            name = 'largest' if num_buckets is None else f'buckets {num_buckets}'
+            print(f'{batch_size:5d} {name:>9s} {num_shapes:6d} {top:6.2f} {area / 1000:6.0f} {fraction:6.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Time per batch (ms) of preparing the inputs of the transformer encoder
+from the stride-32 feature map masks of a batch: the sine position
+embedding (as the Joiner of the backbone computes it) and the flattening
+of the embedding and mask as Transformer.forward() does, with
+    computed: PositionEmbeddingSine, computed for every batch,
+    cached:   CachedPositionEmbeddingSine (CACHED_POSITION_EMBEDDING).
+Batches hold images of typical Open Images sizes resized to a random
+training scale each, padded to their largest image or to PaddingBuckets
+(FIXED_SHAPE_PADDING), and are repeated for a few epochs, so the cache
+sees the same masks again. The largest difference between the two
+embeddings is reported as well.
+
+Run from the project root:
+    python tools/benchmark/position_embedding.py --batch_size 1 2 8 10
+    python tools/benchmark/position_embedding.py --device cuda --padding buckets
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.two_point_five_vrd import get_size_with_aspect_ratio
+from models.position_encoding import PositionEmbeddingSine, CachedPositionEmbeddingSine
+from util.misc import NestedTensor, PaddingBuckets
+
+train_scales = [480, 512, 544, 576, 608, 640, 672, 704, 736, 768, 800]
+# (width, height) of typical Open Images originals
+resolutions = [(1024, 768), (1024, 683), (768, 1024), (1024, 576)]
+
+
+def feature_masks(batch_size, num_batches, padding_buckets, rng):
+    """
+    :return: stride-32 masks of num_batches batches, interpolated from the
+        image masks as the backbone does.
+    """
+    masks = []
+    for _ in range(num_batches):
+        sizes = []
+        for _ in range(batch_size):
+            width, height = resolutions[rng.randint(len(resolutions))]
+            sizes.append(get_size_with_aspect_ratio((width, height), train_scales[rng.randint(len(train_scales))],
+                                                    1333))
+        shape = (max(h for h, w in sizes), max(w for h, w in sizes))
+        if padding_buckets is not None:
+            shape = padding_buckets.shape(*shape)
+        mask = torch.ones((batch_size,) + shape, dtype=torch.bool)
+        for m, (h, w) in zip(mask, sizes):
+            m[:h, :w] = False
+        feature_shape = (-(-shape[0] // 32), -(-shape[1] // 32))
+        masks.append(F.interpolate(mask[None].float(), size=feature_shape).to(torch.bool)[0])
+    return masks
+
+
+def prepare(position_embedding, masks, device, hidden_dim):
+    outputs = []
+    for mask in masks:
+        mask = mask.to(device)
+        features = torch.empty((len(mask), hidden_dim) + mask.shape[-2:], device=device)
+        pos = position_embedding(NestedTensor(features, mask))
+        outputs.append((pos.flatten(2).permute(2, 0, 1), mask.flatten(1)))
+    return outputs
+
+
+def time_ms(function, device, repeat):
+    times = []
+    for _ in range(repeat):
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        function()
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start)
+    return 1000 * np.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser('Position embedding benchmark')
+    parser.add_argument('--batch_size', default=[1, 2, 8, 10], type=int, nargs='+')
+    parser.add_argument('--num_batches', default=50, type=int, help='batches per epoch')
+    parser.add_argument('--num_epochs', default=3, type=int)
+    parser.add_argument('--padding', default='largest', choices=['largest', 'buckets'])
+    parser.add_argument('--hidden_dim', default=256, type=int)
+    parser.add_argument('--cache_size', default=64, type=int)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--seed', default=42, type=int)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    padding_buckets = None
+    if args.padding == 'buckets':
+        sizes = [get_size_with_aspect_ratio(resolution, scale, 1333)
+                 for resolution in resolutions for scale in train_scales]
+        padding_buckets = PaddingBuckets.fit(sizes, 4)
+    print(f'{args.device}, {torch.get_num_threads()} threads, padded to {args.padding}, '
+          f'{args.num_batches} batches x {args.num_epochs} epochs (ms per batch)')
+    print(f'{"batch":>5s} {"computed":>9s} {"cached":>9s} {"speedup":>8s} {"max diff":>9s}')
+    for batch_size in args.batch_size:
+        rng = np.random.RandomState(args.seed)
+        masks = feature_masks(batch_size, args.num_batches, padding_buckets, rng) * args.num_epochs
+        computed = PositionEmbeddingSine(args.hidden_dim // 2, normalize=True).to(device)
+        cached = CachedPositionEmbeddingSine(args.hidden_dim // 2, normalize=True,
+                                             cache_size=args.cache_size).to(device)
+        with torch.no_grad():
+            difference = max((a[0] - b[0]).abs().max().item() for a, b in
+                             zip(prepare(computed, masks, device, args.hidden_dim),
+                                 prepare(cached, masks, device, args.hidden_dim)))
+            computed_ms = time_ms(lambda: prepare(computed, masks, device, args.hidden_dim), device, 3)
+            # Every run starts with an empty cache, which the first epoch
+            # fills, as in training
+            cached_ms = time_ms(lambda: prepare(CachedPositionEmbeddingSine(
+                args.hidden_dim // 2, normalize=True, cache_size=args.cache_size).to(device), masks, device,
+                args.hidden_dim), device, 3)
+        computed_ms, cached_ms = computed_ms / len(masks), cached_ms / len(masks)
+        print(f'{batch_size:5d} {computed_ms:9.3f} {cached_ms:9.3f} {computed_ms / cached_ms:7.1f}x '
+              f'{difference:9.2e}')
+
+
+if __name__ == '__main__':
+    main()
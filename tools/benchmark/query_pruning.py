@@ -0,0 +1,116 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Accuracy against latency of query pruning (QUERY_PRUNING, see
+HoiTR.select_queries): the predictions of a checkpoint on the first
+--max_images images of the test split are generated as vrd_test.py does
+(generate_evaluation_outputs()) with the cascade decoders run on
+    all:  every query (no pruning),
+    K:    the K queries of every image with the highest human and object
+          scores (and those scored at least --threshold),
+and evaluated with evaluation/evaluate_vrd_lib.py against the ground truth
+of these images. For every setting: precision, recall and F-score of
+distance and occlusion (all labels), and ms per batch of the model.
+
+Run from the project root:
+    python tools/benchmark/query_pruning.py --dataset_file two_point_five_vrd --backbone resnet101 \\
+        --resume checkpoint.pth --top_k 50 20 10 5
+    python tools/benchmark/query_pruning.py --dataset_file two_point_five_vrd --backbone resnet101 \\
+        --resume checkpoint.pth --top_k 5 --threshold 0.1 --max_images 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'evaluation'))
+import evaluate_vrd_lib
+from vrd_test import get_args_parser
+from datasets import build_dataset
+from engine import generate_evaluation_outputs
+from models import build_model
+import util.misc as utils
+
+
+def evaluate(args, model, criterion, data_loader, device, evaluator):
+    """
+    :return: (dict of the precision, recall and F-score of distance and
+        occlusion, ms per batch of the model).
+    """
+    times = []
+
+    def start(module, inputs):
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        times.append(time.perf_counter())
+
+    def stop(module, inputs, outputs):
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        times[-1] = time.perf_counter() - times[-1]
+
+    handles = [model.register_forward_pre_hook(start), model.register_forward_hook(stop)]
+    with tempfile.TemporaryDirectory() as folder_name, torch.no_grad():
+        generate_evaluation_outputs(args, 'test', model, criterion, data_loader, None, device, 1,
+                                    folder_name=folder_name)
+        predictions = evaluate_vrd_lib.load_prediction(os.path.join(folder_name, args.output_name + '_test_0.csv'))
+    for handle in handles:
+        handle.remove()
+    results = evaluator.compute_metrics(predictions)
+    results = results[results['label'] == 'all'].set_index('relationship')
+    return results, 1000 * np.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser('Query pruning benchmark', parents=[get_args_parser()])
+    parser.add_argument('--top_k', default=[50, 20, 10, 5], type=int, nargs='+',
+                        help='numbers of queries kept per image')
+    parser.add_argument('--threshold', default=None, type=float,
+                        help='also keep the queries scored at least threshold')
+    parser.add_argument('--max_images', default=500, type=int)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    model, criterion = build_model(args)
+    if args.resume:
+        model.load_state_dict(torch.load(args.resume, map_location='cpu')['model'])
+    model.to(device)
+
+    dataset = build_dataset(image_set='test', args=args, test_scale=800)
+    indices = list(range(min(args.max_images, len(dataset))))
+    data_loader = DataLoader(dataset, batch_sampler=torch.utils.data.BatchSampler(indices, args.batch_size, False),
+                             collate_fn=utils.build_collate_fn(dataset), num_workers=args.num_workers)
+    evaluator = evaluate_vrd_lib.VRDEvaluator('data/2.5vrd/within_image_vrd_test.csv',
+                                              'data/2.5vrd/within_image_objects_test.csv')
+    # Ground truth of the evaluated images only
+    image_ids = {os.path.splitext(image_id)[0] for image_id in dataset.image_ids()[indices]}
+    evaluator.example_groundtruths = {pair: records for pair, records in evaluator.example_groundtruths.items()
+                                      if pair[0] in image_ids}
+
+    print(f'test: {len(indices)} images, batch size {args.batch_size}, {args.num_queries} queries, '
+          f'{args.dec_layers_distance} + {args.dec_layers_occlusion} cascade decoder layers, {args.device}')
+    print(f'{"kept":>5s} ' + ' '.join(f'{relationship[:4] + " " + metric:>9s}'
+                                      for relationship in ['distance', 'occlusion']
+                                      for metric in ['P', 'R', 'F']) + f' {"ms":>9s}')
+    for top_k in [None] + args.top_k:
+        model.query_pruning_top_k = top_k
+        model.query_pruning_threshold = None if top_k is None else args.threshold
+        results, latency = evaluate(args, model, criterion, data_loader, device, evaluator)
+        print(f'{"all" if top_k is None else str(top_k):>5s} ' +
+              ' '.join(f'{results.loc[relationship, metric]:9.4f}' for relationship in ['distance', 'occlusion']
+                       for metric in ['precision', 'recall', 'fscore']) + f' {latency:9.1f}')
+
+
+if __name__ == '__main__':
+    main()
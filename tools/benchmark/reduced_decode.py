@@ -0,0 +1,98 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Throughput (images/s) of decoding a JPEG image and resizing it as
+make_hico_transforms() does for a scale of 800 (max size 1333):
+    full:    cv2.imread() at full resolution, then resize,
+    reduced: cv2.imread() at the reduced resolution of
+             reduced_decode_factor() (REDUCED_RESOLUTION_DECODE), then
+             resize.
+Images are synthetic JPEG files at typical Open Images resolutions, or the
+images of a folder (--image_dir).
+
+Run from the project root:
+    python tools/benchmark/reduced_decode.py
+    python tools/benchmark/reduced_decode.py --image_dir data/2.5vrd/images/validation
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.image_shards import REDUCED_DECODE_FLAGS, reduced_decode_factor
+from datasets.two_point_five_vrd import get_size_with_aspect_ratio
+
+# (width, height) of typical Open Images originals
+resolutions = [(1024, 768), (1600, 1200), (2048, 1536), (3264, 2448), (4000, 3000), (3000, 4000)]
+
+
+def synthetic_image(width, height, rng):
+    # Smooth color gradients with some texture, which compresses like photos
+    # rather than noise
+    small = rng.randint(0, 256, (height // 64 + 1, width // 64 + 1, 3)).astype(np.uint8)
+    img = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    return cv2.add(img, rng.randint(0, 24, (height, width, 3), dtype=np.uint8))
+
+
+def decode_and_resize(path, factor, scale, max_size):
+    img = cv2.imread(path, REDUCED_DECODE_FLAGS[factor])
+    img = Image.fromarray(img[:, :, ::-1]).convert('RGB')
+    height, width = get_size_with_aspect_ratio(img.size, scale, max_size)
+    return img.resize((width, height))
+
+
+def throughput(paths, factors, scale, max_size, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for path, factor in zip(paths, factors):
+            decode_and_resize(path, factor, scale, max_size)
+    return repeat * len(paths) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser('Reduced resolution decode benchmark')
+    parser.add_argument('--image_dir', default=None)
+    parser.add_argument('--num_images', default=50, type=int, help='number of images of --image_dir')
+    parser.add_argument('--scale', default=800, type=int)
+    parser.add_argument('--max_size', default=1333, type=int)
+    parser.add_argument('--repeat', default=3, type=int)
+    parser.add_argument('--quality', default=90, type=int, help='JPEG quality of synthetic images')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.image_dir is None:
+            rng = np.random.RandomState(0)
+            groups = []
+            for width, height in resolutions:
+                path = os.path.join(temp_dir, '{}x{}.jpg'.format(width, height))
+                cv2.imwrite(path, synthetic_image(width, height, rng), [cv2.IMWRITE_JPEG_QUALITY, args.quality])
+                groups.append(('{}x{}'.format(width, height), [path]))
+        else:
+            names = sorted(n for n in os.listdir(args.image_dir) if n.lower().endswith(('.jpg', '.jpeg')))
+            paths = [os.path.join(args.image_dir, n) for n in names[:args.num_images]]
+            groups = [(args.image_dir, paths)]
+
+        print(f'scale {args.scale}, max size {args.max_size} (images/s)')
+        print(f'{"images":>24s} {"factor":>7s} {"full":>8s} {"reduced":>8s} {"speedup":>8s}')
+        for name, paths in groups:
+            factors = []
+            for path in paths:
+                width, height = Image.open(path).size
+                factors.append(reduced_decode_factor(width, height, args.scale, args.max_size))
+            full = throughput(paths, [1] * len(paths), args.scale, args.max_size, args.repeat)
+            reduced = throughput(paths, factors, args.scale, args.max_size, args.repeat)
+            print(f'{name:>24s} {np.mean(factors):7.2f} {full:8.1f} {reduced:8.1f} {reduced / full:7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Latency (ms per batch, inference) and peak memory of the transformer
+(encoder, pair decoder and cascade decoders, Transformer.forward) with the
+attention of its layers computed by
+    nn:    nn.MultiheadAttention (the default),
+    sdpa:  F.scaled_dot_product_attention, without attention weights
+           (SDPA_ATTENTION, see models.transformer.multi_head_attention).
+Inputs are stride-32 features of a batch of images padded to --height x
+--width (800 x 1333 by default, 25 x 42 tokens) with part of every image but
+the first one masked as padding. Peak memory is the growth of the peak
+resident memory (CPU, Linux) or the peak allocated memory (CUDA) over one
+forward pass, each backend measured in a fresh process. The largest difference
+between the outputs of the two is reported as well.
+
+Run from the project root:
+    python tools/benchmark/sdpa_attention.py --batch_size 1 8
+    python tools/benchmark/sdpa_attention.py --device cuda --batch_size 8 16
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import models.transformer
+from models.transformer import Transformer
+
+
+def inputs(batch_size, height, width, hidden_dim, num_queries, device):
+    h, w = -(-height // 32), -(-width // 32)
+    memory = torch.randn(h * w, batch_size, hidden_dim, device=device)
+    pos_embed = torch.randn(h * w, batch_size, hidden_dim, device=device)
+    mask = torch.zeros((batch_size, h, w), dtype=torch.bool, device=device)
+    for i in range(1, batch_size):
+        mask[i, :, w - w * i // (2 * batch_size):] = True
+    query_embed = torch.randn(num_queries, batch_size, hidden_dim, device=device)
+    return query_embed, memory, mask.flatten(1), pos_embed, (batch_size, hidden_dim, h, w)
+
+
+def time_ms(functions, device, repeat, warmup=3):
+    """
+    :return: median ms of every function, run in turns so that both see the
+        same load of the machine.
+    """
+    times = [[] for _ in functions]
+    for i in range(warmup + repeat):
+        for function, function_times in zip(functions, times):
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            function()
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            if i >= warmup:
+                function_times.append(time.perf_counter() - start)
+    return [1000 * np.median(function_times) for function_times in times]
+
+
+def build(args, device):
+    torch.manual_seed(args.seed)
+    return Transformer(d_model=args.hidden_dim, nhead=args.nheads, num_encoder_layers=args.enc_layers,
+                       num_decoder_layers=args.dec_layers, num_decoder_layer_distance=args.dec_layers,
+                       num_decoder_layer_occlusion=args.dec_layers, dim_feedforward=args.dim_feedforward,
+                       return_intermediate_dec=True).to(device).eval()
+
+
+def batch(args, batch_size, device):
+    """
+    :return: Transformer.forward() arguments of a batch.
+    """
+    torch.manual_seed(args.seed)
+    query_embed, memory, mask, pos_embed, (_, _, h, w) = inputs(batch_size, args.height, args.width,
+                                                                args.hidden_dim, args.num_queries, device)
+    # [h*w, BS, C] -> [BS, C, h, w]
+    src = memory.view(h, w, batch_size, -1).permute(2, 3, 0, 1)
+    pos_embed = pos_embed.view(h, w, batch_size, -1).permute(2, 3, 0, 1)
+    return src, mask.view(batch_size, h, w), query_embed[:, 0], pos_embed
+
+
+def peak_rss_mb():
+    """
+    :return: MB of the peak resident memory of the process since the last
+        reset_peak_rss() (ru_maxrss is kept across the exec of a new process).
+    """
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmHWM:')) / 1024
+
+
+def reset_peak_rss():
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+
+def peak_memory_mb(args, batch_size, sdpa):
+    """
+    :return: MB of memory by which a forward pass raises the peak.
+    """
+    device = torch.device(args.device)
+    models.transformer.SDPA_ATTENTION = sdpa
+    transformer = build(args, device)
+    arguments = batch(args, batch_size, device)
+    with torch.no_grad():
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+            start = torch.cuda.memory_allocated()
+            transformer(*arguments)
+            return (torch.cuda.max_memory_allocated() - start) / 2 ** 20
+        reset_peak_rss()
+        start = peak_rss_mb()
+        transformer(*arguments)
+        return peak_rss_mb() - start
+
+
+def main():
+    parser = argparse.ArgumentParser('SDPA attention benchmark')
+    parser.add_argument('--batch_size', default=[1, 8], type=int, nargs='+')
+    parser.add_argument('--enc_layers', default=6, type=int)
+    parser.add_argument('--dec_layers', default=6, type=int,
+                        help='layers of the pair, distance and occlusion decoders')
+    parser.add_argument('--height', default=800, type=int)
+    parser.add_argument('--width', default=1333, type=int)
+    parser.add_argument('--hidden_dim', default=256, type=int)
+    parser.add_argument('--nheads', default=8, type=int)
+    parser.add_argument('--dim_feedforward', default=2048, type=int)
+    parser.add_argument('--num_queries', default=100, type=int)
+    parser.add_argument('--repeat', default=10, type=int)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--seed', default=42, type=int)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    transformer = build(args, device)
+
+    def run(arguments, sdpa):
+        models.transformer.SDPA_ATTENTION = sdpa
+        return transformer(*arguments)
+
+    print(f'{args.device}, {torch.get_num_threads()} threads, {args.enc_layers} encoder + 3 x {args.dec_layers} '
+          f'decoder layers, {args.height} x {args.width}')
+    print(f'{"batch":>5s} {"nn ms":>9s} {"sdpa ms":>9s} {"speedup":>8s} {"nn MB":>8s} {"sdpa MB":>8s} '
+          f'{"max diff":>9s}')
+    context = multiprocessing.get_context('spawn')
+    for batch_size in args.batch_size:
+        arguments = batch(args, batch_size, device)
+        with torch.no_grad():
+            difference = max((a - b).abs().max().item() for a, b in zip(run(arguments, False), run(arguments, True))
+                             if torch.is_tensor(a) and a.is_floating_point())
+            nn_ms, sdpa_ms = time_ms([lambda: run(arguments, False), lambda: run(arguments, True)], device,
+                                     args.repeat)
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            nn_mb, sdpa_mb = [pool.apply(peak_memory_mb, (args, batch_size, sdpa)) for sdpa in [False, True]]
+        print(f'{batch_size:5d} {nn_ms:9.1f} {sdpa_ms:9.1f} {nn_ms / sdpa_ms:7.2f}x {nn_mb:8.1f} {sdpa_mb:8.1f} '
+              f'{difference:9.2e}')
+
+
+if __name__ == '__main__':
+    main()
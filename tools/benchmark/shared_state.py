@@ -0,0 +1,110 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Startup time and memory of the DataLoader workers of a 2.5VRD split, with
+the annotations, label vocabulary and image paths of the dataset
+    copied:  held by every worker (forked, or unpickled with 'spawn'),
+    shared:  published into shared memory (SHARED_MEMORY_STATE), which the
+             workers map.
+The annotations are held in memory (not memory-mapped from the annotation
+cache) and can be repeated to emulate a larger set. For every worker:
+startup (s from creating the DataLoader iterator to the first item of the
+worker, which reads every annotation once), RSS and USS (memory private to
+the worker, i.e. not shared with other processes) in MB.
+
+Run from the project root:
+    python tools/benchmark/shared_state.py --image_set valid --repeat 100 --num_workers 8
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.annotation_store import AnnotationStore, RELATION_FIELDS
+from datasets.two_point_five_vrd import build
+
+
+def memory_mb():
+    """
+    :return: (RSS, USS) of this process in MB.
+    """
+    values = dict()
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 2 and fields[1].isdigit():
+                values[fields[0].rstrip(':')] = int(fields[1]) / 1024
+    return values['Rss'], values['Private_Clean'] + values['Private_Dirty']
+
+
+def repeat_store(store, repeat):
+    arrays = {name: np.asarray(array) for name, array in store.arrays.items()}
+    num_relations = arrays['offsets'][-1]
+    repeated = {name: np.concatenate([arrays[name]] * repeat)
+                for name in ['image_id', 'org_size', 'num_bounding_boxes_in_ground_truth'] + list(RELATION_FIELDS)}
+    repeated['offsets'] = np.concatenate([arrays['offsets'][:-1] + i * num_relations for i in range(repeat)] +
+                                         [[repeat * num_relations]]).astype(np.int64)
+    return AnnotationStore(repeated)
+
+
+class Probe(torch.utils.data.Dataset):
+    """
+    Item i: startup and memory of the worker that reads it.
+    """
+
+    def __init__(self, dataset, num_items, start):
+        self.dataset = dataset
+        self.num_items = num_items
+        self.start = start
+
+    def __len__(self):
+        return self.num_items
+
+    def __getitem__(self, index):
+        startup = time.time() - self.start
+        annotations = self.dataset.annotations
+        for i in range(len(annotations)):
+            annotations[i]
+        rss, uss = memory_mb()
+        return torch.tensor([startup, rss, uss])
+
+
+def run(dataset, context, num_workers):
+    probe = Probe(dataset, num_workers, time.time())
+    data_loader = DataLoader(probe, batch_size=1, num_workers=num_workers, multiprocessing_context=context)
+    return torch.cat(list(data_loader)).numpy()
+
+
+def main():
+    parser = argparse.ArgumentParser('Shared dataset state benchmark')
+    parser.add_argument('--image_set', default='valid', choices=['train', 'valid', 'test'])
+    parser.add_argument('--repeat', default=100, type=int, help='number of copies of the annotations')
+    parser.add_argument('--num_workers', default=8, type=int)
+    parser.add_argument('--contexts', default=['fork', 'spawn'], nargs='+')
+    args = parser.parse_args()
+
+    dataset = build(args.image_set, test_scale=-1 if args.image_set == 'train' else 800)
+    dataset.annotations = repeat_store(dataset.annotations, args.repeat)
+    print(f'{args.image_set} x {args.repeat}: {len(dataset)} images, '
+          f'{dataset.annotations.nbytes() / 1024 ** 2:.1f} MB of annotation arrays, {args.num_workers} workers')
+    print(f'{"state":8s} {"context":8s} {"startup s":>10s} {"RSS MB":>8s} {"USS MB":>8s} {"total USS":>10s}')
+    for state in ['copied', 'shared']:
+        if state == 'shared':
+            dataset.publish_shared_state()
+        for context in args.contexts:
+            results = run(dataset, context, args.num_workers)
+            startup, rss, uss = results.mean(0)
+            print(f'{state:8s} {context:8s} {startup:10.2f} {rss:8.1f} {uss:8.1f} {results[:, 2].sum():10.1f}')
+
+
+if __name__ == '__main__':
+    main()
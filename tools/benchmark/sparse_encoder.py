@@ -0,0 +1,149 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Throughput (images per second, inference) of the transformer encoder (or,
+with --part transformer, of Transformer.forward) on the batches of the
+validation split, run
+    dense:   on every token of the padded batch, with padding keys masked
+             (the default),
+    sdpa:    the same with SDPA_ATTENTION,
+    sparse:  as sdpa, on the valid tokens of every image moved to the front
+             of its sequence, with the sequences cut to the longest image
+             (SPARSE_ENCODER, see TransformerEncoder.sparse_forward),
+             decoders as in sdpa.
+Batches of --batch_size (batch_size_validation by default) images are drawn
+as main.py draws them (RandomSampler, or AspectRatioBatchSampler with
+--sampler aspect) and padded to their largest image (or to the padding
+buckets of FIXED_SHAPE_PADDING with --padding buckets), with the images
+resized to test_scale. Sizes are computed from the annotated image sizes and
+features are random, so no image is decoded. The fraction of the encoder
+tokens that are padding and the largest difference between the dense and
+sparse encoder outputs at valid tokens are reported as well.
+
+Run from the project root:
+    python tools/benchmark/sparse_encoder.py
+    python tools/benchmark/sparse_encoder.py --sampler aspect --padding buckets --part transformer
+"""
+import argparse
+import os
+import sys
+
+import torch
+import torch.nn.functional as F
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import models.transformer
+from datasets.samplers import AspectRatioBatchSampler
+from datasets.two_point_five_vrd import build, get_size_with_aspect_ratio, resized_sizes
+from magic_numbers import batch_size_validation, ASPECT_RATIO_BINS, PADDING_BUCKETS_PER_SIDE
+from models.transformer import Transformer
+from util.misc import PaddingBuckets
+from sdpa_attention import time_ms
+
+
+def feature_masks(image_sizes, batches, test_scale, padding_buckets=None):
+    """
+    :return: stride-32 padding masks [BS, h, w] of the batches, interpolated
+        from the image masks as the backbone does.
+    """
+    masks = []
+    for batch in batches:
+        sizes = [get_size_with_aspect_ratio((width, height), test_scale, 1333)
+                 for height, width in image_sizes[batch]]
+        shape = (max(h for h, w in sizes), max(w for h, w in sizes))
+        if padding_buckets is not None:
+            shape = padding_buckets.shape(*shape)
+        mask = torch.ones((len(sizes),) + shape, dtype=torch.bool)
+        for m, (h, w) in zip(mask, sizes):
+            m[:h, :w] = False
+        feature_shape = (-(-shape[0] // 32), -(-shape[1] // 32))
+        masks.append(F.interpolate(mask[None].float(), size=feature_shape).to(torch.bool)[0])
+    return masks
+
+
+def main():
+    parser = argparse.ArgumentParser('Sparse encoder benchmark')
+    parser.add_argument('--batch_size', default=batch_size_validation, type=int)
+    parser.add_argument('--num_batches', default=10, type=int)
+    parser.add_argument('--sampler', default='random', choices=['random', 'aspect'])
+    parser.add_argument('--padding', default='largest', choices=['largest', 'buckets'])
+    parser.add_argument('--part', default='encoder', choices=['encoder', 'transformer'])
+    parser.add_argument('--test_scale', default=800, type=int)
+    parser.add_argument('--enc_layers', default=6, type=int)
+    parser.add_argument('--dec_layers', default=6, type=int,
+                        help='layers of the pair, distance and occlusion decoders')
+    parser.add_argument('--hidden_dim', default=256, type=int)
+    parser.add_argument('--nheads', default=8, type=int)
+    parser.add_argument('--dim_feedforward', default=2048, type=int)
+    parser.add_argument('--num_queries', default=100, type=int)
+    parser.add_argument('--repeat', default=2, type=int)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--seed', default=42, type=int)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    device = torch.device(args.device)
+    dataset = build('valid', test_scale=args.test_scale)
+    image_sizes = dataset.image_sizes()
+    if args.sampler == 'aspect':
+        batches = list(AspectRatioBatchSampler(image_sizes, args.batch_size, shuffle=True, num_replicas=1, rank=0,
+                                               seed=args.seed, num_bins=ASPECT_RATIO_BINS))
+    else:
+        batches = list(torch.utils.data.BatchSampler(torch.utils.data.RandomSampler(range(len(image_sizes))),
+                                                     args.batch_size, drop_last=False))
+    batches = batches[:args.num_batches]
+    padding_buckets = None
+    if args.padding == 'buckets':
+        padding_buckets = PaddingBuckets.fit(resized_sizes(image_sizes, 'valid', args.test_scale),
+                                             PADDING_BUCKETS_PER_SIDE)
+    masks = [mask.to(device) for mask in feature_masks(image_sizes, batches, args.test_scale, padding_buckets)]
+    inputs = [(torch.randn((len(mask), args.hidden_dim) + mask.shape[-2:], device=device), mask,
+               torch.randn((len(mask), args.hidden_dim) + mask.shape[-2:], device=device)) for mask in masks]
+
+    transformer = Transformer(d_model=args.hidden_dim, nhead=args.nheads, num_encoder_layers=args.enc_layers,
+                              num_decoder_layers=args.dec_layers, num_decoder_layer_distance=args.dec_layers,
+                              num_decoder_layer_occlusion=args.dec_layers, dim_feedforward=args.dim_feedforward,
+                              return_intermediate_dec=True).to(device).eval()
+    query_embed = torch.randn(args.num_queries, args.hidden_dim, device=device)
+
+    def encode(src, mask, pos):
+        return transformer.encoder(src.flatten(2).permute(2, 0, 1), src_key_padding_mask=mask.flatten(1),
+                                   pos=pos.flatten(2).permute(2, 0, 1))
+
+    def run(mode):
+        models.transformer.SDPA_ATTENTION = mode != 'dense'
+        transformer.encoder.sparse = mode == 'sparse'
+        for src, mask, pos in inputs:
+            if args.part == 'encoder':
+                encode(src, mask, pos)
+            else:
+                transformer(src, mask, query_embed, pos)
+
+    modes = ['dense', 'sdpa', 'sparse']
+    num_images = sum(len(mask) for mask in masks)
+    padding = sum(mask.sum().item() for mask in masks) / sum(mask.numel() for mask in masks)
+    with torch.no_grad():
+        difference = 0
+        for src, mask, pos in inputs:
+            transformer.encoder.sparse = False
+            dense = encode(src, mask, pos)
+            transformer.encoder.sparse = True
+            sparse = encode(src, mask, pos)
+            difference = max(difference, ((dense - sparse).abs() * ~mask.flatten(1).T.unsqueeze(-1)).max().item())
+        latencies = time_ms([lambda mode=mode: run(mode) for mode in modes], device, args.repeat, warmup=1)
+    print(f'{args.device}, {torch.get_num_threads()} threads, {args.part}, {args.enc_layers} encoder layers, '
+          f'valid split at {args.test_scale}, {args.sampler} batches of {args.batch_size} padded to {args.padding}')
+    print(f'{len(masks)} batches, {num_images} images, {padding:.1%} of the tokens padding, '
+          f'max diff {difference:.2e}')
+    print(f'{"mode":>6s} {"ms/batch":>9s} {"images/s":>9s} {"speedup":>8s}')
+    for mode, latency in zip(modes, latencies):
+        print(f'{mode:>6s} {latency / len(masks):9.1f} {1000 * num_images / latency:9.2f} '
+              f'{latencies[0] / latency:7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Startup-time benchmark of the 2.5VRD CSV tables:
+    1. wall time of `python vrd_test.py --help` (imports engine.py,
+       process_model_outputs.py and evaluation.py),
+    2. eager pd.read_csv() of all tables (what every import used to pay),
+    3. TableRegistry without a persisted copy (CSV + compaction),
+    4. TableRegistry reloading the persisted copies.
+
+Run from the project root:
+    python tools/benchmark/table_loading.py
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.two_point_five_vrd import vrd_tables
+from datasets.table_registry import TableRegistry
+
+
+def memory_of(tables):
+    return sum(table.memory_usage(deep=True).sum() for table in tables) / 1024 ** 2
+
+
+def load_all(registry):
+    registry.unload()
+    start = time.perf_counter()
+    tables = [registry[name] for name in registry.names()]
+    return time.perf_counter() - start, memory_of(tables)
+
+
+def main():
+    parser = argparse.ArgumentParser('2.5VRD table loading benchmark')
+    parser.add_argument('--repeats', default=3, type=int)
+    parser.add_argument('--cache_format', default='feather', choices=['feather', 'parquet', 'pickle'])
+    parser.add_argument('--skip_cli', action='store_true', help='do not time vrd_test.py --help')
+    args = parser.parse_args()
+
+    if not args.skip_cli:
+        times = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, 'vrd_test.py', '--help'], check=True,
+                           stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        print(f'vrd_test.py --help (median of {args.repeats}): {np.median(times):8.3f} s')
+
+    start = time.perf_counter()
+    eager_tables = [pd.read_csv(vrd_tables.csv_path(name),
+                                **vrd_tables.readers[name]['read_csv_kwargs'])
+                    for name in vrd_tables.names()]
+    eager_time = time.perf_counter() - start
+    print(f'eager pd.read_csv of {len(eager_tables)} tables:   {eager_time:8.3f} s  {memory_of(eager_tables):8.1f} MB')
+    del eager_tables
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        registry = TableRegistry(vrd_tables.root, cache_dir=cache_dir, cache_format=args.cache_format)
+        for name, reader in vrd_tables.readers.items():
+            registry.register(name, reader['file_name'], postprocess=reader['postprocess'],
+                              compact=reader['compact'], **reader['read_csv_kwargs'])
+
+        cold_time, cold_memory = load_all(registry)
+        print(f'registry, CSV + compaction:      {cold_time:8.3f} s  {cold_memory:8.1f} MB')
+        warm_times = [load_all(registry)[0] for _ in range(args.repeats)]
+        print(f'registry, persisted {registry._format():8s}:    {np.median(warm_times):8.3f} s')
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    main()
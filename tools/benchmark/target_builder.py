@@ -0,0 +1,144 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Throughput (samples/s) of the DataLoader of a 2.5VRD split with intersection
+boxes computed
+    previous: in __getitem__, image by image, followed by gc.collect(),
+    current:  for whole batches by IntersectionBoxes (or BatchTransforms)
+              after collate_fn,
+and the time of the intersection boxes alone for a batch of targets.
+
+Run from the project root:
+    python tools/benchmark/target_builder.py --image_set train --num_workers 8
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from datasets.two_point_five_vrd import build, compute_intersection_boxes
+from magic_numbers import *
+import util.misc as utils
+
+
+def previous_compute_intersection_boxes(human_boxes, object_boxes):
+    xmin = torch.max(human_boxes[:, 0] - human_boxes[:, 2] / 2, object_boxes[:, 0] - object_boxes[:, 2] / 2)
+    ymin = torch.max(human_boxes[:, 1] - human_boxes[:, 3] / 2, object_boxes[:, 1] - object_boxes[:, 3] / 2)
+    xmax = torch.min(human_boxes[:, 0] + human_boxes[:, 2] / 2, object_boxes[:, 0] + object_boxes[:, 2] / 2)
+    ymax = torch.min(human_boxes[:, 1] + human_boxes[:, 3] / 2, object_boxes[:, 1] + object_boxes[:, 3] / 2)
+    xmin_adjusted = torch.min(xmin, xmax)
+    xmax_adjusted = torch.max(xmin, xmax)
+    ymin_adjusted = torch.min(ymin, ymax)
+    ymax_adjusted = torch.max(ymin, ymax)
+    w = xmax_adjusted - xmin_adjusted
+    h = ymax_adjusted - ymin_adjusted
+    cx = (xmin_adjusted + xmax_adjusted) / 2
+    cy = (ymin_adjusted + ymax_adjusted) / 2
+    if RANDOMLY_SHIFT_GT_INTERSECTION_BOXES:
+        random_noise_scale_x, random_noise_scale_y = np.random.normal(loc=RAND_INTER_LOC, scale=RAND_INTER_SCALE, size=2)
+        cx += w * random_noise_scale_x
+        cy += h * random_noise_scale_y
+    if RANDOMLY_ADJUST_SIZES_OF_GT_INTERSECTION_BOXES:
+        random_size_scale_x, random_size_scale_y = np.random.normal(loc=RAND_INTER_SIZE_LOC, scale=RAND_INTER_SIZE_SCALE, size=2)
+        w += w * random_size_scale_x
+        h += h * random_size_scale_y
+        w = torch.max(0.00001 * torch.tensor(w.shape, device=w.device), w)
+        h = torch.max(0.00001 * torch.tensor(h.shape, device=h.device), h)
+    if DO_NOT_PREDICT_INTERSECTION_BOX_IF_NO_INTERSECTION:
+        if (xmin > xmax).any() or (ymin > ymax).any():
+            w = w * 0 - 1
+            h = h * 0 - 1
+    return torch.vstack([cx, cy, w, h]).T
+
+
+class PreviousDataset(torch.utils.data.Dataset):
+    """
+    The samples of dataset with the intersection boxes computed as
+    __getitem__ used to.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        sample = self.dataset[index]
+        intersection_boxes = previous_compute_intersection_boxes(sample[2], sample[4])
+        gc.collect()
+        return sample + (intersection_boxes,)
+
+
+def previous_collate_fn(batch):
+    samples, depth, targets = utils.collate_fn([sample[:-1] for sample in batch])
+    targets.relations['intersection_boxes'] = torch.cat([sample[-1] for sample in batch])
+    return [samples, depth, targets]
+
+
+def throughput(data_loader):
+    # A complete pass, including the start of the workers, as the prefetched
+    # batches would otherwise hide the cost of the first ones
+    num_samples = 0
+    start = time.perf_counter()
+    for _, _, targets in data_loader:
+        num_samples += len(targets)
+    return num_samples / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser('Intersection box target builder benchmark')
+    parser.add_argument('--image_set', default='train', choices=['train', 'valid', 'test'])
+    parser.add_argument('--batch_size', default=8, type=int)
+    parser.add_argument('--num_workers', default=8, type=int)
+    parser.add_argument('--num_batches', default=20, type=int)
+    args = parser.parse_args()
+
+    dataset = build(args.image_set, test_scale=-1 if args.image_set == 'train' else 800)
+    num_samples = min(args.num_batches, len(dataset) // args.batch_size) * args.batch_size
+    indices = torch.randperm(len(dataset), generator=torch.Generator().manual_seed(0))[:num_samples].tolist()
+    sampler = torch.utils.data.SubsetRandomSampler(indices, generator=torch.Generator().manual_seed(0))
+
+    # Intersection boxes alone, for the targets of one batch
+    samples = [dataset[i] for i in range(args.batch_size)]
+    human_boxes = [sample[2] for sample in samples]
+    object_boxes = [sample[4] for sample in samples]
+    sizes = [len(boxes) for boxes in human_boxes]
+    repeats = 200
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for h, o in zip(human_boxes, object_boxes):
+            previous_compute_intersection_boxes(h, o)
+            gc.collect()
+    previous_ms = (time.perf_counter() - start) / repeats * 1000
+    human_boxes, object_boxes = torch.cat(human_boxes), torch.cat(object_boxes)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        compute_intersection_boxes(human_boxes, object_boxes, sizes)
+    current_ms = (time.perf_counter() - start) / repeats * 1000
+    print(f'{args.image_set}, batch size {args.batch_size} ({sum(sizes)} relations), '
+          f'{args.num_workers} workers, {torch.get_num_threads()} threads')
+    print(f'intersection boxes of a batch: previous {previous_ms:.2f} ms, current {current_ms:.2f} ms')
+
+    loaders = dict(
+        previous=DataLoader(PreviousDataset(dataset), batch_size=args.batch_size, sampler=sampler,
+                            collate_fn=previous_collate_fn, num_workers=args.num_workers, drop_last=True),
+        current=DataLoader(dataset, batch_size=args.batch_size, sampler=sampler,
+                           collate_fn=utils.build_collate_fn(dataset), num_workers=args.num_workers,
+                           drop_last=True))
+    for name, data_loader in loaders.items():
+        print(f'{name:8s} {throughput(data_loader):8.2f} samples/s ({num_samples} samples)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Write the images (and optionally depth maps) of the 2.5VRD splits at capped
+resolution into image shards (see datasets/image_shards.py). Set
+IMAGE_SHARD_DIR in magic_numbers.py to the output folder to train and test
+on them.
+
+Run from the project root:
+    python tools/build_image_shards.py --output_dir data/2.5vrd/shards
+    python tools/build_image_shards.py --output_dir data/2.5vrd/shards --splits test --with_depth
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from datasets.image_shards import ImageShardWriter, encode_capped_image, encode_depth
+
+annotation_files = {
+    'train': 'annotation_train_combined.odgt',
+    'validation': 'annotation_valid_combined.odgt',
+    'test': 'annotation_test_combined.odgt',
+}
+
+
+def build_split(args, split):
+    with open(os.path.join(args.root, annotation_files[split]), 'r') as f:
+        image_ids = [json.loads(l)['file_name'] for l in f if l.strip()]
+
+    writer = ImageShardWriter(args.output_dir, split, shard_size=args.shard_size_mb * 1024 ** 2)
+    start_time = time.time()
+    for i, image_id in enumerate(image_ids):
+        image_bytes, width, height = encode_capped_image(os.path.join(args.root, 'images', split, image_id),
+                                                         args.min_size, args.max_size, args.quality)
+        depth_bytes = None
+        if args.with_depth:
+            depth_bytes = encode_depth(os.path.join(args.root, 'depth', split, image_id[:-3] + 'png'),
+                                       width, height)
+        writer.add(image_id, image_bytes, width, height, depth_bytes)
+        if (i + 1) % 1000 == 0:
+            print('{}: {}/{} images, {:.1f} s'.format(split, i + 1, len(image_ids), time.time() - start_time))
+    writer.close()
+    print('{}: {} images in {} shards, {:.1f} s'.format(split, len(image_ids), writer.shard + 1,
+                                                       time.time() - start_time))
+
+
+def main():
+    parser = argparse.ArgumentParser('Build 2.5VRD image shards')
+    parser.add_argument('--root', default='data/2.5vrd')
+    parser.add_argument('--output_dir', default='data/2.5vrd/shards')
+    parser.add_argument('--splits', default=['train', 'validation', 'test'], nargs='+',
+                        choices=['train', 'validation', 'test'])
+    parser.add_argument('--min_size', default=800, type=int, help='cap of the shorter side')
+    parser.add_argument('--max_size', default=1333, type=int, help='cap of the longer side')
+    parser.add_argument('--quality', default=95, type=int, help='JPEG quality of downsized images')
+    parser.add_argument('--shard_size_mb', default=1024, type=int)
+    parser.add_argument('--with_depth', action='store_true', help='also store single-channel depth maps')
+    args = parser.parse_args()
+
+    for split in args.splits:
+        build_split(args, split)
+
+
+if __name__ == '__main__':
+    main()
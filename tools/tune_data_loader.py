@@ -0,0 +1,129 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Measure the batches per second of the DataLoaders of the 2.5VRD splits
+(decoding, transforms and collate_fn as in main.py, with the settings of
+magic_numbers.py) for every combination of number of workers, prefetch
+factor and memory pinning, each for a fixed time, and write the fastest
+combination of every split to a DataLoader profile (see
+datasets/loader_profile.py). Set DATA_LOADER_PROFILE in magic_numbers.py to
+the profile to use it in main.py and vrd_test.py.
+
+Run from the project root:
+    python tools/tune_data_loader.py --output data_loader_profile.json
+    python tools/tune_data_loader.py --splits valid --num_workers 4 8 16 --budget 30
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import torch
+from torch.utils.data import DataLoader
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from datasets.two_point_five_vrd import build
+from datasets.loader_profile import PROFILE_OPTIONS
+from magic_numbers import *
+import util.misc as utils
+
+
+def default_num_workers():
+    # 0, then powers of two up to twice the number of CPUs
+    cpu_count = os.cpu_count() or 1
+    num_workers = [0]
+    while num_workers[-1] < 2 * cpu_count:
+        num_workers.append(max(1, 2 * num_workers[-1]))
+    return num_workers
+
+
+def set_worker_sharing_strategy(worker_id):
+    torch.multiprocessing.set_sharing_strategy(sharing_strategy)
+
+
+def measure(dataset, batch_size, options, budget, warmup):
+    """
+    :return: (batches per second after the first warmup batches, seconds
+        until the first batch).
+    """
+    # Sampling with replacement never runs out of batches within the budget
+    sampler = torch.utils.data.RandomSampler(dataset, replacement=True, num_samples=10 ** 9)
+    data_loader = DataLoader(dataset, batch_sampler=torch.utils.data.BatchSampler(sampler, batch_size, drop_last=True),
+                             collate_fn=utils.build_collate_fn(dataset), worker_init_fn=set_worker_sharing_strategy,
+                             **options)
+    start = time.perf_counter()
+    iterator = iter(data_loader)
+    next(iterator)
+    first_batch = time.perf_counter() - start
+    for _ in range(warmup):
+        next(iterator)
+    num_batches = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < budget:
+        next(iterator)
+        num_batches += 1
+    batches_per_second = num_batches / (time.perf_counter() - start)
+    del iterator
+    return batches_per_second, first_batch
+
+
+def main():
+    parser = argparse.ArgumentParser('DataLoader tuning')
+    parser.add_argument('--splits', default=['train', 'valid'], nargs='+', choices=['train', 'valid', 'test'])
+    parser.add_argument('--batch_size', default=2, type=int, help='batch size of the training set')
+    parser.add_argument('--batch_size_validation', default=batch_size_validation, type=int,
+                        help='batch size of the validation and test sets')
+    parser.add_argument('--num_workers', default=default_num_workers(), type=int, nargs='+')
+    parser.add_argument('--prefetch_factors', default=[2, 4, 8], type=int, nargs='+')
+    parser.add_argument('--pin_memory', default=[0, 1] if torch.cuda.is_available() else [0], type=int, nargs='+',
+                        help='pinning settings to try (0 and 1), pinning needs CUDA')
+    parser.add_argument('--budget', default=20, type=float, help='seconds of batches measured per combination')
+    parser.add_argument('--warmup', default=5, type=int, help='batches skipped before measuring')
+    parser.add_argument('--output', default='data_loader_profile.json')
+    args = parser.parse_args()
+
+    torch.multiprocessing.set_sharing_strategy(sharing_strategy)
+    profile = dict(sharing_strategy=sharing_strategy,
+                   machine=dict(node=platform.node(), cpu_count=os.cpu_count(), torch=torch.__version__,
+                                cuda=torch.cuda.get_device_name() if torch.cuda.is_available() else None),
+                   results=[])
+    for split in args.splits:
+        dataset = build(split, test_scale=-1 if split == 'train' else 800)
+        batch_size = args.batch_size if split == 'train' else args.batch_size_validation
+        print(f'{split}: {len(dataset)} images, batch size {batch_size}, {args.budget:g} s per combination')
+        print(f'{"workers":>7s} {"prefetch":>8s} {"pin":>3s} {"batches/s":>9s} {"first s":>8s}')
+        best = None
+        for num_workers in args.num_workers:
+            # The prefetch factor only applies to workers
+            for prefetch_factor in args.prefetch_factors if num_workers > 0 else [None]:
+                for pin_memory in args.pin_memory:
+                    options = dict(num_workers=num_workers, prefetch_factor=prefetch_factor,
+                                   pin_memory=bool(pin_memory))
+                    if prefetch_factor is None:
+                        options.pop('prefetch_factor')
+                    batches_per_second, first_batch = measure(dataset, batch_size, options, args.budget,
+                                                              args.warmup)
+                    print(f'{num_workers:7d} {str(prefetch_factor):>8s} {pin_memory:3d} {batches_per_second:9.2f} '
+                          f'{first_batch:8.2f}')
+                    profile['results'].append(dict(split=split, batch_size=batch_size,
+                                                   batches_per_second=batches_per_second, first_batch=first_batch,
+                                                   **options))
+                    if best is None or batches_per_second > best[0]:
+                        best = (batches_per_second, options)
+        profile[split] = dict(best[1], batch_size=batch_size, batches_per_second=best[0])
+        print(f'{split}: ' + ', '.join(f'{name}={profile[split][name]}' for name in PROFILE_OPTIONS
+                                       if name in profile[split]) + f' ({best[0]:.2f} batches/s)')
+
+    with open(args.output, 'w') as f:
+        json.dump(profile, f, indent=2)
+    print(f'Profile written to {args.output}, set DATA_LOADER_PROFILE = {args.output!r} in magic_numbers.py')
+
+
+if __name__ == '__main__':
+    main()
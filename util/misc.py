@@ -21,7 +21,11 @@ import torchvision
 # if float(torchvision.__version__[:3]) < 0.7:
 #     from torchvision.ops import _new_empty_tensor
 #     from torchvision.ops.misc import _output_size
-import copy
+import functools
+
+import numpy as np
+
+from magic_numbers import PIN_COLLATE_BUFFERS
 
 
 class SmoothedValue(object):
@@ -266,22 +270,413 @@ def get_sha():
     return message
 
 
-def collate_fn(batch):
+def _new_shared_tensor(shape, dtype):
+    # Allocated in shared memory right away, as default_collate does in
+    # DataLoader workers, so that sending the batch to the main process does
+    # not copy it again
+    numel = 1
+    for size in shape:
+        numel *= size
+    tensor = torch.empty(0, dtype=dtype)
+    storage = tensor._typed_storage() if hasattr(tensor, '_typed_storage') else tensor.storage()
+    return tensor.new(storage._new_shared(numel)).view(shape)
+
+
+def _storage_use_count(tensor):
+    """
+    :return: number of references to the storage of tensor, i.e. of the
+        tensors sharing it (views, slices, whatever object holds them), or
+        None if this version of torch cannot tell.
+    """
+    if not hasattr(torch._C, '_storage_Use_Count') or not hasattr(tensor, 'untyped_storage'):
+        return None
+    return torch._C._storage_Use_Count(tensor.untyped_storage()._cdata)
+
+
+class PaddedBufferPool(object):
+    """
+    Reusable buffers for the padded batches of collate_fn in the main
+    process. A buffer is handed out as a tensor of the requested shape (a
+    view of its first elements), so it serves any batch shape that fits
+    into it, and is handed out again once nothing shares its storage any
+    more, i.e. once the batch that used it and every view of it (slices,
+    the fields of NestedTensor and TargetBatch) are released.
+
+    Pinned batches are not pooled: they are allocated for every batch from
+    the caching host allocator of CUDA, which reuses a block only once the
+    non_blocking copies from it have completed. Nor are batches pooled if
+    torch cannot count the references to a storage.
+    """
+
+    def __init__(self, pin_memory=False, max_buffers=8):
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.max_buffers = max_buffers
+        self.enabled = not self.pin_memory and _storage_use_count(torch.empty(0)) is not None
+        # [flat buffer, use count of its storage when it is free]
+        self.buffers = []
+
+    def _free(self, entry):
+        return _storage_use_count(entry[0]) <= entry[1]
+
+    def empty(self, shape, dtype):
+        numel = 1
+        for size in shape:
+            numel *= size
+        if not self.enabled:
+            return torch.empty(shape, dtype=dtype, pin_memory=self.pin_memory)
+        free = [i for i, entry in enumerate(self.buffers) if entry[0].dtype == dtype and self._free(entry)]
+        fitting = [i for i in free if self.buffers[i][0].numel() >= numel]
+        if fitting:
+            i = min(fitting, key=lambda j: self.buffers[j][0].numel())
+        else:
+            buffer = torch.empty(numel, dtype=dtype)
+            entry = [buffer, _storage_use_count(buffer)]
+            if free:
+                # Replace a free buffer that is too small
+                i = min(free, key=lambda j: self.buffers[j][0].numel())
+                self.buffers[i] = entry
+            elif len(self.buffers) < self.max_buffers:
+                i = len(self.buffers)
+                self.buffers.append(entry)
+            else:
+                return buffer.view(shape)
+        return self.buffers[i][0][:numel].view(shape)
+
+    def nbytes(self):
+        return sum(entry[0].numel() * entry[0].element_size() for entry in self.buffers)
+
+
+collate_buffer_pool = PaddedBufferPool(pin_memory=PIN_COLLATE_BUFFERS)
+
+
+def new_batch_tensor(shape, dtype=torch.float32):
+    """
+    Uninitialized tensor for a batch assembled by collate_fn: in shared
+    memory in DataLoader workers, from collate_buffer_pool otherwise.
+    """
+    if torch.utils.data.get_worker_info() is not None:
+        return _new_shared_tensor(shape, dtype)
+    return collate_buffer_pool.empty(shape, dtype)
+
+
+def fit_padding_sizes(sizes, num_sizes, stride=32):
+    """
+    :param sizes: heights (or widths) of images.
+    :return: sorted list of at most num_sizes multiples of stride, the
+        largest one holding the largest of sizes, that minimizes the total
+        padding of sizes padded to the smallest of them that holds them.
+    """
+    sizes = np.ceil(np.asarray(sizes, dtype=np.float64) / stride).astype(np.int64) * stride
+    values, counts = np.unique(sizes, return_counts=True)
+    num_sizes = max(1, min(num_sizes, len(values)))
+    # cost[i][j]: padding of values[i..j] padded to values[j]
+    weighted = np.cumsum(np.concatenate([[0], counts * values]))
+    cumulative_counts = np.cumsum(np.concatenate([[0], counts]))
+
+    def cost(i, j):
+        return values[j] * (cumulative_counts[j + 1] - cumulative_counts[i]) - (weighted[j + 1] - weighted[i])
+
+    # best[k][j]: least padding of values[0..j] with k + 1 sizes, the
+    # largest being values[j]
+    num_values = len(values)
+    best = np.full((num_sizes, num_values), np.inf)
+    previous = np.full((num_sizes, num_values), -1, dtype=np.int64)
+    for j in range(num_values):
+        best[0][j] = cost(0, j)
+    for k in range(1, num_sizes):
+        for j in range(k, num_values):
+            for i in range(k - 1, j):
+                padding = best[k - 1][i] + cost(i + 1, j)
+                if padding < best[k][j]:
+                    best[k][j], previous[k][j] = padding, i
+    k, j = int(np.argmin(best[:, -1])), num_values - 1
+    chosen = []
+    while j >= 0 and k >= 0:
+        chosen.append(int(values[j]))
+        j, k = previous[k][j], k - 1
+    return sorted(chosen)
+
+
+class PaddingBuckets(object):
+    """
+    Canonical shapes of padded batches: collate_fn pads a batch to the
+    smallest of heights x widths that holds all its images instead of to
+    its largest image, so that batches come in a few shapes only, which
+    traced or compiled models and the CUDA caching allocator reuse.
+    Heights and widths are multiples of stride (the stride of the backbone
+    features). Batches beyond the largest bucket are padded to multiples of
+    stride.
+    """
 
-    names = ['human_boxes', 'human_labels', 'object_boxes', 'object_labels', 'action_boxes', 'action_labels', 'occlusion_labels', 'raw_distance_labels', 'raw_occlusion_labels', 'image_id', 'org_size', 'num_bounding_boxes_in_ground_truth', 'intersection_boxes']
+    def __init__(self, heights, widths, stride=32):
+        assert all(size % stride == 0 for size in list(heights) + list(widths)), (heights, widths, stride)
+        self.heights = sorted(heights)
+        self.widths = sorted(widths)
+        self.stride = stride
 
-    for i in range(len(batch)):
-        target = dict(zip(names, copy.deepcopy(batch[i][2:])))
-        target['image_id'] = target['image_id'].item()
-        target['num_bounding_boxes_in_ground_truth'] = target['num_bounding_boxes_in_ground_truth'].item()
+    @classmethod
+    def fit(cls, sizes, num_buckets=4, stride=32):
+        """
+        :param sizes: (N, 2) array of the (height, width) of the images as
+            they are padded (after resizing).
+        :param num_buckets: number of heights and of widths.
+        """
+        sizes = np.asarray(sizes).reshape(-1, 2)
+        return cls(fit_padding_sizes(sizes[:, 0], num_buckets, stride),
+                   fit_padding_sizes(sizes[:, 1], num_buckets, stride), stride)
 
-        batch[i] = (copy.deepcopy(batch[i][0]), copy.deepcopy(batch[i][1]), target)
+    def _round_up(self, size, buckets):
+        for bucket in buckets:
+            if bucket >= size:
+                return bucket
+        return -(-size // self.stride) * self.stride
+
+    def shape(self, height, width):
+        """
+        :return: (height, width) of a batch whose largest image is
+            height x width.
+        """
+        return self._round_up(height, self.heights), self._round_up(width, self.widths)
+
+    def __repr__(self):
+        return 'PaddingBuckets(heights={}, widths={})'.format(self.heights, self.widths)
 
+
+def pad_tensor_list(tensor_list, shape=None):
+    """
+    nested_tensor_from_tensor_list() for collate_fn: the images are copied
+    once, straight into a batch from new_batch_tensor(), and only the
+    padding is cleared.
+    :param shape: (height, width) of the padded batch, at least that of the
+        largest image, which it is by default.
+    """
+    batch_shape = [len(tensor_list)] + _max_by_axis([list(img.shape) for img in tensor_list])
+    if shape is not None:
+        assert shape[0] >= batch_shape[2] and shape[1] >= batch_shape[3], (shape, batch_shape)
+        batch_shape[2:] = shape
+    b, c, h, w = batch_shape
+    tensor = new_batch_tensor(batch_shape, tensor_list[0].dtype)
+    mask = new_batch_tensor((b, h, w), torch.bool)
+    for img, pad_img, m in zip(tensor_list, tensor, mask):
+        pad_img[: img.shape[0], : img.shape[1], : img.shape[2]].copy_(img)
+        pad_img[:, img.shape[1]:].zero_()
+        pad_img[:, : img.shape[1], img.shape[2]:].zero_()
+        m[: img.shape[1], : img.shape[2]] = False
+        m[img.shape[1]:] = True
+        m[: img.shape[1], img.shape[2]:] = True
+    return NestedTensor(tensor, mask)
+
+
+class TargetBatch(object):
+    """
+    Targets of a batch as a few tensors rather than a dict per image:
+        relations: dict of the per-relation fields, each holding the
+            relations of all images concatenated (split by sizes),
+        images: dict of the per-image fields (image_id,
+            num_bounding_boxes_in_ground_truth and org_size).
+    Indexing and iterating give a dict per image (of views), like the list
+    of dicts that collate_fn used to return, so the matcher, the criterion
+    and the evaluation read it unchanged.
+    """
+
+    def __init__(self, relations, sizes, images):
+        self.relations = relations
+        self.sizes = list(sizes)
+        self.images = images
+        self._targets = None
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def _split(self):
+        if self._targets is None:
+            targets = [dict() for _ in self.sizes]
+            for name, tensor in self.relations.items():
+                for target, part in zip(targets, tensor.split(self.sizes)):
+                    target[name] = part
+            for name, values in self.images.items():
+                for target, value in zip(targets, values):
+                    target[name] = value
+            self._targets = targets
+        return self._targets
+
+    def __getitem__(self, index):
+        return self._split()[index]
+
+    def __iter__(self):
+        return iter(self._split())
+
+    def to(self, device, non_blocking=False):
+        """
+        :return: TargetBatch with all tensors on device, copied with one
+            transfer per field for the whole batch.
+        """
+        relations = {name: tensor.to(device, non_blocking=non_blocking) for name, tensor in self.relations.items()}
+        images = {name: values.to(device, non_blocking=non_blocking) if isinstance(values, Tensor) else values
+                  for name, values in self.images.items()}
+        return TargetBatch(relations, self.sizes, images)
+
+    def pin_memory(self):
+        # Called by DataLoader(pin_memory=True)
+        relations = {name: tensor.pin_memory() for name, tensor in self.relations.items()}
+        images = {name: values.pin_memory() if isinstance(values, Tensor) else values
+                  for name, values in self.images.items()}
+        return TargetBatch(relations, self.sizes, images)
+
+
+def target_sizes(targets):
+    """
+    :return: number of relations of every image of targets (a TargetBatch
+        or a list of dicts).
+    """
+    if isinstance(targets, TargetBatch):
+        return targets.sizes
+    return [len(t['human_boxes']) for t in targets]
+
+
+def cat_targets(targets, name):
+    """
+    :return: torch.cat([t[name] for t in targets]), which a TargetBatch
+        already holds.
+    """
+    if isinstance(targets, TargetBatch):
+        return targets.relations[name]
+    return torch.cat([t[name] for t in targets])
+
+
+def matched_targets(targets, name, indices):
+    """
+    :param indices: matches [(index_i, index_j), ...] of the matcher.
+    :return: torch.cat([t[name][j] for t, (_, j) in zip(targets, indices)]),
+        a single gather for a TargetBatch.
+    """
+    if isinstance(targets, TargetBatch):
+        tensor = targets.relations[name]
+        offsets = [0]
+        for size in targets.sizes[:-1]:
+            offsets.append(offsets[-1] + size)
+        index = torch.cat([j + offset for (_, j), offset in zip(indices, offsets)])
+        return tensor[index.to(tensor.device)]
+    return torch.cat([t[name][j] for t, (_, j) in zip(targets, indices)])
+
+
+def stacked_targets(targets, name):
+    """
+    :return: torch.vstack([t[name].reshape(-1) for t in targets]), a view of
+        a TargetBatch whose images have the same number of relations.
+    """
+    if isinstance(targets, TargetBatch) and len(set(targets.sizes)) == 1:
+        return targets.relations[name].reshape(len(targets), -1)
+    return torch.vstack([t[name].reshape(-1) for t in targets])
+
+
+# Fields of the samples of two_point_five_VRD after img and depth
+sample_fields = ['human_boxes', 'human_labels', 'object_boxes', 'object_labels', 'action_boxes', 'action_labels',
+                 'occlusion_labels', 'raw_distance_labels', 'raw_occlusion_labels', 'image_id', 'org_size',
+                 'num_bounding_boxes_in_ground_truth']
+relation_fields = ['human_boxes', 'human_labels', 'object_boxes', 'object_labels', 'action_boxes', 'action_labels',
+                   'occlusion_labels', 'raw_distance_labels', 'raw_occlusion_labels']
+
+
+def _cat(tensors):
+    if torch.utils.data.get_worker_info() is None:
+        return torch.cat(tensors)
+    out = _new_shared_tensor([sum(len(t) for t in tensors)] + list(tensors[0].shape[1:]), tensors[0].dtype)
+    return torch.cat(tensors, out=out)
+
+
+def pool_depth(depth, stride=32):
+    """
+    :param depth: NestedTensor of a padded batch of single-channel depth
+        maps.
+    :return: NestedTensor of the depth maps and of their mask max-pooled
+        with kernel and stride stride (ceil mode), i.e. at the resolution of
+        the backbone features.
+    """
+    tensors = torch.nn.functional.max_pool2d(depth.tensors, stride, stride, ceil_mode=True)
+    mask = torch.nn.functional.max_pool2d(depth.mask[:, None].float(), stride, stride, ceil_mode=True)[:, 0].bool()
+    return NestedTensor(tensors, mask)
+
+
+def pool_depth_list(depth_list, stride=32, shape=None):
+    """
+    pool_depth() of the padded batch of depth_list, without padding the full
+    resolution depth maps: every map is pooled on its own, then the pooled
+    maps are padded. The result is the same, pooled blocks that contain
+    padding also take the maximum with the zero padding.
+    :param shape: (height, width) of the padded full resolution batch, that
+        of the largest map by default.
+    """
+    pooled = [torch.nn.functional.max_pool2d(d[None], stride, stride, ceil_mode=True)[0] for d in depth_list]
+    # A block contains padding if it reaches beyond the image within the
+    # padded batch
+    height, width = max(d.shape[1] for d in depth_list), max(d.shape[2] for d in depth_list)
+    if shape is not None:
+        height, width = shape
+    depth = pad_tensor_list(pooled, (-(-height // stride), -(-width // stride)))
+    block_end_rows = (torch.arange(depth.mask.shape[1]) * stride + stride).clamp(max=height)
+    block_end_columns = (torch.arange(depth.mask.shape[2]) * stride + stride).clamp(max=width)
+    for d, m in zip(depth_list, depth.mask):
+        m.copy_((block_end_rows > d.shape[1])[:, None] | (block_end_columns > d.shape[2])[None, :])
+    depth.tensors.copy_(torch.where(depth.mask[:, None], depth.tensors.clamp(min=0), depth.tensors))
+    return depth
+
+
+def collate_fn(batch, depth_stride=None, padding_buckets=None):
+    """
+    :param depth_stride: if not None, the depth maps are max-pooled to this
+        stride (see pool_depth_list()) instead of being padded at full
+        resolution.
+    :param padding_buckets: PaddingBuckets the batch is padded to, if not
+        None.
+    :return: [NestedTensor of the images, NestedTensor of the depth maps or
+        None, TargetBatch]. Nothing is deep-copied: images are copied once
+        into the padded batch and the target fields once into the
+        concatenated fields of TargetBatch.
+    """
     batch = list(zip(*batch))
-    # Transform samples and targets from tuples to nested tensors
-    batch[0] = nested_tensor_from_tensor_list(batch[0])
-    batch[1] = nested_tensor_from_tensor_list(batch[1])
-    return batch
+    shape = None
+    if padding_buckets is not None:
+        shape = padding_buckets.shape(max(img.shape[1] for img in batch[0]), max(img.shape[2] for img in batch[0]))
+    samples = pad_tensor_list(batch[0], shape)
+    # Depth is None if the dataset does not load it
+    depth = None
+    if not any(d is None for d in batch[1]):
+        if depth_stride is None:
+            depth = pad_tensor_list(batch[1], shape)
+        else:
+            depth = pool_depth_list(batch[1], depth_stride, shape)
+
+    fields = dict(zip(sample_fields, batch[2:]))
+    sizes = [len(boxes) for boxes in fields['human_boxes']]
+    relations = {name: _cat(fields[name]) for name in relation_fields}
+    images = dict(image_id=[image_id.item() for image_id in fields['image_id']],
+                  org_size=torch.stack(fields['org_size']),
+                  num_bounding_boxes_in_ground_truth=[int(n) for n in fields['num_bounding_boxes_in_ground_truth']])
+    return [samples, depth, TargetBatch(relations, sizes, images)]
+
+
+def batch_transforms_collate_fn(batch, batch_transforms, depth_stride=None, padding_buckets=None):
+    samples, depth, targets = collate_fn(batch, depth_stride, padding_buckets)
+    return batch_transforms(samples, depth, targets)
+
+
+def build_collate_fn(dataset):
+    """
+    collate_fn for the DataLoader of dataset, followed by the batch_transforms
+    of the dataset if it has any (augmentation and targets computed for
+    whole batches, such as the intersection boxes of two_point_five_VRD).
+    Depth maps are pooled by collate_fn if the dataset has a
+    collate_depth_stride, and batches are padded to the
+    collate_padding_buckets of the dataset if it has any.
+    """
+    batch_transforms = getattr(dataset, 'batch_transforms', None)
+    options = dict(depth_stride=getattr(dataset, 'collate_depth_stride', None),
+                   padding_buckets=getattr(dataset, 'collate_padding_buckets', None))
+    options = {name: value for name, value in options.items() if value is not None}
+    if batch_transforms is None:
+        return functools.partial(collate_fn, **options) if options else collate_fn
+    return functools.partial(batch_transforms_collate_fn, batch_transforms=batch_transforms, **options)
 
 
 def _max_by_axis(the_list):
@@ -365,6 +760,10 @@ class NestedTensor(object):
             cast_mask = None
         return NestedTensor(cast_tensor, cast_mask)
 
+    def pin_memory(self):
+        # Called by DataLoader(pin_memory=True)
+        return NestedTensor(self.tensors.pin_memory(), self.mask.pin_memory() if self.mask is not None else None)
+
     def decompose(self):
         return self.tensors, self.mask
 
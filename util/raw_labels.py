@@ -0,0 +1,57 @@
+# ------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License")
+# ------------------------------------------------------------------------
+# Copyright (c) Yang Li and Yucheng Tu. All Rights Reserved
+# ------------------------------------------------------------------------
+
+"""
+Soft labels from the raw votes of 2.5VRD relations.
+
+The 'raw_distance' and 'raw_occlusion' fields of the .odgt annotations (and
+of the within/across-image VRD CSV tables) hold the votes of the annotators
+as comma separated strings, e.g. '1,2,1'. raw_votes_to_frequencies() turns
+the vote strings of many relations into their vote frequencies at once.
+
+Only depends on numpy, so that the annotation notebook can use it, e.g.
+    sys.path.append('../..')
+    from util.raw_labels import raw_votes_to_frequencies
+    raw_distance_labels = raw_votes_to_frequencies(df['raw_distance'].values)
+"""
+import numpy as np
+
+# Number of bins of the soft labels
+NUM_RAW_LABEL_BINS = 5
+
+
+def parse_raw_votes(raw_votes):
+    """
+    :param raw_votes: sequence of N comma separated vote strings.
+    :return: (votes, relation_ids), two int64 arrays with one entry per
+        vote: the vote and the index of its relation in raw_votes.
+    """
+    raw_votes = [str(v) for v in raw_votes]
+    counts = np.array([v.count(',') + 1 for v in raw_votes], dtype=np.int64)
+    votes = np.array(','.join(raw_votes).split(','), dtype=np.int64) if len(raw_votes) > 0 \
+        else np.zeros(0, dtype=np.int64)
+    relation_ids = np.repeat(np.arange(len(raw_votes)), counts)
+    return votes, relation_ids
+
+
+def raw_votes_to_frequencies(raw_votes, num_bins=NUM_RAW_LABEL_BINS, dtype=np.float16):
+    """
+    Vote frequencies of N relations with one bincount over all votes.
+
+    Gives the same values as running np.unique(votes, return_counts=True) on
+    every relation. As with indexing a frequency array by vote, -num_bins <=
+    vote < 0 counts for bin num_bins + vote.
+
+    :param raw_votes: sequence of N comma separated vote strings.
+    :return: (N, num_bins) array, each row sums to 1.
+    """
+    votes, relation_ids = parse_raw_votes(raw_votes)
+    if ((votes < -num_bins) | (votes >= num_bins)).any():
+        raise ValueError(f'votes must be in [{-num_bins}, {num_bins}), got {np.unique(votes)}')
+    votes = np.where(votes < 0, votes + num_bins, votes)
+    histograms = np.bincount(relation_ids * num_bins + votes, minlength=len(raw_votes) * num_bins)
+    histograms = histograms.reshape(len(raw_votes), num_bins)
+    return (histograms / histograms.sum(axis=1, keepdims=True)).astype(dtype)
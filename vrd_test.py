@@ -24,6 +24,8 @@ import torch
 from torch.utils.data import DataLoader, DistributedSampler
 import util.misc as utils
 from datasets import build_dataset
+from datasets.samplers import AspectRatioBatchSampler
+from datasets.loader_profile import load_data_loader_profile, data_loader_options
 from engine import *
 from models import build_model
 from magic_numbers import *
@@ -142,17 +144,27 @@ def main(args):
 
     # Construct validation data loader
     batch_sampler_valid = torch.utils.data.BatchSampler(sampler_valid, args.batch_size, drop_last=False)
+    if BUCKETED_BATCH_SAMPLER:
+        batch_sampler_valid = AspectRatioBatchSampler(dataset_valid.image_sizes(), args.batch_size, drop_last=False,
+                                                      seed=args.seed, num_bins=ASPECT_RATIO_BINS)
+    # Workers, prefetch factor and pinning tuned by tools/tune_data_loader.py
+    # (DATA_LOADER_PROFILE), or --num_workers
+    loader_profile = load_data_loader_profile(DATA_LOADER_PROFILE)
+    torch.multiprocessing.set_sharing_strategy(loader_profile.get('sharing_strategy', sharing_strategy))
     data_loader_valid = DataLoader(dataset_valid,
                                    batch_sampler=batch_sampler_valid,
-                                   collate_fn=utils.collate_fn,
-                                   num_workers=args.num_workers)
+                                   collate_fn=utils.build_collate_fn(dataset_valid),
+                                   **data_loader_options(loader_profile, 'valid', args.num_workers))
 
     batch_sampler_test = torch.utils.data.BatchSampler(sampler_test, args.batch_size, drop_last=False)
+    if BUCKETED_BATCH_SAMPLER:
+        batch_sampler_test = AspectRatioBatchSampler(dataset_test.image_sizes(), args.batch_size, drop_last=False,
+                                                     seed=args.seed, num_bins=ASPECT_RATIO_BINS)
     data_loader_test = DataLoader(dataset_test,
                                    batch_sampler=batch_sampler_test,
-                                   collate_fn=utils.collate_fn,
-                                   num_workers=args.num_workers,
-                                  shuffle=False)
+                                   collate_fn=utils.build_collate_fn(dataset_test),
+                                  shuffle=False,
+                                  **data_loader_options(loader_profile, 'test', args.num_workers))
 
     # Load model from checkpoint
     checkpoint = torch.load(args.resume, map_location='cpu')